@@ -8,8 +8,12 @@ from routes.rating_routes import rating_bp
 from routes.auth import auth_bp 
 from routes.reviews_routes import review_bp
 from routes.actor_routes import actor_bp
-from extensions import db, migrate
+from routes.health_routes import health_bp
+from routes.retrieval_model_routes import retrieval_bp
+from extensions import db, migrate, ranking_cache, ranking_models, ranking_batcher, retrieval_service, segment_rankings, ranking_breaker, popularity_ranking
 from config.config import Config
+from services.catalog import reset_catalog_cache
+from services.timing import init_timing
 
 # This function creates the Flask application 
 def create_app(config_class=Config):
@@ -32,6 +36,15 @@ def create_app(config_class=Config):
 
     db.init_app(app)
     migrate.init_app(app, db)
+    ranking_cache.init_app(app)
+    reset_catalog_cache() # A new app may be pointing at a different database, so the catalog is reloaded
+    ranking_models.init_app(app)
+    ranking_batcher.init_app(app)
+    retrieval_service.init_app(app)
+    segment_rankings.init_app(app)
+    ranking_breaker.init_app(app)
+    popularity_ranking.init_app(app)
+    init_timing(app)
 
 
     # This registers the blueprints 
@@ -42,6 +55,8 @@ def create_app(config_class=Config):
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(review_bp, url_prefix='/reviews')
     app.register_blueprint(actor_bp, url_prefix='/actors')
+    app.register_blueprint(health_bp, url_prefix='/health')
+    app.register_blueprint(retrieval_bp, url_prefix='/recommendations')
 
     @app.route('/', methods=['GET'])
     def hello_world():
@@ -0,0 +1,92 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+from unittest.mock import patch
+
+# This makes sure the parent dictory is in the import path, the same as the seeders
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Times loading a catalog through POST /movies/bulk against the same movies sent one at a time to
+# POST /movies/create, both through the Flask test client on a fresh SQLite database. The one at a
+# time run only sends --single movies and the time for the full catalog is worked out from it.
+#   python benchmarks/bulk_import.py --movies 10000 --single 500 --batch-sizes 500 1000 5000
+
+GENRES = ["Action", "Comedy", "Drama", "Crime", "Thriller", "Romance", "Horror", "Sci-Fi", "Western", "Animation"]
+
+def movie(i, actors):
+    return {
+        "id": f"tt{i:07d}",
+        "movie_title": f"Movie {i}",
+        "movie_genres": ", ".join(GENRES[(i + j) % len(GENRES)] for j in range(1 + i % 3)),
+        "description": f"Description of movie {i}",
+        "actor_ids": [1 + (i + j) % actors for j in range(1 + i % 4)],
+        "image": "bloodborne1.jpg"
+    }
+
+def make_app(tmp, batch_size):
+    from app import create_app
+    from config.config import Config
+    from extensions import db
+    from models.user import User
+    from models.actor import Actor
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'import.db')}"
+        RANKING_MODEL_PRELOAD = False
+        RETRIEVAL_PRELOAD = False
+        SEGMENT_REFRESH_SECONDS = 0
+        MOVIES_BULK_BATCH_SIZE = batch_size
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username="admin", email="admin@example.com", password="x", user_gender=1,
+                            user_occupation_label=1, raw_user_age=30, user_rating=4.0, role="admin"))
+        db.session.add_all([Actor(id=i, name=f"Actor {i}") for i in range(1, 501)])
+        db.session.commit()
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="POST /movies/bulk against one POST /movies/create per movie")
+    parser.add_argument("--movies", type=int, default=10000)
+    parser.add_argument("--single", type=int, default=500)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1000])
+    args = parser.parse_args()
+
+    import logging
+    from flask_jwt_extended import create_access_token
+    logging.disable(logging.CRITICAL)
+    movies = [movie(i, 500) for i in range(args.movies)]
+
+    with patch("os.path.isfile", return_value=True):
+        for batch_size in args.batch_sizes:
+            with tempfile.TemporaryDirectory() as tmp:
+                app = make_app(tmp, batch_size)
+                with app.app_context():
+                    headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+                client = app.test_client()
+                started = time.perf_counter()
+                response = client.post("/movies/bulk", json=movies, headers=headers)
+                elapsed = time.perf_counter() - started
+                print(f"bulk    batch {batch_size:>5}  {args.movies} movies  {elapsed:8.2f} s  "
+                      f"{response.get_json()['created']} created")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(tmp, 1000)
+            with app.app_context():
+                headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+            client = app.test_client()
+            started = time.perf_counter()
+            for item in movies[:args.single]:
+                data = dict(item, actor_id=item["actor_ids"][0])
+                client.post("/movies/create", json=data, headers=headers)
+            elapsed = time.perf_counter() - started
+            print(f"create  one by one   {args.single} movies  {elapsed:8.2f} s  "
+                  f"about {elapsed / args.single * args.movies:8.2f} s for {args.movies} (first actor only)")
+
+if __name__ == "__main__":
+    main()
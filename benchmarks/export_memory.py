@@ -0,0 +1,93 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+# This makes sure the parent dictory is in the import path, the same as the seeders
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Compares the peak Python memory of GET /ratings/export, which streams, with building the same
+# ratings into one list for jsonify. Each size gets a fresh SQLite database filled with fake ratings.
+#   python benchmarks/export_memory.py --sizes 50000 200000 800000
+
+def fill_database(app, size):
+    from sqlalchemy import insert
+    from extensions import db
+    from models.user import User
+    from models.movie import Movie
+    from models.rating import Rating
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username="admin", email="admin@example.com", password="x", user_gender=1,
+                            user_occupation_label=1, raw_user_age=30, user_rating=4.0, role="admin"))
+        db.session.execute(insert(Movie), [
+            {"id": f"tt{i:07d}", "movie_title": f"Movie {i}", "movie_genres": "Drama"} for i in range(1000)
+        ])
+        db.session.execute(insert(Rating), [
+            {"user_id": 1, "movie_id": f"tt{i % 1000:07d}", "rating": 1 + i % 5} for i in range(size)
+        ])
+        db.session.commit()
+
+def measure(run):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = run()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, peak / 2**20, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of the streamed ratings export against jsonify")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50000, 200000])
+    args = parser.parse_args()
+
+    from flask import jsonify
+    from flask_jwt_extended import create_access_token
+    from app import create_app
+    from config.config import Config
+    from extensions import db
+    from models.rating import Rating
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            class BenchmarkConfig(Config):
+                SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'export.db')}"
+                RANKING_MODEL_PRELOAD = False
+                RETRIEVAL_PRELOAD = False
+                SEGMENT_REFRESH_SECONDS = 0
+
+            app = create_app(BenchmarkConfig)
+            fill_database(app, size)
+            client = app.test_client()
+            with app.app_context():
+                headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+
+            # The streamed body is read a chunk at a time, the way a client or proxy would
+            def streamed():
+                response = client.get("/ratings/export", headers=headers, buffered=False)
+                sent = sum(len(chunk) for chunk in response.response)
+                response.close()
+                return sent
+
+            def buffered():
+                with app.test_request_context():
+                    rows = Rating.query.order_by(Rating.id).all()
+                    body = jsonify([{
+                        "id": row.id, "user_id": row.user_id, "movie_id": row.movie_id,
+                        "rating": float(row.rating), "created_at": row.created_at.isoformat()
+                    } for row in rows]).get_data()
+                    db.session.remove()
+                    return len(body)
+
+            for name, run in (("streamed", streamed), ("jsonify", buffered)):
+                sent, peak_mb, seconds = measure(run)
+                print(f"{size:>9} ratings  {name:<8}  peak {peak_mb:8.1f} MB  {sent / 2**20:7.1f} MB sent  {seconds:6.2f}s")
+
+if __name__ == "__main__":
+    main()
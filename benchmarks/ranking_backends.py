@@ -0,0 +1,94 @@
+import sys
+import os
+import argparse
+import json
+import resource
+import subprocess
+import time
+import numpy as np
+
+# This makes sure the parent dictory is in the import path, the same as the seeders
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Compares the tf and numpy ranking backends. Each backend runs in its own process so the
+# memory reported is what one web worker would use with that backend and nothing else loaded.
+#   python benchmarks/ranking_backends.py --runs 50
+
+# Current resident memory of this process in MB, read from /proc where it is available
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(times, q):
+    return round(float(np.percentile(times, q)) * 1000, 2)
+
+# Runs in the child process, loads one backend through ModelManager the same way the app does
+def run_backend(backend, runs, batch_users):
+    from extensions import ranking_registry
+    from services.ranking_model import ModelManager
+    from services.numpy_ranking import RANKING_NUMPY_DIR
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    manager = ModelManager(ranking_registry, backend=backend)
+    version, model = manager.get_active()
+    if model is None:
+        raise RuntimeError(manager.error)
+    load_seconds = time.perf_counter() - started
+
+    # The catalog is the movie vocabulary of the exported model, the same titles the app sends
+    titles = np.load(os.path.join(RANKING_NUMPY_DIR, version, "movie_vocab.npy")).astype(object)
+
+    single, batch = [], []
+    for run in range(runs):
+        user_id = str(run % 943 + 1)
+        inputs = {"user_id": np.full(len(titles), user_id, dtype=object), "movie_title": titles}
+        started = time.perf_counter()
+        model(inputs).numpy()
+        single.append(time.perf_counter() - started)
+
+    users = np.array([str(i % 943 + 1) for i in range(batch_users)], dtype=object)
+    inputs = {"user_id": np.repeat(users, len(titles)), "movie_title": np.tile(titles, batch_users)}
+    for _ in range(max(1, runs // 10)):
+        started = time.perf_counter()
+        model(inputs).numpy()
+        batch.append(time.perf_counter() - started)
+
+    return {
+        "backend": backend,
+        "version": version,
+        "load_seconds": round(load_seconds, 2),
+        "single_user_p50_ms": percentile(single, 50),
+        "single_user_p95_ms": percentile(single, 95),
+        f"batch_{batch_users}_users_p50_ms": percentile(batch, 50),
+        "rss_before_mb": round(rss_before, 1),
+        "rss_after_mb": round(rss_mb(), 1)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare latency and memory of the ranking backends")
+    parser.add_argument("--backends", nargs="+", default=["tf", "numpy"])
+    parser.add_argument("--runs", type=int, default=50, help="single user calls per backend")
+    parser.add_argument("--batch-users", type=int, default=100, help="users per batch call")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_backend(args.child, args.runs, args.batch_users)))
+        sys.exit(0)
+
+    for backend in args.backends:
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", backend, "--runs", str(args.runs), "--batch-users", str(args.batch_users)],
+            capture_output=True, text=True, cwd=project_root
+        )
+        if output.returncode != 0:
+            print(f"{backend} failed: {output.stderr.strip().splitlines()[-1:]}")
+            continue
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
@@ -0,0 +1,99 @@
+import sys
+import os
+import argparse
+import random
+import tempfile
+import time
+
+# This makes sure the parent dictory is in the import path, the same as the seeders
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Compares a GET /movies/search query on the FTS5 index with the LIKE scan it replaces, a
+# '%word%' match on the titles, descriptions and review content. Each size gets a fresh SQLite
+# database of fake movies with one review each.
+#   python benchmarks/search_vs_like.py --sizes 10000 100000 --words detective zeppelin
+
+WORDS = ("dark night city war love ship space detective crew heist island storm ghost river king "
+         "queen robot dragon secret summer winter train hunter witch empire shadow fire ocean desert").split()
+
+LIKE_SQL = """
+SELECT movie.id FROM movie
+WHERE lower(movie.movie_title) LIKE :pattern OR lower(movie.description) LIKE :pattern
+   OR movie.id IN (SELECT movie_id FROM reviews WHERE lower(content) LIKE :pattern)
+ORDER BY movie.id LIMIT :limit
+"""
+
+# Most of the text is filler words, so each of WORDS is in a few percent of the movies
+FILLER = [f"filler{i}" for i in range(5000)]
+
+def sentence(rng, length):
+    return " ".join(rng.choice(WORDS) if rng.random() < 0.03 else rng.choice(FILLER) for _ in range(length))
+
+def fill_database(app, size):
+    from sqlalchemy import insert
+    from extensions import db
+    from models.user import User
+    from models.movie import Movie
+    from models.reviews import Review
+
+    rng = random.Random(size)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username="admin", email="admin@example.com", password="x", user_gender=1,
+                            user_occupation_label=1, raw_user_age=30, user_rating=4.0, role="admin"))
+        db.session.execute(insert(Movie), [
+            {"id": f"tt{i:07d}", "movie_title": sentence(rng, 3).title(), "movie_genres": "Drama",
+             "description": sentence(rng, 30)} for i in range(size)
+        ])
+        db.session.execute(insert(Review), [
+            {"user_id": 1, "movie_id": f"tt{i:07d}", "content": sentence(rng, 40)} for i in range(size)
+        ])
+        db.session.commit()
+
+def timed(run, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = run()
+        times.append(time.perf_counter() - started)
+    times.sort()
+    return len(rows), times[len(times) // 2] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="GET /movies/search on FTS5 against a LIKE scan")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--words", nargs="+", default=["detective", "zeppelin"])
+    args = parser.parse_args()
+
+    from sqlalchemy import text
+    from app import create_app
+    from config.config import Config
+    from extensions import db
+    from services.search import match_query, search_movies
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            class BenchmarkConfig(Config):
+                SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'search.db')}"
+                RANKING_MODEL_PRELOAD = False
+                RETRIEVAL_PRELOAD = False
+                SEGMENT_REFRESH_SECONDS = 0
+
+            app = create_app(BenchmarkConfig)
+            fill_database(app, size)
+            with app.app_context():
+                for word in args.words:
+                    query = match_query(word)
+                    runs = (
+                        ("fts5", lambda: search_movies(db.session, query, 20)),
+                        ("like", lambda: db.session.execute(text(LIKE_SQL), {"pattern": f"%{word}%", "limit": 20}).all())
+                    )
+                    for name, run in runs:
+                        found, median_ms = timed(run, args.repeat)
+                        print(f"{size:>9} movies  {word:<10}  {name:<5}  median {median_ms:8.2f} ms  {found} rows")
+
+if __name__ == "__main__":
+    main()
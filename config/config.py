@@ -1,7 +1,110 @@
 import os
+import tempfile
 
 # Configuration to store the app settings 
 class Config:
     # URI to connect to the SQLite database
     SQLALCHEMY_DATABASE_URI = 'sqlite:///databasemovie.db'  
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # The ranking model is loaded and warmed up on a background thread when the app starts
+    # Requests that arrive while it is loading wait up to RANKING_MODEL_WAIT_SECONDS before getting a 503
+    RANKING_MODEL_PRELOAD = True
+    RANKING_MODEL_WAIT_SECONDS = 30
+    RANKING_WARMUP_ROWS = 2048
+
+    # The ranking model version to load at start up, None picks the default one in ml_models/
+    # Other versions can be switched to without a restart with POST /ranking/models/reload
+    RANKING_MODEL_VERSION = None
+
+    # tf serves the SavedModel, numpy serves the weights exported by seeders/export_ranking_weights.py
+    # without importing TensorFlow, which keeps each worker much smaller
+    RANKING_BACKEND = 'tf'
+    RANKING_NUMPY_DIR = 'ml_models/ranking_numpy'
+
+    # RANKING_BACKEND = 'remote' sends the model calls to services/inference_server.py over a Unix socket
+    # Each worker keeps up to INFERENCE_SERVER_CONNECTIONS open connections and waits INFERENCE_SERVER_TIMEOUT
+    # seconds for a free one and for the reply
+    # INFERENCE_SERVER_AUTHKEY must be set to the same secret as the server's, the remote backend will not start without it
+    INFERENCE_SERVER_ADDRESS = os.environ.get('INFERENCE_SERVER_ADDRESS', os.path.join(
+        tempfile.gettempdir(), f'movie-ranking-{os.getuid()}', 'ranking.sock'))
+    INFERENCE_SERVER_AUTHKEY = os.environ.get('INFERENCE_SERVER_AUTHKEY')
+    INFERENCE_SERVER_CONNECTIONS = 4
+    INFERENCE_SERVER_TIMEOUT = 5.0
+
+    # Maximum number of users whose top ranked movies are kept in memory
+    RANKING_CACHE_SIZE = 1024
+
+    # Largest k a client can ask /ranking for
+    RANKING_MAX_K = 100
+
+    # Limits for POST /ranking/batch, the rows are users x movies in one model call
+    RANKING_BATCH_MAX_USERS = 200
+    RANKING_SUBSET_MAX_IDS = 500
+    RANKING_BATCH_MAX_ROWS = 250000
+
+    # Concurrent /ranking requests wait up to RANKING_BATCH_WINDOW_MS for each other and share one model call
+    # A call is made sooner once RANKING_BATCH_MAX_REQUESTS requests or RANKING_BATCH_MAX_ROWS rows are waiting
+    RANKING_BATCHING = True
+    RANKING_BATCH_WINDOW_MS = 3
+    RANKING_BATCH_MAX_REQUESTS = 32
+
+    # Default for /ranking, model runs the ranking model and precomputed reads the user_recommendations table
+    RANKING_MODE = 'model'
+
+    # A model call that takes longer than RANKING_INFERENCE_TIMEOUT seconds is given up on
+    # After RANKING_BREAKER_FAILURES failed or slow calls in a row the model is not called for RANKING_BREAKER_RESET_SECONDS
+    # and /ranking is answered from the most popular movies, see services/circuit_breaker.py
+    RANKING_INFERENCE_TIMEOUT = 2.0
+    RANKING_BREAKER_FAILURES = 5
+    RANKING_BREAKER_SLOW_SECONDS = 1.0
+    RANKING_BREAKER_RESET_SECONDS = 30
+    POPULARITY_PRIOR_WEIGHT = 5
+    POPULARITY_RELOAD_SECONDS = 600
+
+    # Users with no ratings are served their demographic segment's top list instead of running the model
+    # The lists are recomputed by seeders/refresh_segments.py, run it from cron after the ratings change
+    # SEGMENT_REFRESH_SECONDS above 0 refreshes them inside the app instead, from the one worker holding
+    # the SEGMENT_REFRESH_LOCK file lock (app.instance_path/segment-refresh.lock when None)
+    RANKING_COLD_START = True
+    SEGMENT_TOP_K = 100
+    SEGMENT_PRIOR_WEIGHT = 5
+    SEGMENT_CACHE_SECONDS = 300
+    SEGMENT_REFRESH_SECONDS = 0
+    SEGMENT_REFRESH_LOCK = None
+
+    # Share of /ranking requests that record a TensorFlow profiler trace into RANKING_PROFILE_DIR, 0 turns it off
+    # Only used with the tf backend, open the traces with TensorBoard
+    RANKING_PROFILE_SAMPLE_RATE = 0.0
+    RANKING_PROFILE_DIR = 'profiles'
+
+    # GET /recommendations, the retrieval embeddings are loaded from RETRIEVAL_NUMPY_DIR when the app starts
+    # and extracted from the retrieval model checkpoint first if they have not been exported yet
+    # exact scores every movie, ivf only scores the movies in the RETRIEVAL_NPROBE closest partitions
+    RETRIEVAL_PRELOAD = True
+    RETRIEVAL_INDEX_MODE = 'exact'
+    RETRIEVAL_NPROBE = 10
+    RETRIEVAL_MAX_N = 100
+
+    # GET /recommendations/pipeline, how many retrieval candidates are passed on to the ranking model
+    PIPELINE_CANDIDATES = 300
+    PIPELINE_MAX_CANDIDATES = 1000
+
+    # Page sizes for GET /movies?limit=, a request with only a cursor gets MOVIES_PAGE_SIZE movies
+    MOVIES_PAGE_SIZE = 50
+    MOVIES_MAX_PAGE_SIZE = 200
+
+    # How long each worker trusts its copy of the catalog and ratings versions before reading them again
+    # A change made through another worker shows in ETags and cached rankings within this many seconds
+    CATALOG_VERSION_TTL = 1.0
+
+    # Results per page of GET /movies/search, the largest page is MOVIES_MAX_PAGE_SIZE
+    SEARCH_PAGE_SIZE = 20
+
+    # POST /movies/bulk writes MOVIES_BULK_BATCH_SIZE movies per INSERT and transaction, and takes at
+    # most MOVIES_BULK_MAX_ROWS movies per request
+    MOVIES_BULK_BATCH_SIZE = 1000
+    MOVIES_BULK_MAX_ROWS = 50000
+
+    # Most movie ids GET or POST /movies/batch looks up in one request
+    MOVIES_BATCH_MAX_IDS = 200
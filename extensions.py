@@ -1,8 +1,40 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from services.ranking_cache import RankingCache
+from services.model_registry import ModelRegistry
+from services.ranking_model import ModelManager
+from services.inference_batcher import InferenceBatcher
+from services.retrieval_index import RetrievalService
+from services.segments import SegmentRankings
+from services.circuit_breaker import CircuitBreaker
+from services.popularity import PopularityRanking
 
 # Initializes the SQLAlchemy for database operations
 db = SQLAlchemy()
 
 # Initializing the Migrate for handling the migrations
 migrate = Migrate()
+
+# Initializing the per user cache for the ranking results
+ranking_cache = RankingCache()
+
+# Initializing the registry of ranking model versions kept in ml_models/
+ranking_registry = ModelRegistry('ml_models', 'ranking_model')
+
+# Initializing the loader for the TensorFlow ranking model
+ranking_models = ModelManager(ranking_registry)
+
+# Initializing the queue that joins concurrent ranking model calls into one
+ranking_batcher = InferenceBatcher()
+
+# Initializing the in-memory index over the retrieval model embeddings
+retrieval_service = RetrievalService()
+
+# Initializing the demographic segment top lists for users with no ratings
+segment_rankings = SegmentRankings()
+
+# Initializing the circuit breaker around the ranking model calls
+ranking_breaker = CircuitBreaker('ranking_breaker')
+
+# Initializing the popularity ranking /ranking falls back to while the model is failing
+popularity_ranking = PopularityRanking()
@@ -0,0 +1,34 @@
+"""Add user_recommendations table
+
+Revision ID: 3f9c2a71d8e4
+Revises: 554ccc0840fe
+Create Date: 2026-10-18 15:40:12.418203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a71d8e4'
+down_revision = '554ccc0840fe'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_recommendations',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('movie_id', sa.String(length=10), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('model_version', sa.String(length=32), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['movie_id'], ['movie.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'rank')
+    )
+
+
+def downgrade():
+    op.drop_table('user_recommendations')
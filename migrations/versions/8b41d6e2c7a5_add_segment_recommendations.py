@@ -0,0 +1,33 @@
+"""Add segment_recommendations table
+
+Revision ID: 8b41d6e2c7a5
+Revises: 3f9c2a71d8e4
+Create Date: 2026-10-18 16:05:37.912044
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b41d6e2c7a5'
+down_revision = '3f9c2a71d8e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('segment_recommendations',
+    sa.Column('segment', sa.String(length=40), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('movie_id', sa.String(length=10), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('rating_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['movie_id'], ['movie.id'], ),
+    sa.PrimaryKeyConstraint('segment', 'rank')
+    )
+
+
+def downgrade():
+    op.drop_table('segment_recommendations')
@@ -0,0 +1,81 @@
+"""Add the genre and movie_genres tables and movie.genre_mask
+
+Revision ID: a7c4e2f90d15
+Revises: f3a9c6d2e810
+Create Date: 2026-10-18 20:31:48.216640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c4e2f90d15'
+down_revision = 'f3a9c6d2e810'
+branch_labels = None
+depends_on = None
+
+# The MovieLens genres the seeder uses, added first so their ids (and mask bits) are the MovieLens ids
+MOVIELENS_GENRES = [
+    "Unknown", "Action", "Adventure", "Animation", "Children", "Comedy", "Crime", "Documentary", "Drama",
+    "Fantasy", "Film-Noir", "Horror", "Musical", "Mystery", "Romance", "Sci-Fi", "Thriller", "War", "Western"
+]
+
+
+def upgrade():
+    genre = op.create_table('genre',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    movie_genres = op.create_table('movie_genres',
+    sa.Column('movie_id', sa.String(length=10), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ),
+    sa.ForeignKeyConstraint(['movie_id'], ['movie.id'], ),
+    sa.PrimaryKeyConstraint('movie_id', 'genre_id')
+    )
+    op.create_index('ix_movie_genres_genre_id', 'movie_genres', ['genre_id'], unique=False)
+    # ADD COLUMN rather than a batch copy of movie, which would drop the search triggers on it
+    op.add_column('movie', sa.Column('genre_mask', sa.BigInteger(), server_default='0', nullable=False))
+
+    # Backfill the genres, movie_genres and genre_mask from the movie_genres strings
+    connection = op.get_bind()
+    movies = connection.execute(sa.text("SELECT id, movie_genres FROM movie")).all()
+    genre_ids = {name.lower(): genre_id for genre_id, name in enumerate(MOVIELENS_GENRES)}
+    names = dict((name.lower(), name) for name in MOVIELENS_GENRES)
+    links = []
+    masks = []
+    for movie_id, value in movies:
+        mask = 0
+        seen = set()
+        for name in (value or '').split(','):
+            name = name.strip()
+            if not name or name.lower() in seen:
+                continue
+            seen.add(name.lower())
+            if name.lower() not in genre_ids:
+                if len(genre_ids) >= 63:
+                    raise ValueError(f"Too many genres to backfill, cannot add {name}")
+                genre_ids[name.lower()] = len(genre_ids)
+                names[name.lower()] = name
+            genre_id = genre_ids[name.lower()]
+            links.append({'movie_id': movie_id, 'genre_id': genre_id})
+            mask |= 1 << genre_id
+        masks.append({'movie_id': movie_id, 'mask': mask})
+
+    op.bulk_insert(genre, [{'id': genre_id, 'name': names[key]} for key, genre_id in genre_ids.items()])
+    if links:
+        op.bulk_insert(movie_genres, links)
+    if masks:
+        connection.execute(sa.text("UPDATE movie SET genre_mask = :mask WHERE id = :movie_id"), masks)
+
+
+def downgrade():
+    # DROP COLUMN (SQLite 3.35+) rather than a batch copy of movie, which would drop the search triggers on it
+    op.drop_column('movie', 'genre_mask')
+
+    op.drop_index('ix_movie_genres_genre_id', table_name='movie_genres')
+    op.drop_table('movie_genres')
+    op.drop_table('genre')
@@ -0,0 +1,62 @@
+"""Move watchlist movie_ids into the watchlist_movies table
+
+Revision ID: b91e5d7c3a48
+Revises: a7c4e2f90d15
+Create Date: 2026-10-18 21:12:05.417962
+
+"""
+import json
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b91e5d7c3a48'
+down_revision = 'a7c4e2f90d15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    watchlist_movies = op.create_table('watchlist_movies',
+    sa.Column('watchlist_id', sa.Integer(), nullable=False),
+    sa.Column('movie_id', sa.String(length=10), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['movie_id'], ['movie.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['watchlist_id'], ['watchlist.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('watchlist_id', 'movie_id')
+    )
+    op.create_index(op.f('ix_watchlist_movies_movie_id'), 'watchlist_movies', ['movie_id'], unique=False)
+
+    # Copy the JSON lists into rows, in their order, leaving out repeats and movies that no longer exist
+    connection = op.get_bind()
+    movie_ids = {movie_id for (movie_id,) in connection.execute(sa.text("SELECT id FROM movie"))}
+    rows = []
+    for watchlist_id, value in connection.execute(sa.text("SELECT id, movie_ids FROM watchlist")).all():
+        listed = json.loads(value) if isinstance(value, str) else (value or [])
+        kept = [movie_id for movie_id in dict.fromkeys(listed) if movie_id in movie_ids]
+        rows += [{'watchlist_id': watchlist_id, 'movie_id': movie_id, 'position': position}
+                 for position, movie_id in enumerate(kept)]
+    if rows:
+        op.bulk_insert(watchlist_movies, rows)
+
+    with op.batch_alter_table('watchlist', schema=None) as batch_op:
+        batch_op.drop_column('movie_ids')
+
+
+def downgrade():
+    with op.batch_alter_table('watchlist', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('movie_ids', sa.JSON(), server_default='[]', nullable=False))
+
+    connection = op.get_bind()
+    lists = {}
+    for watchlist_id, movie_id in connection.execute(sa.text(
+        "SELECT watchlist_id, movie_id FROM watchlist_movies ORDER BY watchlist_id, position"
+    )):
+        lists.setdefault(watchlist_id, []).append(movie_id)
+    for watchlist_id, movie_ids in lists.items():
+        connection.execute(sa.text("UPDATE watchlist SET movie_ids = :movie_ids WHERE id = :id"),
+                           {'movie_ids': json.dumps(movie_ids), 'id': watchlist_id})
+
+    op.drop_index(op.f('ix_watchlist_movies_movie_id'), table_name='watchlist_movies')
+    op.drop_table('watchlist_movies')
@@ -0,0 +1,24 @@
+"""Add the (created_at, id) index on movie for keyset pagination
+
+Revision ID: c2e7a4f19b3d
+Revises: 8b41d6e2c7a5
+Create Date: 2026-10-18 17:42:10.551832
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e7a4f19b3d'
+down_revision = '8b41d6e2c7a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_movie_created_at_id', 'movie', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_movie_created_at_id', table_name='movie')
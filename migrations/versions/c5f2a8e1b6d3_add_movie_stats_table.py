@@ -0,0 +1,55 @@
+"""Add the movie_stats table of per movie rating, review and actor totals
+
+Revision ID: c5f2a8e1b6d3
+Revises: b91e5d7c3a48
+Create Date: 2026-10-18 21:58:41.630295
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f2a8e1b6d3'
+down_revision = 'b91e5d7c3a48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('movie_stats',
+    sa.Column('movie_id', sa.String(length=10), nullable=False),
+    sa.Column('ratings_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('ratings_sum', sa.Float(), server_default='0', nullable=False),
+    sa.Column('rating_1', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_2', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_3', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_4', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_5', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('reviews_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('actors_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['movie_id'], ['movie.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('movie_id')
+    )
+
+    # Fill the totals of the existing movies, ratings are counted under the star they round to
+    op.execute("""
+        INSERT INTO movie_stats (movie_id, ratings_count, ratings_sum, rating_1, rating_2, rating_3, rating_4, rating_5,
+                                 reviews_count, actors_count)
+        SELECT movie.id, COALESCE(r.count, 0), COALESCE(r.total, 0), COALESCE(r.star_1, 0), COALESCE(r.star_2, 0),
+               COALESCE(r.star_3, 0), COALESCE(r.star_4, 0), COALESCE(r.star_5, 0), COALESCE(v.count, 0), COALESCE(a.count, 0)
+        FROM movie
+        LEFT JOIN (
+            SELECT movie_id, COUNT(*) AS count, SUM(rating) AS total,
+                   SUM(CAST(rating + 0.5 AS INTEGER) = 1) AS star_1, SUM(CAST(rating + 0.5 AS INTEGER) = 2) AS star_2,
+                   SUM(CAST(rating + 0.5 AS INTEGER) = 3) AS star_3, SUM(CAST(rating + 0.5 AS INTEGER) = 4) AS star_4,
+                   SUM(CAST(rating + 0.5 AS INTEGER) = 5) AS star_5
+            FROM ratings GROUP BY movie_id
+        ) r ON r.movie_id = movie.id
+        LEFT JOIN (SELECT movie_id, COUNT(*) AS count FROM reviews GROUP BY movie_id) v ON v.movie_id = movie.id
+        LEFT JOIN (SELECT movie_id, COUNT(*) AS count FROM movie_actors GROUP BY movie_id) a ON a.movie_id = movie.id
+    """)
+
+
+def downgrade():
+    op.drop_table('movie_stats')
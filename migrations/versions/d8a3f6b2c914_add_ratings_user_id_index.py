@@ -0,0 +1,24 @@
+"""Add an index on ratings.user_id
+
+Revision ID: d8a3f6b2c914
+Revises: c5f2a8e1b6d3
+Create Date: 2026-10-18 23:05:41.208316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a3f6b2c914'
+down_revision = 'c5f2a8e1b6d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_ratings_user_id'), 'ratings', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_ratings_user_id'), table_name='ratings')
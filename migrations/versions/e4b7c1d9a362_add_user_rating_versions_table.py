@@ -0,0 +1,31 @@
+"""Add the user_rating_versions table
+
+Revision ID: e4b7c1d9a362
+Revises: d8a3f6b2c914
+Create Date: 2026-10-19 10:42:17.530964
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7c1d9a362'
+down_revision = 'd8a3f6b2c914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_rating_versions',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('ratings_version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index(op.f('ix_user_rating_versions_ratings_version'), 'user_rating_versions', ['ratings_version'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_user_rating_versions_ratings_version'), table_name='user_rating_versions')
+    op.drop_table('user_rating_versions')
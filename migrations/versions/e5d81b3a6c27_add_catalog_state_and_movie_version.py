@@ -0,0 +1,35 @@
+"""Add the catalog_state table and movie.version_id for ETags
+
+Revision ID: e5d81b3a6c27
+Revises: c2e7a4f19b3d
+Create Date: 2026-10-18 18:55:37.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5d81b3a6c27'
+down_revision = 'c2e7a4f19b3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    catalog_state = op.create_table('catalog_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('catalog_version', sa.Integer(), nullable=False),
+    sa.Column('ratings_version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(catalog_state, [{'id': 1, 'catalog_version': 0, 'ratings_version': 0}])
+    with op.batch_alter_table('movie', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version_id', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('movie', schema=None) as batch_op:
+        batch_op.drop_column('version_id')
+
+    op.drop_table('catalog_state')
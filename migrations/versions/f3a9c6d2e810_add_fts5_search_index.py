@@ -0,0 +1,55 @@
+"""Add the FTS5 search indexes over movies and reviews
+
+Revision ID: f3a9c6d2e810
+Revises: e5d81b3a6c27
+Create Date: 2026-10-18 19:40:12.873305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c6d2e810'
+down_revision = 'e5d81b3a6c27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""CREATE VIRTUAL TABLE movie_fts USING fts5(
+        movie_id UNINDEXED, movie_title, description, tokenize = 'porter unicode61 remove_diacritics 2')""")
+    op.execute("""CREATE TRIGGER movie_fts_insert AFTER INSERT ON movie BEGIN
+        INSERT INTO movie_fts (movie_id, movie_title, description) VALUES (new.id, new.movie_title, new.description);
+    END""")
+    op.execute("""CREATE TRIGGER movie_fts_delete AFTER DELETE ON movie BEGIN
+        DELETE FROM movie_fts WHERE movie_id = old.id;
+    END""")
+    op.execute("""CREATE TRIGGER movie_fts_update AFTER UPDATE OF id, movie_title, description ON movie BEGIN
+        DELETE FROM movie_fts WHERE movie_id = old.id;
+        INSERT INTO movie_fts (movie_id, movie_title, description) VALUES (new.id, new.movie_title, new.description);
+    END""")
+    op.execute("""CREATE VIRTUAL TABLE review_fts USING fts5(
+        content, content = 'reviews', content_rowid = 'id', tokenize = 'porter unicode61 remove_diacritics 2')""")
+    op.execute("""CREATE TRIGGER review_fts_insert AFTER INSERT ON reviews BEGIN
+        INSERT INTO review_fts (rowid, content) VALUES (new.id, new.content);
+    END""")
+    op.execute("""CREATE TRIGGER review_fts_delete AFTER DELETE ON reviews BEGIN
+        INSERT INTO review_fts (review_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""")
+    op.execute("""CREATE TRIGGER review_fts_update AFTER UPDATE OF content ON reviews BEGIN
+        INSERT INTO review_fts (review_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO review_fts (rowid, content) VALUES (new.id, new.content);
+    END""")
+
+    # Index the movies and reviews that are already there
+    op.execute("INSERT INTO movie_fts (movie_id, movie_title, description) SELECT id, movie_title, description FROM movie")
+    op.execute("INSERT INTO review_fts (review_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    for trigger in ('review_fts_update', 'review_fts_delete', 'review_fts_insert',
+                    'movie_fts_update', 'movie_fts_delete', 'movie_fts_insert'):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS review_fts")
+    op.execute("DROP TABLE IF EXISTS movie_fts")
@@ -0,0 +1,13 @@
+from extensions import db
+
+# Defining the catalog state class, a single row of counters shared by every worker
+# catalog_version goes up with each admin change to the movies or actors, and ratings_version with each
+# rating or review change. They are read through services/catalog.py to tell if cached data and ETags are stale
+class CatalogState(db.Model):
+    __tablename__ = 'catalog_state'
+    id = db.Column(db.Integer, primary_key=True) # Always 1
+    catalog_version = db.Column(db.Integer, nullable=False, default=0) # Bumped by movie and actor writes
+    ratings_version = db.Column(db.Integer, nullable=False, default=0) # Bumped by rating and review writes
+
+    def __repr__(self):
+        return f"CatalogState(catalog_version={self.catalog_version}, ratings_version={self.ratings_version})"
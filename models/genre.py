@@ -0,0 +1,57 @@
+from sqlalchemy import func
+from extensions import db
+from models.genre_movie import movie_genres # Importing associated table
+
+# Genre ids are bit positions in Movie.genre_mask, which is a signed 64 bit integer
+MAX_GENRES = 63
+
+# Defining the genre class, one row per genre name found in Movie.movie_genres
+class Genre(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False) # Also the genres bit in Movie.genre_mask
+    name = db.Column(db.String(50), nullable=False, unique=True) # Genre name
+
+    # Defining a many-to-many relationship with movies
+    movies = db.relationship('Movie', secondary=movie_genres, back_populates='genres', lazy='dynamic')
+
+    def __repr__(self):
+        return f"Genre(id={self.id}, name='{self.name}')"
+
+# This splits a movie_genres string such as "Action, Comedy" into its genre names, without repeats
+def split_genres(value):
+    names = {}
+    for name in (value or '').split(','):
+        name = name.strip()
+        if name:
+            names.setdefault(name.lower(), name)
+    return list(names.values())
+
+# This gives the genre_mask of a set of genre ids
+def genre_mask(genre_ids):
+    mask = 0
+    for genre_id in genre_ids:
+        mask |= 1 << genre_id
+    return mask
+
+# This returns {lower case name: Genre} for the genre names, adding the genres that are not in the table
+# yet to the session with the next free ids
+def get_or_create_genres(session, names):
+    by_key = {}
+    for name in names:
+        by_key.setdefault(name.lower(), name)
+    names = by_key
+    if not names:
+        return {}
+    with session.no_autoflush:
+        genres = {genre.name.lower(): genre for genre in session.query(Genre).filter(func.lower(Genre.name).in_(list(names)))}
+        missing = [name for key, name in names.items() if key not in genres]
+        if missing:
+            next_id = session.query(func.max(Genre.id)).scalar()
+            next_id = 0 if next_id is None else next_id + 1
+            for name in missing:
+                if next_id >= MAX_GENRES:
+                    raise ValueError(f"Cannot add genre {name}, there can only be {MAX_GENRES} genres")
+                genre = Genre(id=next_id, name=name)
+                session.add(genre)
+                genres[name.lower()] = genre
+                next_id += 1
+    return genres
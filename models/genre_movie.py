@@ -0,0 +1,9 @@
+from extensions import db
+
+# Defining a many-to-many relationship between genres and movies
+# The primary key finds the genres of a movie, the genre_id index finds the movies of a genre
+movie_genres = db.Table('movie_genres',
+    db.Column('movie_id', db.String(10), db.ForeignKey('movie.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_movie_genres_genre_id', 'genre_id')
+)
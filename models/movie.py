@@ -1,6 +1,9 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
 from extensions import db
 from models.actor import Actor
 from models.actor_movie import movie_actors  # Importing the associated table
+from models.genre import Genre, split_genres, genre_mask, get_or_create_genres
 
 # Defining movie class 
 class Movie(db.Model):
@@ -10,9 +13,38 @@ class Movie(db.Model):
     description = db.Column(db.String(500), nullable=True) # Movie description
     image_url = db.Column(db.String(200), nullable=True)  # image for the movie
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    genre_mask = db.Column(db.BigInteger, nullable=False, default=0, server_default='0') # Bit n is set if the movie is in the genre with id n
+    version_id = db.Column(db.Integer, nullable=False, default=1, server_default='1') # Goes up with every change to the movie, used for its ETag
+
+    # The order GET /movies pages through, see the cursor in routes/movie_routes.py
+    __table_args__ = (db.Index('ix_movie_created_at_id', 'created_at', 'id'),)
+
+    # SQLAlchemy adds 1 to version_id on each update, and an update made from an out of date copy of the row fails
+    __mapper_args__ = {'version_id_col': version_id}
 
     # Defining many-to-many relationship with actors
     actors = db.relationship('Actor', secondary=movie_actors, back_populates='movies', lazy='dynamic')
 
+    # Defining many-to-many relationship with genres, kept in step with movie_genres by sync_movie_genres below
+    # The table is named as a string because movie_genres in this class is the genre string column
+    genres = db.relationship('Genre', secondary='movie_genres', back_populates='movies')
+
     def __repr__(self):
-        return f"Movie(id='{self.id}', title='{self.movie_title}', genres='{self.movie_genres}')"
\ No newline at end of file
+        return f"Movie(id='{self.id}', title='{self.movie_title}', genres='{self.movie_genres}')"
+
+# movie_genres stays the genre string the API reads and writes. Whenever a movie is added or its
+# movie_genres changes, this sets its rows in the movie_genres table and its genre_mask to match,
+# adding any genre that is not in the genre table yet, so every way of saving a movie keeps them right
+@event.listens_for(Session, 'before_flush')
+def sync_movie_genres(session, flush_context, instances):
+    movies = [obj for obj in session.new if isinstance(obj, Movie)]
+    movies += [obj for obj in session.dirty
+               if isinstance(obj, Movie) and inspect(obj).attrs.movie_genres.history.has_changes()]
+    if not movies:
+        return
+
+    with session.no_autoflush:
+        genres = get_or_create_genres(session, [name for movie in movies for name in split_genres(movie.movie_genres)])
+        for movie in movies:
+            movie.genres = [genres[name.lower()] for name in split_genres(movie.movie_genres)]
+            movie.genre_mask = genre_mask(genre.id for genre in movie.genres)
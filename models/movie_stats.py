@@ -0,0 +1,30 @@
+from extensions import db
+
+# Defining the movie stats class, the rating, review and actor totals of one movie
+# They are changed by the rating, review, movie and actor write routes in the same transaction as the
+# change itself, see services/movie_stats.py, so reading a movies totals is one row instead of counting
+class MovieStats(db.Model):
+    __tablename__ = 'movie_stats'
+    movie_id = db.Column(db.String(10), db.ForeignKey('movie.id', ondelete='CASCADE'), primary_key=True) # Foreign key for the movie model
+    ratings_count = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Number of ratings
+    ratings_sum = db.Column(db.Float, nullable=False, default=0.0, server_default='0') # Sum of the ratings, for the average
+    rating_1 = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Ratings that round to 1 star
+    rating_2 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_3 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_4 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_5 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    reviews_count = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Number of reviews
+    actors_count = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Number of actors
+
+    # The average rating, or None without ratings
+    @property
+    def average_rating(self):
+        return round(self.ratings_sum / self.ratings_count, 2) if self.ratings_count else None
+
+    # The number of ratings for each star from 1 to 5
+    @property
+    def histogram(self):
+        return {str(star): getattr(self, f'rating_{star}') for star in range(1, 6)}
+
+    def __repr__(self):
+        return f"MovieStats(movie_id='{self.movie_id}', ratings_count={self.ratings_count}, reviews_count={self.reviews_count})"
@@ -4,7 +4,7 @@ from extensions import db
 class Rating(db.Model):
     __tablename__ = 'ratings'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True) # Primary key that autoincrements for ratings
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # Foreign key linking to the user model
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True) # Foreign key linking to the user model, indexed for the per user lookups
     movie_id = db.Column(db.String(10), db.ForeignKey('movie.id'), nullable=False) # Foreign key linking to the movie model
     rating = db.Column(db.Float, nullable=False) # The rating value
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
@@ -0,0 +1,15 @@
+from extensions import db
+
+# Defining the segment recommendation class, the top movies of each demographic segment
+# These rows are written by services/segments.py and used for users that have no ratings yet
+class SegmentRecommendation(db.Model):
+    __tablename__ = 'segment_recommendations'
+    segment = db.Column(db.String(40), primary_key=True) # Segment key such as g1|a25-34|o4, see services/segments.py
+    rank = db.Column(db.Integer, primary_key=True) # Position of the movie in the segments top list, starting at 1
+    movie_id = db.Column(db.String(10), db.ForeignKey('movie.id'), nullable=False) # Foreign key for the movie model
+    score = db.Column(db.Float, nullable=False) # Average rating in the segment, pulled towards the overall average for movies with few ratings
+    rating_count = db.Column(db.Integer, nullable=False) # Number of ratings from the segment
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    def __repr__(self):
+        return f"SegmentRecommendation(segment='{self.segment}', rank={self.rank}, movie_id='{self.movie_id}', score={self.score})"
@@ -0,0 +1,12 @@
+from extensions import db
+
+# Defining the user rating version class, one row per user that has changed their ratings
+# ratings_version is the catalog_state ratings_version of the users last rating write, so a worker can find
+# the users whose ratings changed since the version it last saw and drop their cached rankings
+class UserRatingVersion(db.Model):
+    __tablename__ = 'user_rating_versions'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True) # Foreign key for the user model
+    ratings_version = db.Column(db.Integer, nullable=False, index=True) # Indexed for the changed since lookup
+
+    def __repr__(self):
+        return f"UserRatingVersion(user_id={self.user_id}, ratings_version={self.ratings_version})"
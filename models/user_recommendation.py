@@ -0,0 +1,14 @@
+from extensions import db
+
+# Defining the user recommendation class, these rows are written by seeders/score_recommendations.py
+class UserRecommendation(db.Model):
+    __tablename__ = 'user_recommendations'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True) # Foreign key for the user model, the primary key makes the user lookup indexed
+    rank = db.Column(db.Integer, primary_key=True) # Position of the movie in the users top list, starting at 1
+    movie_id = db.Column(db.String(10), db.ForeignKey('movie.id'), nullable=False) # Foreign key for the movie model
+    score = db.Column(db.Float, nullable=False) # The rating predicted by the ranking model
+    model_version = db.Column(db.String(32), nullable=False) # Version of the model that produced the score
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    def __repr__(self):
+        return f"UserRecommendation(user_id={self.user_id}, rank={self.rank}, movie_id='{self.movie_id}', score={self.score})"
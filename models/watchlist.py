@@ -1,4 +1,5 @@
 from extensions import db
+from models.watchlist_movie import WatchlistMovie
 
 # Defining watchlist class
 class Watchlist(db.Model):
@@ -6,12 +7,32 @@ class Watchlist(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True) # Primary key that autoincrements for the waychlists
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # Foreign key for the user model
     title = db.Column(db.String(100), nullable=False) # Title of the watchlists
-    movie_ids = db.Column(db.JSON, nullable=False, default=lambda: []) # Foreign key for the movie model
     is_public = db.Column(db.Boolean, nullable=False, default=False)  # Users can set their watchlist to public or private
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp()) 
 
     # Defining relationship with User model
     user = db.relationship('User', back_populates='watchlists')
 
+    # The movies of the watchlist in order, rows in watchlist_movies. selectin loads them for every
+    # watchlist of a query at once, and rows taken out of the list are deleted
+    entries = db.relationship('WatchlistMovie', order_by=WatchlistMovie.position, lazy='selectin',
+                              cascade='all, delete-orphan')
+
+    # The movie ids of the watchlist as a list, the same as the JSON column they used to be kept in
+    # Setting it keeps the rows of movies that stay on the watchlist and only renumbers their position
+    @property
+    def movie_ids(self):
+        return [entry.movie_id for entry in self.entries]
+
+    @movie_ids.setter
+    def movie_ids(self, movie_ids):
+        existing = {entry.movie_id: entry for entry in self.entries}
+        entries = []
+        for position, movie_id in enumerate(dict.fromkeys(movie_ids or [])):
+            entry = existing.get(movie_id) or WatchlistMovie(movie_id=movie_id)
+            entry.position = position
+            entries.append(entry)
+        self.entries = entries
+
     def __repr__(self):
         return f"Watchlist(user_id={self.user_id}, title='{self.title}', movie_ids={self.movie_ids}, is_public={self.is_public})"
\ No newline at end of file
@@ -0,0 +1,13 @@
+from extensions import db
+
+# Defining the watchlist movie class, one row per movie on a watchlist
+# The primary key finds the movies of a watchlist and the movie_id index finds the watchlists a movie is on,
+# so deleting a movie or asking which watchlists have it only touches the rows for that movie
+class WatchlistMovie(db.Model):
+    __tablename__ = 'watchlist_movies'
+    watchlist_id = db.Column(db.Integer, db.ForeignKey('watchlist.id', ondelete='CASCADE'), primary_key=True) # Foreign key for the watchlist model
+    movie_id = db.Column(db.String(10), db.ForeignKey('movie.id', ondelete='CASCADE'), primary_key=True, index=True) # Foreign key for the movie model
+    position = db.Column(db.Integer, nullable=False) # Where the movie is in the watchlist, lowest first
+
+    def __repr__(self):
+        return f"WatchlistMovie(watchlist_id={self.watchlist_id}, movie_id='{self.movie_id}', position={self.position})"
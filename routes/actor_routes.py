@@ -4,6 +4,10 @@ from models.actor import Actor
 from models.movie import Movie
 from flask_jwt_extended import jwt_required
 from routes.auth import admin_required
+from models.actor_movie import movie_actors
+from services.streaming import iterate_rows, export_format, streaming_response
+from services.catalog import bump_catalog_version, catalog_version, touch_movie, touch_movies, not_modified, etag_header
+from services.movie_stats import update_movie_stats, actor_removed
 from datetime import datetime
 import pycountry
 
@@ -28,10 +32,20 @@ def get_countries():
     except Exception as e:
         return jsonify({'error': f'Failed to fetch countries: {str(e)}'}), 500
 
+# This gives the ids of the movies an actor is in, so their version_id can be moved on when the actor changes
+def actor_movie_ids(actor_id):
+    return [movie_id for (movie_id,) in db.session.query(movie_actors.c.movie_id).filter(movie_actors.c.actor_id == actor_id)]
+
 # Gets a list of all the actors using GET
+# The ETag is the catalog version, so a client with the current list gets a 304 without a query
 @actor_bp.route('', methods=['GET'])
 @jwt_required()
 def get_all_actors():
+    etag = f"actors-{catalog_version()}"
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
     actors = Actor.query.all()
     return jsonify([{
         'id': actor.id,
@@ -41,7 +55,36 @@ def get_all_actors():
         'birthday': actor.birthday.isoformat() if actor.birthday else None,
         'nationality': actor.nationality,
         'movie_count': actor.movies.count()
-    } for actor in actors]), 200
+    } for actor in actors]), 200, etag_header(etag)
+
+# This streams every actor with their movie count for a full export, ?format=ndjson gives one actor per line
+# The counts are a grouped subquery joined onto the actors, so it is one query read as the response is sent
+@actor_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_actors():
+    try:
+        output_format = export_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    movie_counts = db.select(
+        movie_actors.c.actor_id, db.func.count().label('count')
+    ).group_by(movie_actors.c.actor_id).subquery()
+    statement = db.select(
+        Actor.id, Actor.name, Actor.description, Actor.previous_work, Actor.birthday, Actor.nationality,
+        db.func.coalesce(movie_counts.c.count, 0).label('movie_count')
+    ).outerjoin(movie_counts, movie_counts.c.actor_id == Actor.id).order_by(Actor.id)
+
+    actors = ({
+        'id': row.id,
+        'name': row.name,
+        'description': row.description,
+        'previous_work': row.previous_work,
+        'birthday': row.birthday.isoformat() if row.birthday else None,
+        'nationality': row.nationality,
+        'movie_count': row.movie_count
+    } for row in iterate_rows(db.session, statement))
+    return streaming_response(actors, output_format, 'actors')
 
 # This allows admins to create new actors
 @actor_bp.route('', methods=['POST'])
@@ -85,6 +128,7 @@ def create_actor():
             nationality=nationality
         )
         db.session.add(new_actor)
+        bump_catalog_version()
         db.session.commit()
         return jsonify({
             'message': 'Actor created successfully',
@@ -155,7 +199,10 @@ def update_actor(actor_id):
         actor.previous_work = previous_work
         actor.birthday = birthday
         actor.nationality = nationality
-        
+
+        # The actor is shown on each of their movies, so those movies get a new version too
+        touch_movies(actor_movie_ids(actor.id))
+        bump_catalog_version()
         db.session.commit()
         return jsonify({
             'message': 'Actor updated successfully',
@@ -177,7 +224,11 @@ def update_actor(actor_id):
 def delete_actor(actor_id):
     actor = Actor.query.get_or_404(actor_id)
     try:
+        movie_ids = actor_movie_ids(actor.id)
+        touch_movies(movie_ids)
+        actor_removed(movie_ids)
         db.session.delete(actor)
+        bump_catalog_version()
         db.session.commit()
         return jsonify({'message': f'Actor {actor.name} deleted successfully'}), 200
     except Exception as e:
@@ -198,6 +249,9 @@ def remove_actor_from_movie(movie_id, actor_id):
             return jsonify({'error': f'Actor {actor.name} is not associated with this movie'}), 404
         
         movie.actors.remove(actor)
+        touch_movie(movie)
+        update_movie_stats(movie.id, actors_count=-1)
+        bump_catalog_version()
         db.session.commit()
         return jsonify({'message': f'Actor {actor.name} removed from movie {movie.movie_title}'}), 200
     except Exception as e:
@@ -0,0 +1,25 @@
+from flask import Blueprint, jsonify
+from extensions import ranking_models
+from services.metrics import metrics
+
+# Defining the health check blueprint
+health_bp = Blueprint('health_bp', __name__)
+
+# Liveness only says the process is serving requests, it does not wait for the models
+@health_bp.route('/live', methods=['GET'])
+def live():
+    return jsonify({'status': 'ok'}), 200
+
+# Readiness is only 200 once the ranking model is loaded and warmed up
+@health_bp.route('/ready', methods=['GET'])
+def ready():
+    status = ranking_models.status()
+    return jsonify({
+        'status': 'ready' if ranking_models.is_ready() else 'not ready',
+        'models': {'ranking': status}
+    }), 200 if ranking_models.is_ready() else 503
+
+# The serving metrics of this worker, such as the ranking batcher queue depth, batch sizes and wait times
+@health_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify(metrics.snapshot()), 200
@@ -1,13 +1,28 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, url_for
+from sqlalchemy import type_coerce
 from models.movie import Movie
-from models.watchlist import Watchlist
+from models.watchlist_movie import WatchlistMovie
 from models.rating import Rating
 from models.reviews import Review  
 from models.user import User
 from models.actor import Actor  
+from models.actor_movie import movie_actors
+from models.genre_movie import movie_genres
+from models.user_recommendation import UserRecommendation
+from models.segment_recommendation import SegmentRecommendation
+from models.movie_stats import MovieStats
 from extensions import db
+from services.catalog import bump_catalog_version, catalog_version, ratings_version, get_catalog_snapshot, touch_movie, not_modified, etag_header
+from services.streaming import iterate_rows, export_format, streaming_response
+from services.search import match_query, search_movies
+from services.movie_stats import STATS_FIELDS, update_movie_stats, delete_movie_stats
+from services.movie_import import read_movie_items, import_movies
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import os
+import base64
+import hashlib
+from itertools import groupby
+import json
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
@@ -70,6 +85,8 @@ def create_movie():
             return jsonify({'error': 'Please select a different actor'}), 400
         new_movie.actors.append(actor)
         db.session.add(new_movie)
+        update_movie_stats(new_movie.id, actors_count=1)
+        bump_catalog_version()
         db.session.commit()
         response = {
             'message': 'Movie created successfully',
@@ -88,31 +105,375 @@ def create_movie():
         logging.error(f"Create movie error: {str(e)}")
         return jsonify({'error': 'Failed to create movie'}), 500
 
+# This gives the error for an image the create routes cannot use, or None if it can be used
+def image_error(image_filename):
+    if image_filename not in AVAILABLE_IMAGES:
+        return f"Image must be one of {', '.join(AVAILABLE_IMAGES)}"
+    if not os.path.isfile(os.path.join(IMAGE_FOLDER, image_filename)):
+        return f"Image {image_filename} not found in {IMAGE_FOLDER}"
+    return None
+
+# This is the bulk create route, the admin can send a JSON array of movies or NDJSON with one movie per line
+# Each movie has the same fields as /create, with actor_ids for a list of actors
+# Every movie is checked first and the valid ones are saved in batches, the response has a result for
+# each movie in the order they were sent, so one bad movie does not stop the rest being saved
+@movie_bp.route('/bulk', methods=['POST'], endpoint='bulk_create_movies')
+@admin_required
+def bulk_create_movies():
+    try:
+        items = read_movie_items(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not items:
+        return jsonify({'error': 'No movies to import'}), 400
+    max_rows = current_app.config.get('MOVIES_BULK_MAX_ROWS', 50000)
+    if len(items) > max_rows:
+        return jsonify({'error': f"At most {max_rows} movies can be imported per request"}), 413
+
+    try:
+        results = import_movies(items, image_error, current_app.config.get('MOVIES_BULK_BATCH_SIZE', 1000))
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Bulk movie import error: {str(e)}")
+        return jsonify({'error': 'Failed to import movies'}), 500
+    created = sum(1 for result in results if result['status'] == 'created')
+    return jsonify({
+        'created': created,
+        'failed': len(results) - created,
+        'results': results
+    }), 201 if created else 400
+
+# This returns the actors of the movies as {movie id: [actors]} from one join over movie_actors
+# Without movie_ids it returns the actors of every movie
+def get_actors_by_movie(movie_ids=None):
+    actors_by_movie = {}
+    rows = db.session.query(movie_actors.c.movie_id, Actor.id, Actor.name).join(Actor, Actor.id == movie_actors.c.actor_id)
+    if movie_ids is not None:
+        rows = rows.filter(movie_actors.c.movie_id.in_(movie_ids))
+    for movie_id, actor_id, name in rows:
+        actors_by_movie.setdefault(movie_id, []).append({'id': actor_id, 'name': name})
+    return actors_by_movie
+
+# This filters movies to those in any of the genres, or all of them with match_all, through the
+# genre_id index of movie_genres. The genre names are looked up in the catalog snapshot, not queried
+def genre_filter(genres, match_all=False):
+    snapshot = get_catalog_snapshot()
+    genre_ids = snapshot.genre_ids if snapshot else {}
+    found = {genre_ids[genre.lower()] for genre in genres if genre.lower() in genre_ids}
+    if not found or (match_all and len(found) < len({genre.lower() for genre in genres})):
+        return db.false()
+    movie_ids = db.select(movie_genres.c.movie_id).where(movie_genres.c.genre_id.in_(found))
+    if match_all:
+        movie_ids = movie_ids.group_by(movie_genres.c.movie_id).having(db.func.count() == len(found))
+    return Movie.id.in_(movie_ids)
+
+# The columns of the movie fields GET /movies can return, with how each one is written in the response
+MOVIE_COLUMNS = {
+    'id': Movie.id,
+    'movie_title': Movie.movie_title,
+    'movie_genres': Movie.movie_genres,
+    'description': Movie.description,
+    'image_url': Movie.image_url,
+    'created_at': Movie.created_at
+}
+MOVIE_FORMATTERS = {
+    'id': lambda row: row.id,
+    'movie_title': lambda row: row.movie_title if row.movie_title else "Unknown Title",
+    'movie_genres': lambda row: row.movie_genres if row.movie_genres else "Unknown",
+    'description': lambda row: row.description,
+    'image_url': lambda row: f"/static/{row.image_url}" if row.image_url else "/static/movies/bloodborne1.jpg",
+    'created_at': lambda row: row.created_at.isoformat(),
+    'ratingsCount': lambda row: row.ratingsCount or 0,
+    'reviewsCount': lambda row: row.reviewsCount or 0,
+    'averageRating': lambda row: round(row.ratings_sum / row.ratingsCount, 2) if row.ratingsCount else None
+}
+# The fields read from movie_stats, they follow the ratings version rather than the catalog version
+STATS_COLUMNS = {
+    'ratingsCount': [MovieStats.ratings_count.label('ratingsCount')],
+    'reviewsCount': [MovieStats.reviews_count.label('reviewsCount')],
+    'averageRating': [MovieStats.ratings_count.label('ratingsCount'), MovieStats.ratings_sum]
+}
+MOVIE_FIELDS = list(MOVIE_FORMATTERS) + ['actors']
+
+# This reads fields=id,movie_title into the list of fields to return, all of them if it is not given
+def parse_movie_fields(value):
+    if not value:
+        return MOVIE_FIELDS
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in MOVIE_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields {', '.join(unknown)}, fields can be {', '.join(MOVIE_FIELDS)}")
+    return fields
+
+# The cursor is the created_at and id of the last movie of a page, so the next page starts straight
+# after it in the (created_at, id) index instead of counting past the earlier rows with an OFFSET
+# created_at is kept exactly as the database stores it so it compares the same way the column does
+def encode_cursor(created_at, movie_id):
+    return base64.urlsafe_b64encode(json.dumps([created_at, movie_id]).encode()).decode().rstrip('=')
+
+def decode_cursor(value):
+    try:
+        created_at, movie_id = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+    except Exception:
+        raise ValueError('cursor is not valid')
+    return created_at, movie_id
+
 # This is the GET route to get all of the movies
+# The rating and review totals come from the movie_stats row joined onto each movie and the actors come
+# from one more query, so the listing is two queries however many movies there are
+# Optional query params:
+#   limit=50            returns one page ordered by created_at and id, the next page is in the X-Next-Cursor header
+#   cursor=...          the page after the one that returned this cursor
+#   fields=id,movie_title  only selects and returns these fields
+#   genre=Action,Drama  movies in any of the genres
+#   genre_match=all     movies in all of the genres instead
+#   title_prefix=The    movies whose title starts with this
 @movie_bp.route('', methods=['GET'], endpoint='get_movies')
 @jwt_required()
 def get_movies():
     logging.debug("Fetching all movies")
-    movies = Movie.query.all()
-    response = [{
-        "id": movie.id,
-        "movie_title": movie.movie_title if movie.movie_title else "Unknown Title",
-        "movie_genres": movie.movie_genres if movie.movie_genres else "Unknown",
-        "description": movie.description,
-        "image_url": f"/static/{movie.image_url}" if movie.image_url else "/static/movies/bloodborne1.jpg",
-        "created_at": movie.created_at.isoformat(),
-        "ratingsCount": Rating.query.filter_by(movie_id=movie.id).count(),
-        "reviewsCount": Review.query.filter_by(movie_id=movie.id).count(),
-        "actors": [{'id': actor.id, 'name': actor.name} for actor in movie.actors.all()]
-    } for movie in movies]
+    try:
+        fields = parse_movie_fields(request.args.get('fields'))
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        genre_match = request.args.get('genre_match', 'any')
+        if genre_match not in ('any', 'all'):
+            raise ValueError('genre_match must be any or all')
+        limit = request.args.get('limit')
+        max_limit = current_app.config.get('MOVIES_MAX_PAGE_SIZE', 200)
+        if limit is not None or cursor is not None:
+            limit = int(limit) if limit is not None else current_app.config.get('MOVIES_PAGE_SIZE', 50)
+            if not (1 <= limit <= max_limit):
+                raise ValueError(f'limit must be between 1 and {max_limit}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The ETag is the catalog version and the query string, with the ratings version when counts are returned
+    # A client that already has this listing gets a 304 before anything is queried
+    counts_version = ratings_version() if any(field in STATS_COLUMNS for field in fields) else 0
+    etag = f"movies-{catalog_version()}-{counts_version}-{hashlib.sha1(request.query_string).hexdigest()[:16]}"
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    # Only the columns of the requested fields are selected, id and created_at are always needed for the cursor
+    created_at_key = type_coerce(Movie.created_at, db.String)
+    columns = [Movie.id, created_at_key.label('created_at_key')]
+    columns += [column for field, column in MOVIE_COLUMNS.items() if field in fields and field != 'id']
+    stats_columns = {column.key: column for field in fields for column in STATS_COLUMNS.get(field, [])}
+    if stats_columns:
+        columns += list(stats_columns.values())
+    query = db.session.query(*columns)
+    if stats_columns:
+        query = query.outerjoin(MovieStats, MovieStats.movie_id == Movie.id)
+
+    genres = [genre.strip() for genre in request.args.get('genre', '').split(',') if genre.strip()]
+    if genres:
+        query = query.filter(genre_filter(genres, genre_match == 'all'))
+    title_prefix = request.args.get('title_prefix')
+    if title_prefix:
+        escaped = title_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(Movie.movie_title.like(f"{escaped}%", escape='\\'))
+
+    if limit is not None:
+        if cursor is not None:
+            created_at, movie_id = cursor
+            query = query.filter(db.or_(
+                created_at_key > created_at,
+                db.and_(created_at_key == created_at, Movie.id > movie_id)
+            ))
+        # One extra row says if there is a next page
+        rows = query.order_by(Movie.created_at, Movie.id).limit(limit + 1).all()
+        next_row = rows[limit - 1] if len(rows) > limit else None
+        rows = rows[:limit]
+    else:
+        rows = query.all()
+        next_row = None
+
+    actors_by_movie = {}
+    if 'actors' in fields:
+        actors_by_movie = get_actors_by_movie([row.id for row in rows] if limit is not None else None)
+
+    response = []
+    for row in rows:
+        movie = {field: MOVIE_FORMATTERS[field](row) for field in fields if field != 'actors'}
+        if 'actors' in fields:
+            movie['actors'] = actors_by_movie.get(row.id, [])
+        response.append(movie)
     logging.debug(f"Get movies response: {response[:2]}") 
-    return jsonify(response), 200
+
+    headers = etag_header(etag)
+    if next_row is not None:
+        next_cursor = encode_cursor(next_row.created_at_key, next_row.id)
+        args = dict(request.args, cursor=next_cursor, limit=limit)
+        headers['X-Next-Cursor'] = next_cursor
+        headers['Link'] = f'<{url_for("movie_bp.get_movies", **args)}>; rel="next"'
+    return jsonify(response), 200, headers
         
+# This searches the movie titles, descriptions and reviews with the FTS5 index, best match first
+# Each result has a snippet of the text it matched with the words in [ ], and matched_in says if
+# that was the movie or one of its reviews. A title match scores above a description or review match.
+# Query params:
+#   q=dark knight   the words to search for, the last word also matches as a prefix
+#   limit=20        results per page, the next page is in the X-Next-Offset header
+#   offset=0        how many results to skip
+@movie_bp.route('/search', methods=['GET'], endpoint='search_movies')
+@jwt_required()
+def search():
+    query = match_query(request.args.get('q'))
+    if query is None:
+        return jsonify({'error': 'q must have at least one word to search for'}), 400
+    try:
+        limit = int(request.args.get('limit', current_app.config.get('SEARCH_PAGE_SIZE', 20)))
+        offset = int(request.args.get('offset', 0))
+        max_limit = current_app.config.get('MOVIES_MAX_PAGE_SIZE', 200)
+        if not (1 <= limit <= max_limit):
+            raise ValueError(f'limit must be between 1 and {max_limit}')
+        if offset < 0:
+            raise ValueError('offset cannot be negative')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Reviews are searched as well, so the ETag follows the ratings version with the catalog version
+    etag = f"search-{catalog_version()}-{ratings_version()}-{hashlib.sha1(request.query_string).hexdigest()[:16]}"
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+
+    try:
+        rows = search_movies(db.session, query, limit + 1, offset)
+    except Exception as e:
+        logging.error(f"Error searching movies for {query}: {str(e)}")
+        return jsonify({'error': 'Search failed'}), 500
+
+    response = [{
+        'id': row.id,
+        'movie_title': MOVIE_FORMATTERS['movie_title'](row),
+        'movie_genres': MOVIE_FORMATTERS['movie_genres'](row),
+        'image_url': MOVIE_FORMATTERS['image_url'](row),
+        'score': round(-row.score, 4),
+        'snippet': snippet,
+        'matched_in': row.matched_in
+    } for row, snippet in rows[:limit]]
+
+    headers = etag_header(etag)
+    if len(rows) > limit:
+        args = dict(request.args, offset=offset + limit, limit=limit)
+        headers['X-Next-Offset'] = str(offset + limit)
+        headers['Link'] = f'<{url_for("movie_bp.search_movies", **args)}>; rel="next"'
+    return jsonify(response), 200, headers
+
+# This streams every movie with its actors for a full export, ?format=ndjson gives one movie per line
+# The movies are joined to their actors and ordered by id so the actor rows of a movie arrive together,
+# and the rows are read from the cursor as the response is sent rather than all at once
+@movie_bp.route('/export', methods=['GET'], endpoint='export_movies')
+@jwt_required()
+def export_movies():
+    try:
+        output_format = export_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    statement = db.select(
+        *MOVIE_COLUMNS.values(), Actor.id.label('actor_id'), Actor.name.label('actor_name')
+    ).outerjoin(movie_actors, movie_actors.c.movie_id == Movie.id).outerjoin(
+        Actor, Actor.id == movie_actors.c.actor_id
+    ).order_by(Movie.id)
+
+    def movies():
+        for _, rows in groupby(iterate_rows(db.session, statement), key=lambda row: row.id):
+            rows = list(rows)
+            movie = {field: MOVIE_FORMATTERS[field](rows[0]) for field in MOVIE_COLUMNS}
+            movie['actors'] = [{'id': row.actor_id, 'name': row.actor_name} for row in rows if row.actor_id is not None]
+            yield movie
+
+    return streaming_response(movies(), output_format, 'movies')
+
+# This gives the /movies/<id>/stats fields of a movie_stats row, or zeros when a movie has no row yet
+def stats_response(stats):
+    if stats is None:
+        stats = MovieStats(**dict.fromkeys(STATS_FIELDS, 0))
+    return {
+        "ratings_count": stats.ratings_count,
+        "reviews_count": stats.reviews_count,
+        "actors_count": stats.actors_count,
+        "average_rating": stats.average_rating,
+        "ratings_histogram": stats.histogram
+    }
+
+# This reads the movie ids for /movies/batch, from ?ids=a,b,c on a GET or {"ids": [...]} on a POST
+# Repeated ids are only looked up once, the order of the first time each one is asked for is kept
+def batch_movie_ids():
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        ids = data.get('ids') if isinstance(data, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(movie_id, str) for movie_id in ids):
+            raise ValueError('Body must be {"ids": [...]} with a list of movie ids')
+    else:
+        ids = (request.args.get('ids') or '').split(',')
+    ids = list(dict.fromkeys(movie_id.strip() for movie_id in ids if movie_id.strip()))
+    if not ids:
+        raise ValueError('ids must have at least one movie id')
+    max_ids = current_app.config.get('MOVIES_BATCH_MAX_IDS', 200)
+    if len(ids) > max_ids:
+        raise ValueError(f"At most {max_ids} movie ids can be asked for at once")
+    return ids
+
+# This gets a list of movies with their actors and stats in one request, for pages like a watchlist
+# that would otherwise call /movies/<id> and /movies/<id>/stats for each movie
+# It is one IN query for the movies joined to their stats and one for their actors, whatever the number
+# of ids. The movies come back in the order they were asked for and ids with no movie are in missing
+# A GET has an ETag from the catalog and ratings versions, POST is there for lists too long for a URL
+@movie_bp.route('/batch', methods=['GET', 'POST'], endpoint='batch_movies')
+@jwt_required()
+def batch_movies():
+    try:
+        ids = batch_movie_ids()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    etag = None
+    if request.method == 'GET':
+        ids_hash = hashlib.sha1(','.join(ids).encode()).hexdigest()[:16]
+        etag = f"movies-batch-{catalog_version()}-{ratings_version()}-{ids_hash}"
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+    rows = db.session.query(Movie, MovieStats).outerjoin(MovieStats, MovieStats.movie_id == Movie.id).filter(Movie.id.in_(ids)).all()
+    found = {movie.id: (movie, stats) for movie, stats in rows}
+    actors_by_movie = get_actors_by_movie(list(found))
+
+    movies = []
+    for movie_id in ids:
+        if movie_id not in found:
+            continue
+        movie, stats = found[movie_id]
+        response = {field: MOVIE_FORMATTERS[field](movie) for field in MOVIE_COLUMNS}
+        response['actors'] = actors_by_movie.get(movie_id, [])
+        response['stats'] = stats_response(stats)
+        movies.append(response)
+    response = {
+        'movies': movies,
+        'missing': [movie_id for movie_id in ids if movie_id not in found]
+    }
+    return jsonify(response), 200, etag_header(etag) if etag else {}
+
 # this is the GET route to get specific movies by their ids
 @movie_bp.route('/<id>', methods=['GET'], endpoint='single_movie')
 @jwt_required()
 def single_movie(id):
     logging.debug(f"Fetching movie ID: {id}")
+    # The ETag is the catalog version and the movies version_id, read from the in-memory catalog so a 304
+    # needs no query. version_id starts at 1 again when a deleted movie id is created again, the catalog
+    # version moves on with the delete and the create so the new movie never matches an old ETag
+    snapshot = get_catalog_snapshot()
+    row_version = snapshot.row_version(id) if snapshot else None
+    etag = f"movie-{id}-{snapshot.version}-{row_version}" if row_version is not None else None
+    if etag:
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
     movie = Movie.query.get_or_404(id)
     actors = [{'id': actor.id, 'name': actor.name} for actor in movie.actors.all()]
     response = {
@@ -125,7 +486,7 @@ def single_movie(id):
         "actors": actors
     }
     logging.debug(f"Single movie response: {response}")
-    return jsonify(response), 200
+    return jsonify(response), 200, etag_header(f"movie-{id}-{snapshot.version if snapshot else catalog_version()}-{movie.version_id}")
 
 # This update route allows admins to edit movie details
 @movie_bp.route('/update/<id>', methods=['PUT'], endpoint='update_movie')
@@ -158,6 +519,9 @@ def update_movie(id):
                 return jsonify({'error': f"Actor with ID {data['actor_id']} not found"}), 404
             if actor not in movie.actors:  
                 movie.actors.append(actor)
+                touch_movie(movie)
+                update_movie_stats(movie.id, actors_count=1)
+        bump_catalog_version()
         db.session.commit()
         response = {
             'message': 'Movie updated successfully',
@@ -185,11 +549,12 @@ def delete_movie(id):
     try:
         Rating.query.filter_by(movie_id=id).delete()
         Review.query.filter_by(movie_id=id).delete()
-        watchlists = Watchlist.query.all()
-        for watchlist in watchlists:
-            if id in watchlist.movie_ids:
-                watchlist.movie_ids = [mid for mid in watchlist.movie_ids if mid != id]
+        UserRecommendation.query.filter_by(movie_id=id).delete()
+        SegmentRecommendation.query.filter_by(movie_id=id).delete()
+        WatchlistMovie.query.filter_by(movie_id=id).delete() # Only the watchlist rows of this movie, through its index
+        delete_movie_stats(id)
         db.session.delete(movie)
+        bump_catalog_version()
         db.session.commit()
         logging.debug(f"Movie ID {id} deleted")
         return jsonify({'message': 'Movie and associated ratings, reviews, and watchlist entries deleted successfully'}), 200
@@ -217,6 +582,9 @@ def add_actor(id):
 
     movie.actors.append(actor)
     try:
+        touch_movie(movie)
+        update_movie_stats(movie.id, actors_count=1)
+        bump_catalog_version()
         db.session.commit()
         logging.debug(f"Actor {actor.name} added to movie {movie.movie_title}")
         return jsonify({'message': f'Actor {actor.name} added to movie {movie.movie_title}'}), 200
@@ -238,6 +606,9 @@ def remove_actor(id, actor_id):
             return jsonify({'error': f'Actor {actor.name} is not associated with this movie'}), 404
         
         movie.actors.remove(actor)
+        touch_movie(movie)
+        update_movie_stats(movie.id, actors_count=-1)
+        bump_catalog_version()
         db.session.commit()
         logging.debug(f"Actor {actor.name} removed from movie {movie.movie_title}")
         return jsonify({'message': f'Actor {actor.name} removed from movie {movie.movie_title}'}), 200
@@ -246,16 +617,14 @@ def remove_actor(id, actor_id):
         logging.error(f"Remove actor error: {str(e)}")
         return jsonify({'error': f'Failed to remove actor from movie: {str(e)}'}), 500
 
+# This GETs the rating, review and actor totals of a movie, read from its one movie_stats row
 @movie_bp.route('/<id>/stats', methods=['GET'])
 def movie_stats(id):
     logging.debug(f"Fetch stats for movie ID: {id}")
-    movie = Movie.query.get_or_404(id)
-    ratings_count = Rating.query.filter_by(movie_id=movie.id).count()
-    reviews_count = Review.query.filter_by(movie_id=movie.id).count()
-    response = {
-        "ratings_count": ratings_count,
-        "reviews_count": reviews_count,
-        "actors_count": movie.actors.count()
-    }
+    stats = db.session.get(MovieStats, id)
+    if stats is None:
+        # A movie without a row yet has nothing counted against it
+        Movie.query.get_or_404(id)
+    response = stats_response(stats)
     logging.debug(f"Movie stats response: {response}")
     return jsonify(response), 200
\ No newline at end of file
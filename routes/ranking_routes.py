@@ -1,48 +1,205 @@
-from flask import Blueprint, request, jsonify
-import tensorflow as tf
+from flask import Blueprint, request, jsonify, current_app
+import logging
 import numpy as np
-from extensions import db
+import time
+from extensions import db, ranking_cache, ranking_models, ranking_batcher, segment_rankings, ranking_breaker, popularity_ranking
 from models.movie import Movie
+from models.rating import Rating
+from models.user import User
+from models.user_recommendation import UserRecommendation
+from routes.auth import admin_required
+from services.catalog import get_catalog_snapshot, ratings_version, changed_rating_users
+from services.ranking_model import ModelManager, top_k_indices
+from services.timing import span, profile_sample
+from services.inference_server import InferenceBusy, InferenceUnavailable, RemoteRankingModel
+from services.metrics import metrics
 
 # Defining the ranking model blueprint
 ranking_bp = Blueprint('ranking_bp', __name__)
 
-# Loading TensorFlow Ranking model from ml_models folder
-try:
-    ranking_model = tf.saved_model.load("ml_models/ranking_model")
-    print("Ranking model loaded successfully")
-    if hasattr(ranking_model, 'signatures'):
-        print("Model signatures:", ranking_model.signatures)
-except Exception as e:
-    print(f"Error loading ranking model: {e}")
-    ranking_model = None
-
-# Storing a list movie title variables
-movie_titles = []
-num_movies = 0
-
-def load_movie_titles():
-    # Gets movies from the database if it hasn't already
-    global movie_titles, num_movies
-    if not movie_titles:
-        try:
-            movie_titles = [movie.movie_title for movie in Movie.query.all()]
-            num_movies = len(movie_titles)
-            print(f"Loaded {num_movies} movie titles from database")
-            print(f"First few titles: {movie_titles[:5]}")
-        except Exception as e:
-            print(f"Error loading movies from database: {e}")
-            movie_titles = []
-            num_movies = 0
+# The number of movies returned for each user when k is not given
+DEFAULT_TOP_K = 5
 
-@ranking_bp.route('', methods=['GET'])
-def get_top_ranked_movies():
-    load_movie_titles()
+# The TensorFlow ranking model is loaded by ranking_models in extensions.py, either in the
+# background when the app starts or on the first request, this waits for it if it is still loading
+# The version comes back with the model so a request keeps using the same pair even if a reload swaps them
+def get_ranking_model():
+    return ranking_models.get_active(timeout=current_app.config.get('RANKING_MODEL_WAIT_SECONDS', 30))
+
+# Runs the model on the inputs and returns the scores as a NumPy array
+# With RANKING_BATCHING on, concurrent requests are joined into one model call by the batcher and a call
+# that takes longer than RANKING_INFERENCE_TIMEOUT raises TimeoutError. Without the batcher the call
+# runs on the request thread and cannot be given up on, the remote backend has its own timeout.
+def score_inputs(ranking_model, input_data):
+    if current_app.config.get('RANKING_BATCHING', True):
+        return ranking_batcher.score(ranking_model, input_data, timeout=current_app.config.get('RANKING_INFERENCE_TIMEOUT'))
+    return ranking_model(input_data).numpy()
+
+# The version the scores of a call came from. A remote model follows the inference server, which can be
+# reloaded through another worker during the call, the other backends always score with model_version
+# Results whose version is not the one they were looked up under are not cached
+def scored_version(ranking_model, model_version):
+    if isinstance(ranking_model, RemoteRankingModel):
+        return ranking_model.version
+    return model_version
+
+# The response used when there is no model to call
+def model_unavailable():
+    if ranking_models.state == ModelManager.LOADING:
+        return jsonify({'error': 'Ranking model is still loading'}), 503
+    return jsonify({'error': 'Ranking model not available'}), 500
+
+# The response for a failed model call, a full or unreachable inference server is a 503 the client can retry
+def model_error(e):
+    if isinstance(e, (InferenceBusy, InferenceUnavailable)):
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    if isinstance(e, TimeoutError):
+        return jsonify({'error': f'Ranking model timed out: {str(e)}'}), 504
+    return jsonify({'error': f'Ranking model error: {str(e)}'}), 500
+
+# This reads k from the request, it has to be between 1 and RANKING_MAX_K
+def parse_k(value):
+    k = int(value) if value is not None else DEFAULT_TOP_K
+    max_k = current_app.config.get('RANKING_MAX_K', 100)
+    if not (1 <= k <= max_k):
+        raise ValueError(f'k must be between 1 and {max_k}')
+    return k
+
+# This turns a row of model scores into the response list using the catalog snapshot
+# The indices point into the same snapshot the titles came from, so ids and scores always match
+def build_ranked_movies(snapshot, scores, indices):
+    return [
+        dict(snapshot.movie(index), rating=float(scores[index]))
+        for index in indices
+    ]
+
+# Rating writes drop the users cached rankings in the worker that took them, the other workers catch up
+# here. Once the shared ratings version has moved on they drop the users whose ratings changed since the
+# version they last saw. The version is read at most every CATALOG_VERSION_TTL seconds, so between
+# changes this is a tuple compare.
+def sync_ranking_cache():
+    version = ratings_version()
+    seen = ranking_cache.ratings_version
+    if seen == version:
+        return
+    if seen is not None:
+        for user_id in changed_rating_users(seen):
+            ranking_cache.invalidate_user(user_id)
+    ranking_cache.ratings_version = version
+
+# The cache keeps at least DEFAULT_TOP_K movies per user so smaller k values are answered by slicing
+def get_cached_ranking(user_id, model_version, snapshot, k):
+    sync_ranking_cache()
+    cached = ranking_cache.get(user_id, model_version, snapshot.version)
+    if cached is not None and (len(cached) >= k or len(cached) == len(snapshot)):
+        return cached[:k]
+    return None
+
+# The version of the model serving requests, None while none is loaded. It never starts or waits for a load
+def serving_model_version():
+    if not ranking_models.is_ready():
+        return None
+    return ranking_models.get_active(timeout=0)[0]
+
+# This serves a users top movies from the table written by seeders/score_recommendations.py
+# It is a single indexed query so the model is not needed in the request
+# When a model is serving only rows scored by that version are used, so after a reload the old scores
+# are not served as if they came from the new model. Without a loaded model the rows are served as they are.
+def get_precomputed_rankings(user_id, k):
+    query = db.session.query(UserRecommendation, Movie).join(
+        Movie, Movie.id == UserRecommendation.movie_id
+    ).filter(
+        UserRecommendation.user_id == int(user_id)
+    )
+    model_version = serving_model_version()
+    if model_version is not None:
+        query = query.filter(UserRecommendation.model_version == model_version)
+    rows = query.order_by(UserRecommendation.rank).limit(k).all()
+
+    if not rows:
+        if model_version is not None:
+            return jsonify({'error': f'No precomputed recommendations for user {user_id} from model {model_version}, '
+                                     f'run seeders/score_recommendations.py --version {model_version}'}), 404
+        return jsonify({'error': f'No precomputed recommendations for user {user_id}'}), 404
+
+    result = [
+        {
+            "id": movie.id,
+            "title": movie.movie_title,
+            "rating": float(recommendation.score),
+            "genres": movie.movie_genres
+        }
+        for recommendation, movie in rows
+    ]
+    return jsonify({
+        'top_ranked_movies': result,
+        'model_version': rows[0][0].model_version,
+        'served_by': 'precomputed'
+    }), 200
+
+# This scores only the given movies for a user and returns (movies best first, ids that were not found)
+# The titles come from one IN query and the model call has one row per movie, not one per catalog movie
+def rank_movie_subset(ranking_model, user_id, movie_ids):
+    movie_ids = list(dict.fromkeys(movie_ids))
+    rows = {
+        row.id: row for row in db.session.query(Movie.id, Movie.movie_title, Movie.movie_genres).filter(Movie.id.in_(movie_ids))
+    }
+    found = [movie_id for movie_id in movie_ids if movie_id in rows]
+    missing = [movie_id for movie_id in movie_ids if movie_id not in rows]
+    if not found:
+        return [], missing
+
+    input_data = {
+        "user_id": np.full(len(found), str(user_id), dtype=object),
+        "movie_title": np.array([rows[movie_id].movie_title for movie_id in found], dtype=object)
+    }
+    ratings = score_inputs(ranking_model, input_data).flatten()
+    ranked = [
+        {
+            "id": found[index],
+            "title": rows[found[index]].movie_title,
+            "genres": rows[found[index]].movie_genres,
+            "rating": float(ratings[index])
+        }
+        for index in np.argsort(-ratings, kind='stable')
+    ]
+    return ranked, missing
+
+# Users with no ratings are not in the ranking model's vocabulary, so the model would only score them
+# with its unknown user embedding. They are served the top list of their demographic segment instead.
+# A user with a cached model ranking has ratings, so a cache hit does not need the ratings query
+def get_segment_rankings(user_id, k):
+    sync_ranking_cache()
+    if ranking_cache.has_user(user_id):
+        return None
+    if db.session.query(Rating.query.filter(Rating.user_id == int(user_id)).exists()).scalar():
+        return None
+    segment, movies = segment_rankings.lookup(db.session.get(User, int(user_id)), k)
+    if movies is None:
+        return None
+    return jsonify({
+        'top_ranked_movies': movies,
+        'served_by': 'segment',
+        'segment': segment
+    }), 200
 
-    print(f"Request method: {request.method}")
-    print(f"Request headers: {request.headers}")
-    print(f"Request body: {request.get_data(as_text=True)}")
+# The answer while the model cannot be used, the most popular movies from the ratings
+# The fallback rate is the share of the last 100 model requests answered this way
+def popularity_fallback(snapshot, k, reason):
+    metrics.counter(f'ranking_fallback.{reason}').inc()
+    metrics.ratio('ranking_fallback_rate').observe(True)
+    with span('fallback'):
+        movies = popularity_ranking.top(snapshot, k)
+    return jsonify({
+        'top_ranked_movies': movies,
+        'served_by': 'popularity',
+        'fallback_reason': reason
+    }), 200
 
+# Each stage is timed with span(), the times are sent back in the Server-Timing header
+# and collected into histograms on /health/metrics
+@ranking_bp.route('', methods=['GET'])
+def get_top_ranked_movies():
     # Gets the user id from the request body or the query params
     json_data = request.get_json(silent=True)
     if json_data and 'user_id' in json_data:
@@ -57,50 +214,244 @@ def get_top_ranked_movies():
     except ValueError:
         return jsonify({'error': 'user_id must be an integer'}), 400
 
-    # This checks if the model and movie titles are ready
-    if ranking_model is None:
-        return jsonify({'error': 'Ranking model not available'}), 500
-    if not movie_titles:
+    # This gets how many movies to return, the default is 5
+    try:
+        k = parse_k(request.args.get('k'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if current_app.config.get('RANKING_COLD_START', True):
+        with span('cold_start'):
+            cold_start = get_segment_rankings(user_id, k)
+        if cold_start is not None:
+            return cold_start
+
+    # The mode can be set per request, otherwise the configured default is used
+    mode = request.args.get('mode', current_app.config.get('RANKING_MODE', 'model'))
+    if mode == 'precomputed':
+        return get_precomputed_rankings(user_id, k)
+    if mode != 'model':
+        return jsonify({'error': 'mode must be model or precomputed'}), 400
+
+    with span('catalog'):
+        snapshot = get_catalog_snapshot()
+    if not snapshot:
         return jsonify({'error': 'Movie titles not available'}), 500
 
+    # While the model keeps failing it is not called at all, see services/circuit_breaker.py
+    # Users with a cached ranking from the serving model are still answered from the cache
+    if not ranking_breaker.allow():
+        model_version = ranking_models.version
+        cached = get_cached_ranking(user_id, model_version, snapshot, k) if model_version else None
+        if cached is None:
+            return popularity_fallback(snapshot, k, 'circuit_open')
+        return jsonify({
+            'top_ranked_movies': cached,
+            'model_version': model_version,
+            'served_by': 'model'
+        }), 200
+
+    # This checks if the model is ready
+    with span('model_wait'):
+        model_version, ranking_model = get_ranking_model()
+    if ranking_model is None:
+        ranking_breaker.record_failure('model not available')
+        return popularity_fallback(snapshot, k, 'model_unavailable')
+
+    # Repeat loads for the same user are answered from the cache while the model and catalog are unchanged
+    with span('cache'):
+        cached = get_cached_ranking(user_id, model_version, snapshot, k)
+    if cached is not None:
+        # The model was not called, so this says nothing about whether it is working again
+        ranking_breaker.release()
+        with span('json'):
+            return jsonify({
+                'top_ranked_movies': cached,
+                'model_version': model_version,
+                'served_by': 'model'
+            }), 200
+
     # Creates an input that assigns the same user ids to the movie titles
     # This unfortunately makes the recommendations for a the user the same which is inaccurate however
     # When trying to make it work for all user ids problems arose and it was successful
-    user_ids = tf.constant([user_id] * num_movies, dtype=tf.string)
-    movie_titles_tensor = tf.constant(movie_titles, dtype=tf.string)
+    with span('inputs'):
+        user_ids = np.full(len(snapshot), user_id, dtype=object)
 
-    # Dictionary for the model input
-    input_data = {
-        "user_id": user_ids,
-        "movie_title": movie_titles_tensor
-    }
+        # Dictionary for the model input
+        input_data = {
+            "user_id": user_ids,
+            "movie_title": snapshot.titles
+        }
+
+    try:
+        # Gets the predictions from the model, a sample of requests is traced when profiling is on
+        started = time.perf_counter()
+        with span('inference'), profile_sample(ranking_models.backend):
+            ratings = score_inputs(ranking_model, input_data).flatten()
+        ranking_breaker.record_success(time.perf_counter() - started)
+        metrics.ratio('ranking_fallback_rate').observe(False)
+
+        # This picks the top movies without sorting the whole catalog
+        with span('top_k'):
+            result = build_ranked_movies(snapshot, ratings, top_k_indices(ratings, max(k, DEFAULT_TOP_K)))
+            served_version = scored_version(ranking_model, model_version)
+            if served_version == model_version:
+                ranking_cache.put(user_id, model_version, snapshot.version, result)
+        logging.debug(f"Top {k} movies for user {user_id} from model {served_version}")
+        with span('json'):
+            return jsonify({
+                'top_ranked_movies': result[:k],
+                'model_version': served_version,
+                'served_by': 'model'
+            }), 200
+    except Exception as e:
+        logging.error(f"Prediction error: {str(e)}")
+        ranking_breaker.record_failure(str(e) or type(e).__name__)
+        return popularity_fallback(snapshot, k, 'timeout' if isinstance(e, TimeoutError) else 'model_error')
+
+# This scores many users at once for jobs like the email digest
+# Each chunk stacks users x movies into one input so the model is called once per chunk instead of once per user
+@ranking_bp.route('/batch', methods=['POST'])
+@admin_required
+def get_top_ranked_movies_batch():
+    json_data = request.get_json(silent=True)
+    if not json_data or not isinstance(json_data.get('user_ids'), list) or not json_data['user_ids']:
+        return jsonify({'error': 'user_ids must be a non-empty list'}), 400
+
+    max_users = current_app.config.get('RANKING_BATCH_MAX_USERS', 200)
+    if len(json_data['user_ids']) > max_users:
+        return jsonify({'error': f'At most {max_users} user_ids can be ranked in one request'}), 400
+
+    try:
+        k = parse_k(json_data.get('k'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # Duplicate user ids are only scored once, the order of the request is kept
+        user_ids = list(dict.fromkeys(str(int(user_id)) for user_id in json_data['user_ids']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'user_ids must be integers'}), 400
+
+    snapshot = get_catalog_snapshot()
+
+    model_version, ranking_model = get_ranking_model()
+    if ranking_model is None:
+        return model_unavailable()
+    if not snapshot:
+        return jsonify({'error': 'Movie titles not available'}), 500
+
+    rankings = {}
+    for user_id in user_ids:
+        cached = get_cached_ranking(user_id, model_version, snapshot, k)
+        if cached is not None:
+            rankings[user_id] = cached
+    pending = [user_id for user_id in user_ids if user_id not in rankings]
+
+    # The chunks go through the same breaker as /ranking, so a failing model is not called here either
+    if pending and not ranking_breaker.allow():
+        return jsonify({'error': 'Ranking model is failing, try again later'}), 503, {'Retry-After': '1'}
+
+    # Keeps each stacked input under the configured number of rows
+    num_movies = len(snapshot)
+    max_rows = current_app.config.get('RANKING_BATCH_MAX_ROWS', 250000)
+    users_per_chunk = max(1, max_rows // num_movies)
 
     try:
-        # Gets the predictions from the model
-        predictions = ranking_model(input_data)
-        ratings = predictions.numpy().flatten()
-
-        # This combines the movies with the predicted ratings from the model
-        movies = Movie.query.all()
-        movie_ratings = [(movie, rating) for movie, rating in zip(movies, ratings)]
-
-        # Sorts the movies into a top 5 in the response
-        sorted_movie_ratings = sorted(movie_ratings, key=lambda x: x[1], reverse=True)
-        top_5 = sorted_movie_ratings[:5]
-
-        result = [
-            {
-                "id": movie.id,  
-                "title": movie.movie_title,
-                "rating": float(rating),
-                "genres": movie.movie_genres
+        model_calls = 0
+        for start in range(0, len(pending), users_per_chunk):
+            chunk = pending[start:start + users_per_chunk]
+            input_data = {
+                "user_id": np.repeat(np.array(chunk, dtype=object), num_movies),
+                "movie_title": np.tile(snapshot.titles, len(chunk))
             }
-            for movie, rating in top_5
-        ]
-        print(f"Top 5 movies for user {user_id}: {result}")
+            # The time is counted per user, so a big chunk is only slow if each user took as long as a /ranking call
+            started = time.perf_counter()
+            scores = score_inputs(ranking_model, input_data).reshape(len(chunk), num_movies)
+            ranking_breaker.record_success((time.perf_counter() - started) / len(chunk))
+            model_calls += 1
+            served_version = scored_version(ranking_model, model_version)
+
+            # This keeps the top k of each users row of scores
+            top_indices = top_k_indices(scores, max(k, DEFAULT_TOP_K))
+            for row, user_id in enumerate(chunk):
+                result = build_ranked_movies(snapshot, scores[row], top_indices[row])
+                if served_version == model_version:
+                    ranking_cache.put(user_id, model_version, snapshot.version, result)
+                rankings[user_id] = result[:k]
+
         return jsonify({
-            'top_ranked_movies': result
+            'results': [{'user_id': user_id, 'top_ranked_movies': rankings[user_id]} for user_id in user_ids],
+            'model_calls': model_calls,
+            'model_version': scored_version(ranking_model, model_version)
         }), 200
     except Exception as e:
-        print(f"Prediction error: {str(e)}")
-        return jsonify({'error': f'Ranking model error: {str(e)}'}), 500
\ No newline at end of file
+        logging.error(f"Batch prediction error: {str(e)}")
+        ranking_breaker.record_failure(str(e) or type(e).__name__)
+        return model_error(e)
+
+# This orders a list of movies for a user by predicted rating, such as a watchlist or a page of search results
+# Duplicate ids are ranked once and ids that are not in the catalog are listed in missing
+@ranking_bp.route('/subset', methods=['POST'])
+def rank_subset():
+    json_data = request.get_json(silent=True)
+    if not json_data or 'user_id' not in json_data:
+        return jsonify({'error': 'user_id is required'}), 400
+    movie_ids = json_data.get('movie_ids')
+    if not isinstance(movie_ids, list) or not movie_ids or not all(isinstance(movie_id, str) for movie_id in movie_ids):
+        return jsonify({'error': 'movie_ids must be a non-empty list of movie ids'}), 400
+
+    max_ids = current_app.config.get('RANKING_SUBSET_MAX_IDS', 500)
+    if len(movie_ids) > max_ids:
+        return jsonify({'error': f'At most {max_ids} movie_ids can be ranked in one request'}), 400
+
+    try:
+        user_id = str(int(json_data['user_id']))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'user_id must be an integer'}), 400
+
+    model_version, ranking_model = get_ranking_model()
+    if ranking_model is None:
+        return model_unavailable()
+
+    try:
+        ranked, missing = rank_movie_subset(ranking_model, user_id, movie_ids)
+    except Exception as e:
+        logging.error(f"Subset prediction error: {str(e)}")
+        return model_error(e)
+
+    return jsonify({
+        'ranked_movies': ranked,
+        'missing': missing,
+        'model_version': scored_version(ranking_model, model_version)
+    }), 200
+
+# This lists the ranking model versions found in ml_models/ and the one that is serving
+@ranking_bp.route('/models', methods=['GET'])
+@admin_required
+def list_ranking_models():
+    try:
+        versions = ranking_models.registry.versions()
+    except Exception as e:
+        return jsonify({'error': f'Error reading ranking models: {str(e)}'}), 500
+    return jsonify({
+        'active': ranking_models.status(),
+        'versions': versions
+    }), 200
+
+# This loads another ranking model version in the background and switches to it once it is warmed up
+# Requests keep being served by the current version until the switch
+@ranking_bp.route('/models/reload', methods=['POST'])
+@admin_required
+def reload_ranking_model():
+    json_data = request.get_json(silent=True) or {}
+    try:
+        version = ranking_models.reload(json_data.get('version'))
+    except KeyError as e:
+        return jsonify({'error': str(e.args[0])}), 404
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({
+        'message': f'Loading ranking model {version}',
+        'status': ranking_models.status()
+    }), 202
@@ -2,8 +2,12 @@ from flask import Blueprint, request, jsonify
 from models.rating import Rating
 from models.movie import Movie
 from models.user import User
-from extensions import db
+from extensions import db, ranking_cache, popularity_ranking
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from routes.auth import admin_required
+from services.streaming import iterate_rows, export_format, streaming_response
+from services.catalog import bump_user_ratings_version
+from services.movie_stats import update_movie_stats, rating_deltas
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
@@ -45,6 +49,7 @@ def add_rating():
         existing_rating = Rating.query.filter_by(user_id=user_id, movie_id=movie_id).first()
         if existing_rating:
             # Updates the rating if it exists
+            old_rating = existing_rating.rating
             existing_rating.rating = rating
             action = "updated"
         else:
@@ -53,7 +58,14 @@ def add_rating():
             db.session.add(new_rating)
             action = "added"
 
+        update_movie_stats(movie_id, **rating_deltas(added=rating, removed=old_rating if existing_rating else None))
+        bump_user_ratings_version(user_id) # The ratings counts in GET /movies and the users cached rankings change
         db.session.commit()
+        ranking_cache.invalidate_user(user_id) # The users cached rankings are now out of date
+        if existing_rating:
+            popularity_ranking.rating_changed(movie_id, old_rating, rating)
+        else:
+            popularity_ranking.rating_added(movie_id, rating)
 
         return jsonify({
             'message': f'Successfully {action} rating for {movie.movie_title} with {rating}',
@@ -63,6 +75,28 @@ def add_rating():
         db.session.rollback()
         return jsonify({'error': f'Failed to add rating: {str(e)}'}), 500
 
+# This streams every rating of every user for a full export, admins only, ?format=ndjson gives one rating per line
+# The rows are read from the cursor as the response is sent so memory does not grow with the table
+@rating_bp.route('/export', methods=['GET'])
+@admin_required
+def export_ratings():
+    try:
+        output_format = export_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    statement = db.select(
+        Rating.id, Rating.user_id, Rating.movie_id, Rating.rating, Rating.created_at
+    ).order_by(Rating.id)
+    ratings = ({
+        'id': row.id,
+        'user_id': row.user_id,
+        'movie_id': row.movie_id,
+        'rating': float(row.rating),
+        'created_at': row.created_at.isoformat() if row.created_at else None
+    } for row in iterate_rows(db.session, statement))
+    return streaming_response(ratings, output_format, 'ratings')
+
 # This is the GET routes to get all of the ratings for the user who has logged in
 @rating_bp.route('', methods=['GET'])
 @jwt_required()
@@ -124,8 +158,13 @@ def update_rating(id):
         return jsonify({'error': 'You can only edit your own ratings'}), 403
 
     try:
+        old_rating = rating.rating
         rating.rating = rating_value
+        update_movie_stats(rating.movie_id, **rating_deltas(added=rating_value, removed=old_rating))
+        bump_user_ratings_version(rating.user_id)
         db.session.commit()
+        ranking_cache.invalidate_user(rating.user_id)
+        popularity_ranking.rating_changed(rating.movie_id, old_rating, rating_value)
         movie = Movie.query.get(rating.movie_id)
         if not movie:
             logging.debug(f"Movie {rating.movie_id} not found for rating {id}")
@@ -166,7 +205,11 @@ def delete_rating(id):
             return jsonify({'error': f'Movie with ID {rating.movie_id} not found'}), 404
         logging.debug(f"Deleting rating {id} for movie {movie.movie_title}")
         db.session.delete(rating)
+        update_movie_stats(rating.movie_id, **rating_deltas(removed=rating.rating))
+        bump_user_ratings_version(rating.user_id)
         db.session.commit()
+        ranking_cache.invalidate_user(rating.user_id)
+        popularity_ranking.rating_removed(rating.movie_id, rating.rating)
         logging.debug(f"Successfully deleted rating {id}")
         return jsonify({
             'message': f'Successfully deleted rating for {movie.movie_title}',
@@ -1,50 +1,142 @@
-from flask import Blueprint, jsonify, request
-from models.movie import Movie  
-from models.user import User
-from extensions import db
 import numpy as np
-from utils import movie_to_features  
-from models.movie_user import ratings_table
-import tensorflow as tf
-
+from flask import Blueprint, jsonify, request, current_app
+from extensions import db, retrieval_service
+from models.rating import Rating
+from models.watchlist import Watchlist
+from models.watchlist_movie import WatchlistMovie
+from routes.ranking_routes import get_ranking_model, model_unavailable, model_error, score_inputs
+from services.ranking_model import top_k_indices
+from services.timing import span
 
+# Defining the retrieval model blueprint
 retrieval_bp = Blueprint('retrieval_bp', __name__)
 
-# Load your retrieval model
-basic_retrieval_model = tf.saved_model.load('retrieval_model')
- 
-@retrieval_bp.route('/recommendations', methods=['GET'])
+# The number of candidates returned when n is not given
+DEFAULT_CANDIDATES = 10
+
+# The number of movies returned by the pipeline when k is not given
+DEFAULT_PIPELINE_K = 10
+
+# This reads the genre filter, genre=Action,Comedy or genre=Action&genre=Comedy, a movie in any of them matches
+def parse_genres():
+    return [genre for value in request.args.getlist('genre') for genre in value.split(',') if genre.strip()]
+
+# The movies a user has already rated or put on one of their watchlists, as a set of ids
+def get_seen_movie_ids(user_id):
+    seen = {movie_id for (movie_id,) in db.session.query(Rating.movie_id).filter(Rating.user_id == int(user_id))}
+    seen.update(movie_id for (movie_id,) in db.session.query(WatchlistMovie.movie_id).join(Watchlist)
+                .filter(Watchlist.user_id == int(user_id)))
+    return seen
+
+# This returns the movies the retrieval model scores highest for a user, optionally only from some genres
+# The movie embeddings are held in an in-memory index built from ml_models/retrieval_model, see services/retrieval_index.py
+@retrieval_bp.route('', methods=['GET'])
 def get_recommendations():
-    genre = request.args.get('genre')
     user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id is required'}), 400
+    try:
+        user_id = str(int(user_id))
+    except ValueError:
+        return jsonify({'error': 'user_id must be an integer'}), 400
 
-    # Get all the movies rated by the user by joining the ratings_table
-    user_rated_movies = db.session.query(Movie, ratings_table.c.rating).join(
-        ratings_table, ratings_table.c.movie_id == Movie.id
-    ).filter(ratings_table.c.user_id == user_id).all()
+    # This gets how many movies to return and checks it is in range
+    max_n = current_app.config.get('RETRIEVAL_MAX_N', 100)
+    try:
+        n = int(request.args.get('n', DEFAULT_CANDIDATES))
+        nprobe = int(request.args.get('nprobe', current_app.config.get('RETRIEVAL_NPROBE', 10)))
+    except ValueError:
+        return jsonify({'error': 'n and nprobe must be integers'}), 400
+    if not (1 <= n <= max_n):
+        return jsonify({'error': f'n must be between 1 and {max_n}'}), 400
+    if nprobe < 1:
+        return jsonify({'error': 'nprobe must be at least 1'}), 400
 
-    # If the user hasn't rated any movies, return an error message
-    if not user_rated_movies:
-        return jsonify({'message': 'No movies found for the specified user'}), 404
+    mode = request.args.get('mode', current_app.config.get('RETRIEVAL_INDEX_MODE', 'exact'))
+    if mode not in ('exact', 'ivf'):
+        return jsonify({'error': 'mode must be exact or ivf'}), 400
 
-    # Filter the movies by genre
-    genre_filtered_movies = [movie for movie, rating in user_rated_movies if genre in movie.movie_genres.split(',')]
+    index = retrieval_service.get_index()
+    if index is None:
+        return jsonify({'error': 'Retrieval model not available'}), 500
 
-    # If no movies match the genre, return an error message
-    if not genre_filtered_movies:
-        return jsonify({'message': 'No movies found for the specified genre'}), 404
+    mask = index.genre_mask(parse_genres())
+    if mask is not None and not mask.any():
+        return jsonify({'error': 'No movies found for the specified genre'}), 404
 
-    # Get movie titles for retrieval
-    movie_titles = [movie.movie_title for movie in genre_filtered_movies]
+    rows, scores = index.search(user_id, n, mask=mask, mode=mode, nprobe=nprobe)
+    recommendations = [
+        dict(index.movie(row), score=float(score))
+        for row, score in zip(rows, scores)
+    ]
+    return jsonify({
+        'recommendations': recommendations,
+        'mode': mode,
+        'model_version': index.version
+    }), 200
 
-    # Get recommendations from the retrieval model
-    _, titles = basic_retrieval_model(movie_titles)
+# Two stage recommendations, the retrieval index picks a few hundred candidates the user has not rated
+# or added to a watchlist, and only those are scored by the ranking model. The ranking cost depends on
+# the number of candidates, not the size of the catalog. The time of each stage is in the Server-Timing header.
+@retrieval_bp.route('/pipeline', methods=['GET'])
+def get_pipeline_recommendations():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'user_id is required'}), 400
+    try:
+        user_id = str(int(user_id))
+        k = int(request.args.get('k', DEFAULT_PIPELINE_K))
+        candidates = int(request.args.get('candidates', current_app.config.get('PIPELINE_CANDIDATES', 300)))
+    except ValueError:
+        return jsonify({'error': 'user_id, k and candidates must be integers'}), 400
 
-    # Prepare the recommended movie list
-    recommended_movies = [{"movie_title": title} for title in titles[0][:3]]
+    max_k = current_app.config.get('RANKING_MAX_K', 100)
+    max_candidates = current_app.config.get('PIPELINE_MAX_CANDIDATES', 1000)
+    if not (1 <= k <= max_k):
+        return jsonify({'error': f'k must be between 1 and {max_k}'}), 400
+    if not (k <= candidates <= max_candidates):
+        return jsonify({'error': f'candidates must be between k and {max_candidates}'}), 400
 
-    return jsonify(recommended_movies)
+    # Stage 1, the movies the user has already seen are removed from the candidate mask
+    with span('exclude'):
+        index = retrieval_service.get_index()
+        if index is None:
+            return jsonify({'error': 'Retrieval model not available'}), 500
+        mask = index.exclude(index.genre_mask(parse_genres()), get_seen_movie_ids(user_id))
 
+    # Stage 2, the retrieval index picks the candidates
+    mode = request.args.get('mode', current_app.config.get('RETRIEVAL_INDEX_MODE', 'exact'))
+    try:
+        with span('retrieve'):
+            rows, retrieval_scores = index.search(user_id, candidates, mask=mask, mode=mode,
+                                                  nprobe=current_app.config.get('RETRIEVAL_NPROBE', 10))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
+    # Stage 3, the ranking model scores only the candidates
+    with span('model_wait'):
+        model_version, ranking_model = get_ranking_model()
+    if ranking_model is None:
+        return model_unavailable()
 
+    recommendations = []
+    if len(rows):
+        with span('rank'):
+            input_data = {
+                "user_id": np.full(len(rows), user_id, dtype=object),
+                "movie_title": index.snapshot.titles[index.movie_rows[rows]]
+            }
+            try:
+                ratings = score_inputs(ranking_model, input_data).flatten()
+            except Exception as e:
+                return model_error(e)
+            recommendations = [
+                dict(index.movie(rows[i]), rating=float(ratings[i]), retrieval_score=float(retrieval_scores[i]))
+                for i in top_k_indices(ratings, k)
+            ]
 
+    return jsonify({
+        'recommendations': recommendations,
+        'candidates': len(rows),
+        'model_version': {'retrieval': index.version, 'ranking': model_version}
+    }), 200
@@ -3,6 +3,8 @@ from models.reviews import Review
 from models.user import User
 from models.movie import Movie
 from extensions import db
+from services.catalog import bump_ratings_version
+from services.movie_stats import update_movie_stats
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 # This creates the blueprint for the review route
@@ -33,6 +35,8 @@ def create_review():
             
         )
         db.session.add(new_review)
+        update_movie_stats(new_review.movie_id, reviews_count=1)
+        bump_ratings_version() # The reviews counts in GET /movies change
         db.session.commit()
 
         # returns the review infomation in the response
@@ -97,6 +101,7 @@ def update_review(id):
 
     try:
         review.content = data['content'] # updates the review content
+        bump_ratings_version() # The search results and snippets from the review text change
         db.session.commit()
         return jsonify({
             'message': 'Review updated successfully',
@@ -120,6 +125,8 @@ def delete_review(id):
 
     try:
         db.session.delete(review)
+        update_movie_stats(review.movie_id, reviews_count=-1)
+        bump_ratings_version()
         db.session.commit()
         return jsonify({'message': 'Review deleted successfully', 'id': id}), 200
     except Exception as e:
@@ -1,9 +1,13 @@
 from flask import Blueprint, request, jsonify
+import logging
+import time
 from models.movie import Movie
 from models.user import User
 from models.watchlist import Watchlist
-from extensions import db
+from models.watchlist_movie import WatchlistMovie
+from extensions import db, ranking_models, ranking_breaker
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from routes.ranking_routes import rank_movie_subset
 
 # This creates the blueprint for the watchlist route
 watchlist_bp = Blueprint('watchlist_bp', __name__)
@@ -71,7 +75,34 @@ def get_user_watchlist():
         "is_public": item.is_public
     } for item in watchlists]), 200
 
+# This orders the movies of a watchlist by the users predicted rating with the ranking model
+# If the model cannot be used the saved order is kept, so the watchlist still loads
+# The order is only a nicety, so a model that is not loaded yet is never waited for and calls go through
+# the same circuit breaker as /ranking, a failing model costs the watchlist nothing once it is open
+def personalized_order(user_id, watchlist):
+    if not watchlist.movie_ids:
+        return None
+    if not ranking_models.is_ready():
+        ranking_models.start_background_load()
+        return None
+    if not ranking_breaker.allow():
+        return None
+    try:
+        model_version, ranking_model = ranking_models.get_active(timeout=0)
+        if ranking_model is None:
+            ranking_breaker.release()
+            return None
+        started = time.perf_counter()
+        ranked, _ = rank_movie_subset(ranking_model, user_id, watchlist.movie_ids)
+        ranking_breaker.record_success(time.perf_counter() - started)
+        return ranked
+    except Exception as e:
+        ranking_breaker.record_failure(str(e) or type(e).__name__)
+        logging.error(f"Could not rank watchlist {watchlist.id}: {str(e)}")
+        return None
+
 # This GETs all the watchlists by their ids
+# With ?order=personalized the movies come back ordered by the users predicted rating
 @watchlist_bp.route('/<int:id>', methods=['GET'])
 @jwt_required()
 def get_watchlist_item(id):
@@ -85,16 +116,40 @@ def get_watchlist_item(id):
         if not watchlist:
             return jsonify({'error': 'Watchlist not found or not yours'}), 404
         
-        return jsonify({
+        result = {
             "id": watchlist.id,
             "user_id": watchlist.user_id,
             "title": watchlist.title,
             "movie_ids": watchlist.movie_ids,
             "is_public": watchlist.is_public
-        }), 200
+        }
+
+        if request.args.get('order') == 'personalized':
+            ranked = personalized_order(user_id, watchlist)
+            if ranked is not None:
+                result["movie_ids"] = [movie["id"] for movie in ranked]
+                result["movies"] = ranked
+            result["order"] = 'personalized' if ranked is not None else 'saved'
+
+        return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': f'Failed to fetch watchlist item: {str(e)}'}), 500
 
+# This GETs the users watchlists that have a movie on them, with where the movie is on each one
+# It reads the watchlist_movies rows of that movie through the movie_id index, not every watchlist
+@watchlist_bp.route('/movie/<movie_id>', methods=['GET'])
+@jwt_required()
+def get_watchlists_with_movie(movie_id):
+    user_id = get_jwt_identity()
+    rows = db.session.query(Watchlist.id, Watchlist.title, WatchlistMovie.position).join(
+        WatchlistMovie, WatchlistMovie.watchlist_id == Watchlist.id
+    ).filter(WatchlistMovie.movie_id == movie_id, Watchlist.user_id == int(user_id)).order_by(Watchlist.id).all()
+    return jsonify([{
+        "id": row.id,
+        "title": row.title,
+        "position": row.position
+    } for row in rows]), 200
+
 # This update allows the user to edit the watchlist title
 @watchlist_bp.route('/update/<int:id>', methods=['PUT'])
 @jwt_required()
@@ -0,0 +1,30 @@
+import sys
+import os
+import argparse
+
+# This makes sure the parent dictory is in the import path, the same as the other seeders
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from extensions import ranking_registry
+from services.numpy_ranking import RANKING_NUMPY_DIR, export_ranking_weights
+
+# This exports a ranking model version so it can be served with RANKING_BACKEND = 'numpy'
+# TensorFlow is only needed to run this, the web workers then only load the .npy files
+def export(version=None, out_dir=RANKING_NUMPY_DIR):
+    model_version, model_path = ranking_registry.resolve(version)
+    target = os.path.join(out_dir, model_version)
+    print(f"Exporting ranking model {model_version} from {model_path} to {target}...")
+    manifest = export_ranking_weights(model_path, target, model_version)
+    print(f"Exported {manifest['dense_layers']} dense layers, NumPy scores are within "
+          f"{manifest['max_abs_diff']:.2e} of TensorFlow on {manifest['checked_rows']} rows "
+          f"(tolerance {manifest['tolerance']})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the ranking model weights to .npy files for the NumPy backend")
+    parser.add_argument("--version", default=None, help="ranking model version from ml_models/, the default version if not given")
+    parser.add_argument("--out-dir", default=RANKING_NUMPY_DIR, help="directory the version folder is written to")
+    args = parser.parse_args()
+
+    export(version=args.version, out_dir=args.out_dir)
@@ -0,0 +1,22 @@
+import sys
+import os
+import argparse
+
+# This makes sure the parent dictory is in the import path, the same as the other seeders
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from services.retrieval_index import RETRIEVAL_MODEL_PATH, RETRIEVAL_NUMPY_DIR, export_retrieval_embeddings
+
+# This extracts the user and movie embeddings from the retrieval model checkpoint so the web workers
+# can build the /recommendations index from .npy files without TensorFlow
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the retrieval model embeddings to .npy files")
+    parser.add_argument("--model-path", default=RETRIEVAL_MODEL_PATH)
+    parser.add_argument("--out-dir", default=RETRIEVAL_NUMPY_DIR)
+    args = parser.parse_args()
+
+    print(f"Exporting retrieval embeddings from {args.model_path} to {args.out_dir}...")
+    manifest = export_retrieval_embeddings(args.model_path, args.out_dir)
+    print(f"Exported {manifest['users']} users and {manifest['movies']} movies in {manifest['partitions']} partitions")
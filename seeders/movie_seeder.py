@@ -11,6 +11,8 @@ if project_root not in sys.path:
 from extensions import db
 from models.movie import Movie
 from models.actor import Actor  
+from models.genre import Genre
+from models.genre_movie import movie_genres as movie_genres_table
 from faker import Faker
 import random
 
@@ -50,8 +52,9 @@ def seed_movies():
             print("Error: Need at least 4 actors in the database. Run actor_seeder.py first.")
             return
 
-        # This clears existing movies from the database
+        # This clears existing movies from the database, with their rows in the genre table
         try:
+            db.session.execute(movie_genres_table.delete())
             db.session.query(Movie).delete()
             db.session.commit()
             print("Cleared existing movies.")
@@ -73,6 +76,12 @@ def seed_movies():
             print("Error: No images available in static/movies/. Please add images before seeding.")
             return
 
+        # This adds the genres with their MovieLens ids, so each genres bit in Movie.genre_mask is its MovieLens id
+        for gid, name in genre_map.items():
+            if not db.session.get(Genre, gid):
+                db.session.add(Genre(id=gid, name=name))
+        db.session.commit()
+
         # This goes through each of the movies in the dataset 
         for movie in dataset:
             # this decodes and prepares  the movie fields
@@ -0,0 +1,42 @@
+import sys
+import os
+import argparse
+from flask import Flask
+
+# This makes sure the parent dictory is in the import path, the same as the other seeders
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from extensions import db
+# The models are only imported so db.create_all makes their tables on a new database and the mappers can be set up,
+# services/segments.py imports the ones it queries inside its functions
+from models.user import User
+from models.movie import Movie
+from models.rating import Rating
+from models.watchlist import Watchlist
+from models.segment_recommendation import SegmentRecommendation
+from services.segments import SegmentRankings
+
+# This recomputes the top movies of every demographic segment from the ratings table
+# Use it when the app runs with SEGMENT_REFRESH_SECONDS set to 0, or to refresh straight after seeding ratings
+def refresh_segments(top_k=100, prior_weight=5):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///databasemovie.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+
+    with app.app_context():
+        # This creates the segment_recommendations table if it is not there yet
+        db.create_all()
+        segments = SegmentRankings(top_k=top_k, prior_weight=prior_weight).refresh()
+        print(f"Saved top {top_k} movies for {segments} segments")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute the top movies of each demographic segment from the ratings")
+    parser.add_argument("--top-k", type=int, default=100, help="number of movies saved for each segment")
+    parser.add_argument("--prior-weight", type=int, default=5, help="how many average ratings each movie starts with")
+    args = parser.parse_args()
+
+    refresh_segments(top_k=args.top_k, prior_weight=args.prior_weight)
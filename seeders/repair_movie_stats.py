@@ -0,0 +1,42 @@
+import sys
+import os
+import argparse
+from flask import Flask
+
+# This makes sure the parent dictory is in the import path, the same as the other seeders
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from extensions import db
+# The user and watchlist models are only imported so db.create_all finds the user table the ratings point at
+# and the User mapper finds its watchlists, services/movie_stats.py imports the other models
+from models.user import User
+from models.watchlist import Watchlist
+from services.movie_stats import repair_movie_stats
+
+# This rebuilds the movie_stats table from the ratings, reviews and movie_actors tables and prints any totals
+# that had drifted from them. Run it after seeding, or with --dry-run to only check the table
+def repair(dry_run=False, show=20):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///databasemovie.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+
+    with app.app_context():
+        # This creates the movie_stats table if it is not there yet
+        db.create_all()
+        drift = repair_movie_stats(db.session, dry_run=dry_run)
+        movies = len({item['movie_id'] for item in drift})
+        print(f"{len(drift)} wrong totals on {movies} movies" + (" (dry run, nothing changed)" if dry_run else ", all rebuilt"))
+        for item in drift[:show]:
+            print(f"  {item['movie_id']:<10} {item['field'] or 'orphan row'}: stored {item['stored']}, actual {item['actual']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild movie_stats from the source tables and report drift")
+    parser.add_argument("--dry-run", action="store_true", help="only report the drift, do not change the table")
+    parser.add_argument("--show", type=int, default=20, help="how many wrong totals to print")
+    args = parser.parse_args()
+
+    repair(dry_run=args.dry_run, show=args.show)
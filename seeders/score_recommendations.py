@@ -0,0 +1,122 @@
+import sys
+import os
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+from flask import Flask
+from sqlalchemy import insert
+
+# This makes sure the parent dictory is in the import path, the same as the other seeders
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from extensions import db, ranking_registry
+from models.user import User
+from models.movie import Movie
+from models.user_recommendation import UserRecommendation
+from services.ranking_model import top_k_indices
+
+# This scores every user against every movie with the ranking model and saves each users top movies
+# Users are committed one chunk at a time, so if the job stops it carries on from the last chunk when run again
+def score_recommendations(top_n=20, chunk_rows=250000, force=False, version=None):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///databasemovie.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+
+    with app.app_context():
+        # This creates the user_recommendations table if it is not there yet
+        db.create_all()
+
+        # The model is loaded once for the whole job
+        model_version, model_path = ranking_registry.resolve(version)
+        print(f"Loading ranking model {model_version} from {model_path}...")
+        ranking_model = tf.saved_model.load(model_path)
+
+        movies = db.session.query(Movie.id, Movie.movie_title).order_by(Movie.id).all()
+        if not movies:
+            print("No movies found in the database. Please seed movies first.")
+            return
+        movie_ids = np.array([movie.id for movie in movies], dtype=object)
+        movie_titles = np.array([movie.movie_title for movie in movies], dtype=object)
+        num_movies = len(movies)
+        top_n = min(top_n, num_movies)
+
+        user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+
+        # Users that already have rows from this model version are skipped unless force is used
+        if not force:
+            done = {
+                user_id for (user_id,) in db.session.query(UserRecommendation.user_id)
+                .filter(UserRecommendation.model_version == model_version).distinct()
+            }
+            user_ids = [user_id for user_id in user_ids if user_id not in done]
+            if done:
+                print(f"Resuming, {len(done)} users already scored with model {model_version}")
+
+        if not user_ids:
+            print("All users are already scored.")
+            return
+
+        users_per_chunk = max(1, chunk_rows // num_movies)
+        print(f"Scoring {len(user_ids)} users x {num_movies} movies, {users_per_chunk} users per chunk...")
+
+        started = time.perf_counter()
+        scored_pairs = 0
+        inserted_rows = 0
+        for start in range(0, len(user_ids), users_per_chunk):
+            chunk = user_ids[start:start + users_per_chunk]
+            input_data = {
+                "user_id": tf.constant(np.repeat(np.array([str(user_id) for user_id in chunk], dtype=object), num_movies), dtype=tf.string),
+                "movie_title": tf.constant(np.tile(movie_titles, len(chunk)), dtype=tf.string)
+            }
+            scores = ranking_model(input_data).numpy().reshape(len(chunk), num_movies)
+
+            # This picks the top n of each row without sorting the whole catalog
+            top = top_k_indices(scores, top_n)
+
+            rows = [
+                {
+                    "user_id": user_id,
+                    "rank": rank + 1,
+                    "movie_id": movie_ids[index],
+                    "score": float(scores[row, index]),
+                    "model_version": model_version
+                }
+                for row, user_id in enumerate(chunk)
+                for rank, index in enumerate(top[row])
+            ]
+
+            # The old rows for the chunk are replaced in the same transaction as the bulk insert
+            try:
+                UserRecommendation.query.filter(UserRecommendation.user_id.in_(chunk)).delete(synchronize_session=False)
+                db.session.execute(insert(UserRecommendation), rows)
+                db.session.commit()
+            except Exception as e:
+                print(f"Error saving recommendations for users {chunk[0]}-{chunk[-1]}: {e}")
+                db.session.rollback()
+                return
+
+            scored_pairs += len(chunk) * num_movies
+            inserted_rows += len(rows)
+            elapsed = time.perf_counter() - started
+            print(f"Scored {start + len(chunk)}/{len(user_ids)} users, "
+                  f"{scored_pairs / elapsed:,.0f} pairs/sec, {inserted_rows / elapsed:,.0f} rows/sec")
+
+        elapsed = time.perf_counter() - started
+        print(f"Saved {inserted_rows} recommendations for {len(user_ids)} users in {elapsed:.1f}s "
+              f"({scored_pairs / elapsed:,.0f} pairs/sec, {inserted_rows / elapsed:,.0f} rows/sec)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score every user against every movie and save the top movies per user")
+    parser.add_argument("--top-n", type=int, default=20, help="number of movies saved for each user")
+    parser.add_argument("--chunk-rows", type=int, default=250000, help="maximum user x movie rows per model call")
+    parser.add_argument("--force", action="store_true", help="rescore users that already have recommendations")
+    parser.add_argument("--version", default=None, help="ranking model version from ml_models/, the default version if not given")
+    args = parser.parse_args()
+
+    print("Starting recommendation scoring...")
+    score_recommendations(top_n=args.top_n, chunk_rows=args.chunk_rows, force=args.force, version=args.version)
@@ -0,0 +1,196 @@
+import threading
+import logging
+import time
+import numpy as np
+from flask import current_app, request
+from sqlalchemy.orm.attributes import flag_modified
+from extensions import db
+from models.movie import Movie
+from models.catalog_state import CatalogState
+from models.user_rating_version import UserRatingVersion
+from models.genre import Genre
+
+# The catalog and ratings versions are kept in the catalog_state table so every worker sees the same
+# numbers. Admin writes to the movies or actors bump catalog_version, so anything derived from the list
+# of movies (ranking inputs, cached results, ETags) can tell it is stale, and rating or review writes
+# bump ratings_version. Each worker reads the row again at most every CATALOG_VERSION_TTL seconds,
+# so a change made through another worker is seen within that time.
+_versions = None
+_versions_read_at = 0
+_versions_lock = threading.Lock()
+
+def _read_versions():
+    global _versions, _versions_read_at
+    versions = _versions
+    if versions is not None and time.monotonic() - _versions_read_at < current_app.config.get('CATALOG_VERSION_TTL', 1.0):
+        return versions
+    with _versions_lock:
+        try:
+            row = db.session.query(CatalogState.catalog_version, CatalogState.ratings_version).filter_by(id=1).first()
+        except Exception as e:
+            logging.error(f"Error reading the catalog version: {e}")
+            return versions or (0, 0)
+        _versions = tuple(row) if row else (0, 0)
+        _versions_read_at = time.monotonic()
+        return _versions
+
+# This returns the current catalog version
+def catalog_version():
+    return _read_versions()[0]
+
+# This returns the current ratings version
+def ratings_version():
+    return _read_versions()[1]
+
+# These add 1 to a version in the current transaction, so call them before the commit of the change
+# The new version is read again by this worker on its next request
+def _bump(column):
+    global _versions
+    updated = db.session.query(CatalogState).filter_by(id=1).update({column: column + 1}, synchronize_session=False)
+    if not updated:
+        db.session.add(CatalogState(id=1, catalog_version=1 if column is CatalogState.catalog_version else 0,
+                                    ratings_version=1 if column is CatalogState.ratings_version else 0))
+    _versions = None
+
+def bump_catalog_version():
+    _bump(CatalogState.catalog_version)
+
+def bump_ratings_version():
+    _bump(CatalogState.ratings_version)
+
+# This is bump_ratings_version for a write to a users ratings. The new version is saved against the user,
+# so every worker can find the users whose ratings changed since it last looked with changed_rating_users
+def bump_user_ratings_version(user_id):
+    bump_ratings_version()
+    db.session.flush()
+    version = db.session.query(CatalogState.ratings_version).filter_by(id=1).scalar()
+    updated = db.session.query(UserRatingVersion).filter_by(user_id=int(user_id)).update(
+        {UserRatingVersion.ratings_version: version}, synchronize_session=False
+    )
+    if not updated:
+        db.session.add(UserRatingVersion(user_id=int(user_id), ratings_version=version))
+
+# The ids of the users whose ratings changed after the given ratings version, as strings like the ranking cache keys
+def changed_rating_users(since):
+    return [str(user_id) for (user_id,) in db.session.query(UserRatingVersion.user_id).filter(UserRatingVersion.ratings_version > since)]
+
+# These add 1 to the version_id of movies whose response changed without their row changing, such as
+# when an actor is added to them or renamed. touch_movie is for a movie loaded in the session, it marks
+# the row changed so its flush is an UPDATE that moves version_id on. touch_movies updates by id.
+def touch_movie(movie):
+    flag_modified(movie, 'movie_title')
+
+def touch_movies(movie_ids):
+    if movie_ids:
+        db.session.query(Movie).filter(Movie.id.in_(movie_ids)).update(
+            {Movie.version_id: Movie.version_id + 1}, synchronize_session=False
+        )
+
+# A new app may be pointing at a different database, so the versions and snapshot are read again
+def reset_catalog_cache():
+    global _versions, _snapshot
+    _versions = None
+    _snapshot = None
+
+# The ETag helpers for the read endpoints. A request whose If-None-Match has the current ETag gets
+# a 304 from not_modified() before the endpoint queries or serializes anything.
+def not_modified(etag):
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def etag_header(etag):
+    return {'ETag': f'"{etag}"'}
+
+# Read only copy of the movie catalog held as parallel NumPy arrays.
+# Row i of ids, titles and genres is always the same movie, so model scores
+# computed from titles can be mapped straight back to ids without another query.
+# genre_masks holds each movies Movie.genre_mask, so a genre filter over the whole catalog is one
+# bitwise AND, and genre_ids maps a lower case genre name to its id (its bit in the masks).
+class CatalogSnapshot:
+    def __init__(self, version, ids, titles, genres, row_versions=None, genre_masks=None, genre_ids=None):
+        self.version = version
+        self.ids = _read_only(np.array(ids, dtype=object))
+        self.rows = {movie_id: index for index, movie_id in enumerate(ids)}
+        self.row_versions = row_versions if row_versions is not None else [1] * len(ids)
+        self.titles = _read_only(np.array(titles, dtype=object))
+        self.genres = _read_only(np.array(genres, dtype=object))
+        self.genre_masks = _read_only(np.array(genre_masks if genre_masks is not None else [0] * len(ids), dtype=np.int64))
+        self.genre_ids = genre_ids or {}
+
+    # This gives the same movie fields the ranking responses use
+    def movie(self, index):
+        return {
+            "id": self.ids[index],
+            "title": self.titles[index],
+            "genres": self.genres[index]
+        }
+
+    # The version_id of a movie, or None if it is not in the catalog
+    def row_version(self, movie_id):
+        index = self.rows.get(movie_id)
+        return None if index is None else self.row_versions[index]
+
+    # This returns the mask bits of the named genres, and False as well if any of them is not a known genre
+    def genre_bits(self, names):
+        bits = 0
+        known = True
+        for name in names:
+            genre_id = self.genre_ids.get(name.strip().lower())
+            if genre_id is None:
+                known = False
+            else:
+                bits |= 1 << genre_id
+        return bits, known
+
+    # This returns a boolean array of the movies in any of the genres, or in all of them with match_all
+    def genre_filter(self, names, match_all=False):
+        bits, known = self.genre_bits(names)
+        if match_all:
+            if not known:
+                return np.zeros(len(self), dtype=bool)
+            return (self.genre_masks & bits) == bits
+        return (self.genre_masks & bits) != 0
+
+    def __len__(self):
+        return len(self.ids)
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+# This returns the snapshot for the current catalog version, it is only rebuilt after an admin change
+def get_catalog_snapshot():
+    global _snapshot
+    snapshot = _snapshot
+    version = catalog_version()
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _snapshot_lock:
+        if _snapshot is not None and _snapshot.version == version:
+            return _snapshot
+        try:
+            rows = Movie.query.with_entities(
+                Movie.id, Movie.movie_title, Movie.movie_genres, Movie.version_id, Movie.genre_mask
+            ).order_by(Movie.id).all()
+            genre_ids = {name.lower(): genre_id for genre_id, name in db.session.query(Genre.id, Genre.name)}
+        except Exception as e:
+            logging.error(f"Error loading movie catalog: {e}")
+            return None
+        _snapshot = CatalogSnapshot(
+            version,
+            [row.id for row in rows],
+            [row.movie_title for row in rows],
+            [row.movie_genres for row in rows],
+            [row.version_id for row in rows],
+            [row.genre_mask for row in rows],
+            genre_ids
+        )
+        logging.debug(f"Loaded catalog snapshot {version} with {len(_snapshot)} movies")
+        return _snapshot
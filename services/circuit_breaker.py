@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+from services.metrics import metrics
+
+# Stops calling the ranking model for a while once it keeps failing, so requests are answered
+# straight away from a fallback instead of each one waiting for the model to time out.
+# closed     calls go through, failure_threshold failures or slow calls in a row open the breaker
+# open       calls are skipped until reset_seconds have passed
+# half_open  one call is let through to test the model, success closes the breaker and failure opens it again
+# The state is on /health/metrics as <name>_state, 0 closed, 1 half open and 2 open.
+class CircuitBreaker:
+    CLOSED = 'closed'
+    HALF_OPEN = 'half_open'
+    OPEN = 'open'
+
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_threshold=5, slow_call_seconds=1.0, reset_seconds=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.failure_threshold = app.config.get('RANKING_BREAKER_FAILURES', self.failure_threshold)
+        self.slow_call_seconds = app.config.get('RANKING_BREAKER_SLOW_SECONDS', self.slow_call_seconds)
+        self.reset_seconds = app.config.get('RANKING_BREAKER_RESET_SECONDS', self.reset_seconds)
+        with self._lock:
+            self.failures = 0
+            self._set_state(self.CLOSED)
+
+    # This says if a call can be made now, every allowed call has to be followed by
+    # record_success, record_failure or release
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_seconds:
+                self._set_state(self.HALF_OPEN)
+            # A probe that never reported back does not keep the breaker half open forever
+            if self.state == self.HALF_OPEN and (self._probe_started is None or now - self._probe_started >= self.reset_seconds):
+                self._probe_started = now
+                return True
+            metrics.counter(f'{self.name}_rejected').inc()
+            return False
+
+    # This hands back a call allowed by allow() that was not made after all
+    def release(self):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_started = None
+
+    # A call that took longer than slow_call_seconds counts as a failure
+    def record_success(self, seconds=0):
+        if seconds >= self.slow_call_seconds:
+            self.record_failure(f'slow call of {seconds:.2f}s')
+            return
+        with self._lock:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self, reason=None):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                logging.warning(f"Opening the {self.name} circuit breaker after {self.failures} failures, last: {reason}")
+                metrics.counter(f'{self.name}_opened').inc()
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def status(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'failure_threshold': self.failure_threshold
+        }
+
+    def _set_state(self, state):
+        self.state = state
+        self._probe_started = None
+        metrics.gauge(f'{self.name}_state').set(self.STATE_VALUES[state])
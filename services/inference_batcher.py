@@ -0,0 +1,102 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from services.metrics import metrics
+
+# Buckets for the batcher metrics
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+WAIT_MS_BUCKETS = [0.5, 1, 2, 5, 10, 25, 50, 100]
+
+# Collects ranking model calls made by concurrent requests and runs them as one call.
+# The first request waits up to window_ms for others to arrive, or until max_requests or
+# max_rows is reached, then the inputs are joined, the model is called once and each request
+# gets its own rows of the scores back through a Future.
+# Requests are only joined with others for the same model object, so after a hot reload
+# requests that hold the old model are still scored by it.
+class InferenceBatcher:
+    def __init__(self, window_ms=3, max_requests=32, max_rows=250000):
+        self.window_ms = window_ms
+        self.max_requests = max_requests
+        self.max_rows = max_rows
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.window_ms = app.config.get('RANKING_BATCH_WINDOW_MS', self.window_ms)
+        self.max_requests = app.config.get('RANKING_BATCH_MAX_REQUESTS', self.max_requests)
+        self.max_rows = app.config.get('RANKING_BATCH_MAX_ROWS', self.max_rows)
+
+    # This queues a model call and returns a Future for its scores as a NumPy array
+    def submit(self, model, inputs):
+        self._start()
+        future = Future()
+        rows = len(next(iter(inputs.values())))
+        metrics.gauge('ranking_batcher_queue_depth').inc()
+        self._queue.put((model, inputs, rows, future, time.perf_counter()))
+        return future
+
+    # Scores the inputs through the batcher and waits for the result
+    def score(self, model, inputs, timeout=None):
+        return self.submit(model, inputs).result(timeout)
+
+    def _start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ranking-batcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            rows = batch[0][2]
+            deadline = time.perf_counter() + self.window_ms / 1000
+            while len(batch) < self.max_requests and rows < self.max_rows:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += item[2]
+            metrics.gauge('ranking_batcher_queue_depth').dec(len(batch))
+
+            # Requests for different model objects are scored separately
+            groups = {}
+            for item in batch:
+                groups.setdefault(id(item[0]), []).append(item)
+            for items in groups.values():
+                self._score(items)
+
+    def _score(self, items):
+        started = time.perf_counter()
+        wait_ms = metrics.histogram('ranking_batcher_wait_ms', WAIT_MS_BUCKETS)
+        for item in items:
+            wait_ms.observe((started - item[4]) * 1000)
+        metrics.histogram('ranking_batcher_batch_size', BATCH_SIZE_BUCKETS).observe(len(items))
+        metrics.counter('ranking_batcher_model_calls').inc()
+
+        model = items[0][0]
+        try:
+            if len(items) == 1:
+                inputs = items[0][1]
+            else:
+                inputs = {key: np.concatenate([item[1][key] for item in items]) for key in items[0][1]}
+            scores = model(inputs).numpy()
+        except Exception as e:
+            logging.error(f"Batched ranking model call failed for {len(items)} requests: {e}")
+            for item in items:
+                item[3].set_exception(e)
+            return
+
+        offset = 0
+        for item in items:
+            item[3].set_result(scores[offset:offset + item[2]])
+            offset += item[2]
@@ -0,0 +1,228 @@
+import sys
+import os
+import argparse
+import logging
+import queue
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+# This makes sure the parent dictory is in the import path when the server is started as a script
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from services.numpy_ranking import NumpyScores
+
+# Default Unix socket the inference server listens on, in a directory only this user can open
+INFERENCE_SERVER_ADDRESS = os.path.join(tempfile.gettempdir(), f"movie-ranking-{os.getuid()}", "ranking.sock")
+
+# Raised when the server or the connection pool is full, the request should be retried later
+class InferenceBusy(Exception):
+    pass
+
+# Raised when the server cannot be reached
+class InferenceUnavailable(Exception):
+    pass
+
+# A separate process that owns the ranking model so the web workers do not import TensorFlow.
+# Each connection is served on its own thread and score requests from all of them go through one
+# InferenceBatcher, so calls from different web workers can share a model call. At most max_pending
+# score requests are accepted at once, past that the server answers busy straight away instead of queueing.
+#   INFERENCE_SERVER_AUTHKEY=<secret> python services/inference_server.py --backend tf --intra-op-threads 4
+# Messages are tuples, ('score', inputs), ('status',) and ('reload', version), and every reply starts with
+# 'ok', 'busy' or 'error'.
+# Messages are pickles, so reading one from an unknown process would let it run code in the server. The
+# authkey handshake is done before anything is read, and the socket is made in a 0700 directory and
+# set to 0600, so only the owner can connect at all.
+class InferenceServer:
+    def __init__(self, address, manager, batcher, authkey=None, max_pending=64, model_wait_seconds=30):
+        check_authkey(authkey)
+        self.address = address
+        self.manager = manager
+        self.batcher = batcher
+        self.authkey = authkey
+        self.model_wait_seconds = model_wait_seconds
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def serve_forever(self):
+        private_socket_directory(os.path.dirname(self.address))
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        with Listener(self.address, family='AF_UNIX', authkey=self.authkey) as listener:
+            os.chmod(self.address, 0o600)
+            logging.info(f"Inference server listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logging.error(f"Error accepting inference connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                conn.send(self.handle(message))
+
+    def handle(self, message):
+        command = message[0]
+        if command == 'score':
+            if not self._slots.acquire(blocking=False):
+                return ('busy', 'Inference server is at capacity')
+            try:
+                version, model = self.manager.get_active(timeout=self.model_wait_seconds)
+                if model is None:
+                    return ('error', f'Ranking model not available: {self.manager.error}')
+                return ('ok', version, self.batcher.score(model, message[1]))
+            except Exception as e:
+                return ('error', str(e))
+            finally:
+                self._slots.release()
+        if command == 'status':
+            return ('ok', self.manager.status())
+        if command == 'reload':
+            try:
+                self.manager.load_now(message[1])
+                return ('ok', self.manager.status())
+            except Exception as e:
+                return ('error', str(e))
+        return ('error', f'Unknown command {command}')
+
+# The server and client both need the shared secret, there is no way to run them without one
+def check_authkey(authkey):
+    if not authkey or not isinstance(authkey, bytes):
+        raise ValueError("The inference server needs an authkey, set INFERENCE_SERVER_AUTHKEY")
+
+# This makes the socket directory if needed and checks that no other user can open or replace files in it
+def private_socket_directory(directory):
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"Socket directory {directory} must belong to this user with mode 0700")
+
+# Talks to the inference server over a small pool of reused connections.
+# A request waits up to timeout seconds for a free connection and again for the reply. A connection
+# whose reply timed out is closed, as the late reply would otherwise be read by the next request.
+class InferenceClient:
+    def __init__(self, address=INFERENCE_SERVER_ADDRESS, authkey=None, pool_size=4, timeout=5.0):
+        check_authkey(authkey)
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def request(self, *message, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise InferenceBusy('All inference server connections are in use')
+        try:
+            reply = self._send(message, timeout)
+        finally:
+            self._slots.release()
+
+        if reply[0] == 'busy':
+            raise InferenceBusy(reply[1])
+        if reply[0] == 'error':
+            raise RuntimeError(reply[1])
+        return reply[1:]
+
+    def _send(self, message, timeout):
+        # An idle connection may have been closed by a server restart, so a failed send on one is retried once on a new connection
+        for attempt in range(2):
+            reused = True
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                reused = False
+                try:
+                    conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+                except OSError as e:
+                    raise InferenceUnavailable(f'Cannot connect to the inference server at {self.address}: {e}')
+                except AuthenticationError as e:
+                    raise InferenceUnavailable(f'The inference server at {self.address} did not accept the authkey: {e}')
+            try:
+                conn.send(message)
+                replied = conn.poll(timeout)
+                reply = conn.recv() if replied else None
+            except (EOFError, OSError) as e:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise InferenceUnavailable(f'Lost the connection to the inference server: {e}')
+            if not replied:
+                conn.close()
+                raise TimeoutError(f'Inference server did not reply within {timeout}s')
+            self._idle.put(conn)
+            return reply
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+# Used by ModelManager when RANKING_BACKEND is 'remote', it is called like the TensorFlow model
+# The server sends back the version it scored with, which changes when it is reloaded through another
+# worker. version follows it and on_version_change(model, version) is called so the manager can switch
+# the version it hands out, the scores carry the version they came from.
+class RemoteRankingModel:
+    def __init__(self, client, version, on_version_change=None):
+        self.client = client
+        self.version = version
+        self.on_version_change = on_version_change
+
+    def __call__(self, inputs):
+        version, scores = self.client.request('score', inputs)
+        if version != self.version:
+            logging.info(f"Inference server is now serving ranking model {version}, was {self.version}")
+            self.version = version
+            if self.on_version_change is not None:
+                self.on_version_change(self, version)
+        return NumpyScores(scores, version)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the ranking model to the web workers over a Unix socket")
+    parser.add_argument("--socket", default=os.environ.get("INFERENCE_SERVER_ADDRESS", INFERENCE_SERVER_ADDRESS))
+    parser.add_argument("--backend", default="tf", choices=["tf", "numpy"])
+    parser.add_argument("--version", default=None, help="ranking model version from ml_models/, the default version if not given")
+    parser.add_argument("--max-pending", type=int, default=64, help="score requests accepted at once before answering busy")
+    parser.add_argument("--batch-window-ms", type=float, default=3, help="how long a score request waits for others to share a model call")
+    parser.add_argument("--intra-op-threads", type=int, default=0, help="TensorFlow threads per operation, 0 lets TensorFlow decide")
+    parser.add_argument("--inter-op-threads", type=int, default=0, help="TensorFlow operations run at once, 0 lets TensorFlow decide")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    authkey = os.environ.get("INFERENCE_SERVER_AUTHKEY")
+    if not authkey:
+        raise SystemExit("Set INFERENCE_SERVER_AUTHKEY, the same secret the web workers are given")
+
+    from extensions import ranking_registry
+    from services.ranking_model import ModelManager
+    from services.inference_batcher import InferenceBatcher
+
+    if args.backend == "tf" and (args.intra_op_threads or args.inter_op_threads):
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(args.intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(args.inter_op_threads)
+
+    manager = ModelManager(ranking_registry, version=args.version, backend=args.backend)
+    started = time.perf_counter()
+    manager.get_active()
+    if not manager.is_ready():
+        raise SystemExit(f"Could not load the ranking model: {manager.error}")
+    logging.info(f"Loaded ranking model {manager.version} in {time.perf_counter() - started:.1f}s")
+
+    server = InferenceServer(args.socket, manager, InferenceBatcher(window_ms=args.batch_window_ms),
+                             authkey=authkey.encode(), max_pending=args.max_pending)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import threading
+import bisect
+from collections import deque
+
+# Small in-process metrics for the serving code, read through GET /health/metrics
+# Each worker process keeps its own values
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return {'type': 'counter', 'value': self.value}
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def snapshot(self):
+        return {'type': 'gauge', 'value': self.value}
+
+# The share of the last window observations that were true, such as the share of requests served by a fallback
+class Ratio:
+    def __init__(self, window=100):
+        self._values = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._values.append(bool(value))
+
+    @property
+    def value(self):
+        with self._lock:
+            return sum(self._values) / len(self._values) if self._values else None
+
+    def snapshot(self):
+        return {'type': 'ratio', 'value': self.value, 'window': len(self._values)}
+
+# Counts observations into fixed buckets, bucket i holds values up to buckets[i]
+# and the last one holds everything bigger
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            self.max = value if self.max is None else max(self.max, value)
+
+    # An estimate of the q quantile, the upper bound of the bucket it falls in
+    def quantile(self, q):
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        labels = [f'le_{bound}' for bound in self.buckets] + ['inf']
+        return {
+            'type': 'histogram',
+            'count': self.count,
+            'sum': round(self.total, 6),
+            'mean': round(self.total / self.count, 6) if self.count else None,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': dict(zip(labels, self.counts))
+        }
+
+# Named metrics, asking for the same name again returns the same metric
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, factory):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, factory())
+        return metric
+
+    def counter(self, name):
+        return self._get(name, Counter)
+
+    def gauge(self, name):
+        return self._get(name, Gauge)
+
+    def histogram(self, name, buckets):
+        return self._get(name, lambda: Histogram(buckets))
+
+    def ratio(self, name, window=100):
+        return self._get(name, lambda: Ratio(window))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in sorted(self._metrics.items())}
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+
+metrics = MetricsRegistry()
@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import os
+import shutil
+import tarfile
+import threading
+from services.ranking_model import load_model_version
+
+# Finds the versions of a model kept under ml_models/. A model can be stored as
+#   ml_models/<name>/saved_model.pb           the original unversioned model, its version is the fingerprint hash
+#   ml_models/<name>/<version>/saved_model.pb  a versioned subdirectory
+#   ml_models/<name>.tar.gz                    an archive, its version is the hash of the archive
+#   ml_models/<name>-<version>.tar.gz          a named archive
+# Archives are unpacked once into ml_models/.cache/<archive hash>/ and reused after that.
+# An archive holding the same model as one of the directories, by its fingerprint.pb, is the same version and
+# is left out, the directory is used as it needs no unpacking.
+class ModelRegistry:
+    def __init__(self, root, name, cache_dir=None):
+        self.root = root
+        self.name = name
+        self.cache_dir = cache_dir or os.path.join(root, '.cache')
+        self._digests = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    # This lists every version that can be loaded, the default version is first
+    def versions(self):
+        entries = {}
+        base = os.path.join(self.root, self.name)
+        if is_saved_model(base):
+            version = load_model_version(base)
+            entries[version] = {'version': version, 'source': 'directory', 'path': base}
+        if os.path.isdir(base):
+            subdirs = [d for d in os.listdir(base) if is_saved_model(os.path.join(base, d))]
+            for version in sorted(subdirs, key=version_sort_key, reverse=True):
+                entries.setdefault(version, {'version': version, 'source': 'directory', 'path': os.path.join(base, version)})
+        fingerprints = {load_model_version(entry['path']) for entry in entries.values()} - {'unknown'}
+        if os.path.isdir(self.root):
+            for filename in sorted(os.listdir(self.root)):
+                if not filename.endswith('.tar.gz'):
+                    continue
+                stem = filename[:-len('.tar.gz')]
+                if stem != self.name and not stem.startswith(self.name + '-'):
+                    continue
+                archive = os.path.join(self.root, filename)
+                if self._archive_fingerprint(archive) in fingerprints:
+                    continue
+                digest = self._archive_digest(archive)
+                version = stem[len(self.name) + 1:] if stem != self.name else digest
+                entries.setdefault(version, {'version': version, 'source': 'archive', 'archive': archive, 'digest': digest})
+        return list(entries.values())
+
+    def default_version(self):
+        versions = self.versions()
+        return versions[0]['version'] if versions else None
+
+    # This finds a version, None means the default one
+    def find(self, version=None):
+        for entry in self.versions():
+            if version is None or entry['version'] == str(version):
+                return entry
+        raise KeyError(f"Model version {version} not found for {self.name}")
+
+    # This returns the directory of a SavedModel for the version, unpacking archives if needed
+    def resolve(self, version=None):
+        entry = self.find(version)
+        if entry['source'] == 'archive':
+            return entry['version'], self._unpack(entry['archive'], entry['digest'])
+        return entry['version'], entry['path']
+
+    def _archive_digest(self, archive):
+        stat = os.stat(archive)
+        key = (archive, stat.st_size, stat.st_mtime)
+        digest = self._digests.get(key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(archive, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(block)
+            digest = sha.hexdigest()[:16]
+            self._digests[key] = digest
+        return digest
+
+    # This gives the same hash load_model_version gives for the model inside the archive, read without unpacking it,
+    # or None when the archive has no fingerprint.pb
+    def _archive_fingerprint(self, archive):
+        stat = os.stat(archive)
+        key = (archive, stat.st_size, stat.st_mtime)
+        if key not in self._fingerprints:
+            fingerprint = None
+            with tarfile.open(archive, 'r:gz') as tar:
+                for member in tar:
+                    if member.isfile() and os.path.basename(member.name) == 'fingerprint.pb':
+                        fingerprint = hashlib.sha256(tar.extractfile(member).read()).hexdigest()[:12]
+                        break
+            self._fingerprints[key] = fingerprint
+        return self._fingerprints[key]
+
+    def _unpack(self, archive, digest):
+        target = os.path.join(self.cache_dir, digest)
+        with self._lock:
+            if not os.path.isdir(target):
+                # Extracting into a temporary directory then renaming means a half written cache is never used
+                tmp = f"{target}.tmp-{os.getpid()}"
+                shutil.rmtree(tmp, ignore_errors=True)
+                os.makedirs(tmp)
+                with tarfile.open(archive, 'r:gz') as tar:
+                    tar.extractall(tmp, filter='data')
+                os.replace(tmp, target)
+                logging.info(f"Unpacked {archive} into {target}")
+        for dirpath, dirnames, filenames in os.walk(target):
+            if 'saved_model.pb' in filenames:
+                return dirpath
+        raise FileNotFoundError(f"No saved_model.pb found in {archive}")
+
+def is_saved_model(path):
+    return os.path.isfile(os.path.join(path, 'saved_model.pb'))
+
+# Numbered versions sort as numbers so 10 comes after 9
+def version_sort_key(version):
+    return (1, int(version), '') if version.isdigit() else (0, 0, version)
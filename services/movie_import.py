@@ -0,0 +1,145 @@
+import json
+import logging
+from sqlalchemy import insert
+from extensions import db
+from models.movie import Movie
+from models.actor import Actor
+from models.actor_movie import movie_actors
+from models.genre import split_genres, genre_mask, get_or_create_genres
+from models.genre_movie import movie_genres
+from models.movie_stats import MovieStats
+from services.catalog import bump_catalog_version
+
+# Bulk movie import for POST /movies/bulk. All rows are checked first, with one IN query for every
+# referenced actor, one IN query per batch for ids that already exist and one check per distinct image.
+# The valid rows are then written batch_size at a time, each batch as one executemany INSERT per table
+# in its own transaction, so a batch that fails leaves the batches before it saved.
+
+# The longest value each text field can hold, from the columns of the movie model
+FIELD_LENGTHS = {'id': 10, 'movie_title': 100, 'movie_genres': 100, 'description': 500}
+
+# This reads the request body as a list of movies, from a JSON array or from NDJSON with one movie per line
+# A line of NDJSON that is not valid JSON is kept as an error string so it gets its own result
+def read_movie_items(request):
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    items.append('line is not valid JSON')
+        return items
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        raise ValueError('Body must be a JSON array of movies or NDJSON with one movie per line')
+    return data
+
+# This checks the fields of one movie, returning (row, None) or (None, error)
+def validate_movie_item(item):
+    if not isinstance(item, dict):
+        return None, item if isinstance(item, str) else 'Each movie must be an object'
+    missing = [field for field in ('id', 'movie_title', 'movie_genres', 'image') if not item.get(field)]
+    if missing:
+        return None, f"Missing {', '.join(missing)}"
+    for field, length in FIELD_LENGTHS.items():
+        value = item.get(field)
+        if value is not None and (not isinstance(value, str) or len(value) > length):
+            return None, f"{field} must be text of {length} characters or less"
+    if not isinstance(item['image'], str):
+        return None, 'image must be a file name'
+    actor_ids = item.get('actor_ids', [item['actor_id']] if 'actor_id' in item else None)
+    if not isinstance(actor_ids, list) or not actor_ids or not all(isinstance(a, int) and not isinstance(a, bool) for a in actor_ids):
+        return None, 'actor_ids must be a non-empty list of actor ids'
+    return {
+        'id': item['id'],
+        'movie_title': item['movie_title'],
+        'movie_genres': item['movie_genres'],
+        'description': item.get('description'),
+        'image': item['image'],
+        'actor_ids': list(dict.fromkeys(actor_ids))
+    }, None
+
+# This validates every item and returns (rows, results), rows being (index, row) for the valid ones and
+# results having an error result at the index of each invalid one
+# image_error(filename) returns the error for an image or None, it is called once for each distinct filename
+def validate_movie_items(items, image_error, batch_size):
+    results = [None] * len(items)
+    rows = []
+    seen = set()
+    for index, item in enumerate(items):
+        row, error = validate_movie_item(item)
+        if error is None and row['id'] in seen:
+            error = f"Movie with ID {row['id']} is repeated in the request"
+        if error is not None:
+            results[index] = {'index': index, 'id': item.get('id') if isinstance(item, dict) else None, 'status': 'error', 'error': error}
+        else:
+            seen.add(row['id'])
+            rows.append((index, row))
+
+    actor_ids = {actor_id for _, row in rows for actor_id in row['actor_ids']}
+    found_actors = {actor_id for (actor_id,) in db.session.query(Actor.id).filter(Actor.id.in_(actor_ids))} if actor_ids else set()
+    existing = set()
+    for start in range(0, len(rows), batch_size):
+        ids = [row['id'] for _, row in rows[start:start + batch_size]]
+        existing.update(movie_id for (movie_id,) in db.session.query(Movie.id).filter(Movie.id.in_(ids)))
+    images = {}
+
+    valid = []
+    for index, row in rows:
+        if row['id'] in existing:
+            error = f"Movie with ID {row['id']} already exists"
+        elif not set(row['actor_ids']) <= found_actors:
+            error = f"Actor with ID {', '.join(str(a) for a in row['actor_ids'] if a not in found_actors)} not found"
+        else:
+            if row['image'] not in images:
+                images[row['image']] = image_error(row['image'])
+            error = images[row['image']]
+        if error is not None:
+            results[index] = {'index': index, 'id': row['id'], 'status': 'error', 'error': error}
+        else:
+            valid.append((index, row))
+    return valid, results
+
+# This writes one batch of valid rows in one transaction, one executemany INSERT per table
+# The movie_genres rows, genre_mask and movie_stats rows are set here because these INSERTs skip the ORM
+def insert_movie_batch(rows):
+    genres = get_or_create_genres(db.session, [name for row in rows for name in split_genres(row['movie_genres'])])
+    movies, actor_links, genre_links, stats = [], [], [], []
+    for row in rows:
+        genre_ids = [genres[name.lower()].id for name in split_genres(row['movie_genres'])]
+        movies.append({
+            'id': row['id'],
+            'movie_title': row['movie_title'],
+            'movie_genres': row['movie_genres'],
+            'description': row['description'],
+            'image_url': f"movies/{row['image']}",
+            'genre_mask': genre_mask(genre_ids)
+        })
+        actor_links += [{'movie_id': row['id'], 'actor_id': actor_id} for actor_id in row['actor_ids']]
+        genre_links += [{'movie_id': row['id'], 'genre_id': genre_id} for genre_id in genre_ids]
+        stats.append({'movie_id': row['id'], 'actors_count': len(row['actor_ids'])})
+    db.session.flush() # New genres go in before the rows that use them
+    db.session.execute(insert(Movie), movies)
+    db.session.execute(movie_actors.insert(), actor_links)
+    if genre_links:
+        db.session.execute(movie_genres.insert(), genre_links)
+    db.session.execute(insert(MovieStats), stats)
+    bump_catalog_version()
+    db.session.commit()
+
+# This imports the items and returns a result for each one, in the order they were sent
+def import_movies(items, image_error, batch_size=1000):
+    valid, results = validate_movie_items(items, image_error, batch_size)
+    for start in range(0, len(valid), batch_size):
+        batch = valid[start:start + batch_size]
+        try:
+            insert_movie_batch([row for _, row in batch])
+            outcome = {'status': 'created'}
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Bulk movie import batch at row {batch[0][0]} failed: {str(e)}")
+            outcome = {'status': 'error', 'error': 'The batch this movie was in could not be saved'}
+        for index, row in batch:
+            results[index] = {'index': index, 'id': row['id'], **outcome}
+    return results
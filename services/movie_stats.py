@@ -0,0 +1,132 @@
+import logging
+from sqlalchemy.dialects import postgresql, sqlite
+from extensions import db
+from models.movie import Movie
+from models.movie_stats import MovieStats
+from models.rating import Rating
+from models.reviews import Review
+from models.actor_movie import movie_actors
+
+# The fields of movie_stats that are totals, in the order the repair job reports them
+STATS_FIELDS = ['ratings_count', 'ratings_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+                'reviews_count', 'actors_count']
+
+# The histogram star a rating is counted under, ratings are rounded to the nearest star with halves going up
+def rating_star(rating):
+    return min(5, max(1, int(float(rating) + 0.5)))
+
+# This gives the changes to a movies totals when a rating is added, removed or changed from one value to another
+def rating_deltas(added=None, removed=None):
+    deltas = {}
+    for rating, sign in ((added, 1), (removed, -1)):
+        if rating is None:
+            continue
+        star = f'rating_{rating_star(rating)}'
+        deltas['ratings_count'] = deltas.get('ratings_count', 0) + sign
+        deltas['ratings_sum'] = deltas.get('ratings_sum', 0.0) + sign * float(rating)
+        deltas[star] = deltas.get(star, 0) + sign
+    return deltas
+
+# The databases with INSERT ... ON CONFLICT DO UPDATE, by the dialect name SQLAlchemy gives them
+UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+# This gives the insert() of the sessions database when it has ON CONFLICT DO UPDATE, or None when it does not
+# and the callers fall back to an UPDATE followed by an INSERT of the missing rows
+def upsert_insert(session):
+    return UPSERT_INSERTS.get(session.get_bind().dialect.name)
+
+# This adds the deltas to a movies totals in the current transaction, so call it before the commit of the change.
+# It is one INSERT ... ON CONFLICT DO UPDATE that adds to the stored values, so two requests changing the same
+# movie cannot overwrite each other, and a movie without a row yet gets one
+def update_movie_stats(movie_id, **deltas):
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    insert = upsert_insert(db.session)
+    if insert is None:
+        # The UPDATE still adds to the stored values, only two requests adding the first row at once can clash here
+        updated = MovieStats.query.filter_by(movie_id=movie_id).update(
+            {getattr(MovieStats, field): getattr(MovieStats, field) + value for field, value in deltas.items()},
+            synchronize_session=False
+        )
+        if not updated:
+            db.session.add(MovieStats(movie_id=movie_id, **dict(dict.fromkeys(STATS_FIELDS, 0), **deltas)))
+            db.session.flush()
+        return
+    statement = insert(MovieStats).values(movie_id=movie_id, **deltas)
+    statement = statement.on_conflict_do_update(
+        index_elements=[MovieStats.movie_id],
+        set_={field: getattr(MovieStats, field) + statement.excluded[field] for field in deltas}
+    )
+    db.session.execute(statement)
+
+# This takes one actor off the totals of each of the movies, when the actor is deleted
+def actor_removed(movie_ids):
+    if movie_ids:
+        MovieStats.query.filter(MovieStats.movie_id.in_(movie_ids)).update(
+            {MovieStats.actors_count: MovieStats.actors_count - 1}, synchronize_session=False
+        )
+
+def delete_movie_stats(movie_id):
+    MovieStats.query.filter_by(movie_id=movie_id).delete()
+
+# This reads the totals of every movie again from the ratings, reviews and movie_actors tables.
+# Returns {movie_id: {field: value}} for every movie, with zeros for movies with nothing
+def compute_movie_stats(session):
+    stats = {movie_id: dict.fromkeys(STATS_FIELDS, 0) for (movie_id,) in session.query(Movie.id)}
+    star = db.cast(Rating.rating + 0.5, db.Integer) # The same as rating_star for ratings from 1 to 5
+    ratings = session.query(
+        Rating.movie_id, db.func.count(Rating.id), db.func.sum(Rating.rating),
+        *[db.func.sum(db.case((star == value, 1), else_=0)) for value in range(1, 6)]
+    ).group_by(Rating.movie_id)
+    for movie_id, count, total, *histogram in ratings:
+        if movie_id in stats:
+            stats[movie_id].update(ratings_count=count, ratings_sum=float(total or 0),
+                                   **{f'rating_{value}': histogram[value - 1] for value in range(1, 6)})
+    for field, query in (
+        ('reviews_count', session.query(Review.movie_id, db.func.count(Review.id)).group_by(Review.movie_id)),
+        ('actors_count', session.query(movie_actors.c.movie_id, db.func.count()).group_by(movie_actors.c.movie_id))
+    ):
+        for movie_id, count in query:
+            if movie_id in stats:
+                stats[movie_id][field] = count
+    return stats
+
+# This is the repair job, it rebuilds movie_stats from the source tables and returns the drift it found,
+# a list of {movie_id, field, stored, actual} for each total that was wrong (a missing row is stored None)
+# With dry_run the table is left as it is
+def repair_movie_stats(session, dry_run=False):
+    actual = compute_movie_stats(session)
+    stored = {row.movie_id: row for row in session.query(MovieStats)}
+    drift = []
+    for movie_id, totals in actual.items():
+        row = stored.get(movie_id)
+        for field in STATS_FIELDS:
+            value = getattr(row, field) if row else None
+            if value is None or abs(value - totals[field]) > 1e-6:
+                drift.append({'movie_id': movie_id, 'field': field, 'stored': value, 'actual': totals[field]})
+    orphans = [movie_id for movie_id in stored if movie_id not in actual]
+    drift += [{'movie_id': movie_id, 'field': None, 'stored': 'row', 'actual': None} for movie_id in orphans]
+
+    if not dry_run:
+        if orphans:
+            session.query(MovieStats).filter(MovieStats.movie_id.in_(orphans)).delete(synchronize_session=False)
+        rows = [{'movie_id': movie_id, **totals} for movie_id, totals in actual.items()]
+        insert = upsert_insert(session)
+        if insert is None:
+            # The repair reads the stored rows above, so the rows are split into updates and inserts here
+            updates = [row for row in rows if row['movie_id'] in stored]
+            inserts = [row for row in rows if row['movie_id'] not in stored]
+            if updates:
+                session.execute(db.update(MovieStats), updates)
+            if inserts:
+                session.execute(db.insert(MovieStats), inserts)
+        elif rows:
+            statement = insert(MovieStats)
+            statement = statement.on_conflict_do_update(
+                index_elements=[MovieStats.movie_id], set_={field: statement.excluded[field] for field in STATS_FIELDS}
+            )
+            session.execute(statement, rows)
+        session.commit()
+    logging.info(f"movie_stats repair found {len(drift)} wrong totals over {len(actual)} movies")
+    return drift
@@ -0,0 +1,153 @@
+import json
+import os
+import numpy as np
+
+# Where the exported weights are kept, one directory per ranking model version
+RANKING_NUMPY_DIR = "ml_models/ranking_numpy"
+
+# The largest difference allowed between the NumPy scores and the TensorFlow scores
+# The export checks this on a sample before it writes the manifest
+NUMPY_TOLERANCE = 1e-4
+
+# Rows scored at a time, this keeps the 256 wide hidden layer small enough to stay in cache
+SCORE_CHUNK_ROWS = 4096
+
+# The scores from NumpyRankingModel, numpy() matches the TensorFlow result so the routes work with either
+class NumpyScores:
+    def __init__(self, scores, version=None):
+        self.scores = scores
+        self.version = version
+
+    def numpy(self):
+        return self.scores
+
+# The ranking model reimplemented with NumPy from the weights written by export_ranking_weights
+# The model looks up a user and a movie embedding, joins them and runs them through dense layers
+# with relu between them. The first dense layer is split into a user half and a movie half and
+# both halves are applied to the embedding tables when loading, so a row only needs two lookups,
+# an add and the smaller layers after it.
+class NumpyRankingModel:
+    def __init__(self, path):
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"))
+
+        self.user_lookup = _vocab_lookup(load("user_vocab"))
+        self.movie_lookup = _vocab_lookup(load("movie_vocab"))
+        user_embeddings = load("user_embeddings")
+        movie_embeddings = load("movie_embeddings")
+
+        layers = [(load(f"dense_{i}_kernel"), load(f"dense_{i}_bias")) for i in range(self.manifest["dense_layers"])]
+        kernel, bias = layers[0]
+        user_dims = user_embeddings.shape[1]
+        self.user_hidden = user_embeddings @ kernel[:user_dims]
+        self.movie_hidden = movie_embeddings @ kernel[user_dims:] + bias
+        self.layers = layers[1:]
+
+    def __call__(self, inputs):
+        users = self._indices(self.user_lookup, inputs["user_id"])
+        movies = self._indices(self.movie_lookup, inputs["movie_title"])
+        scores = np.empty((len(users), 1), dtype=np.float32)
+        for start in range(0, len(users), SCORE_CHUNK_ROWS):
+            end = start + SCORE_CHUNK_ROWS
+            scores[start:end] = self._score(users[start:end], movies[start:end])
+        return NumpyScores(scores)
+
+    def _score(self, users, movies):
+        hidden = np.take(self.user_hidden, users, axis=0)
+        hidden += np.take(self.movie_hidden, movies, axis=0)
+        for kernel, bias in self.layers:
+            np.maximum(hidden, 0, out=hidden)
+            hidden = hidden @ kernel + bias
+        return hidden
+
+    # Unknown values go to row 0, the same out of vocabulary row the StringLookup layers use
+    def _indices(self, lookup, values):
+        values = np.asarray(values, dtype=object).ravel()
+        return np.fromiter((lookup.get(value, 0) for value in values), dtype=np.intp, count=len(values))
+
+# Maps each vocabulary value to its embedding row, as str and bytes since the model accepts both
+def _vocab_lookup(vocab):
+    lookup = {}
+    for index, value in enumerate(vocab.tolist(), start=1):
+        lookup[value] = index
+        lookup[value.encode("utf-8")] = index
+    return lookup
+
+# Reads the StringLookup vocabularies out of the saved graph, they are stored as pairs of
+# constants, the string keys and the int64 row each one maps to
+def read_vocabularies(model_path):
+    from tensorflow.core.protobuf import saved_model_pb2
+    from tensorflow.python.framework import tensor_util
+
+    saved_model = saved_model_pb2.SavedModel()
+    with open(os.path.join(model_path, "saved_model.pb"), "rb") as f:
+        saved_model.ParseFromString(f.read())
+    constants = [
+        tensor_util.MakeNdarray(node.attr["value"].tensor)
+        for node in saved_model.meta_graphs[0].graph_def.node
+        if node.op == "Const" and node.attr["value"].tensor.tensor_shape.dim
+    ]
+
+    vocabularies = []
+    for values, keys in zip(constants, constants[1:]):
+        if values.dtype == np.int64 and keys.dtype == object and values.shape == keys.shape:
+            vocab = np.empty(int(values.max()), dtype=object)
+            vocab[values - 1] = [key.decode("utf-8") for key in keys]
+            vocabularies.append(vocab.astype(str))
+    return vocabularies
+
+# This writes the embedding tables, dense weights and vocabularies of a ranking SavedModel to .npy files
+# and checks the NumPy model against TensorFlow on a sample of users and movies
+def export_ranking_weights(model_path, out_dir, version, sample_rows=20000, seed=0):
+    import tensorflow as tf
+
+    model = tf.saved_model.load(model_path)
+    embeddings = [v.numpy() for v in model.variables if "embeddings" in v.name]
+    kernels = [v.numpy() for v in model.variables if "kernel" in v.name]
+    biases = [v.numpy() for v in model.variables if "bias" in v.name]
+
+    # The vocabularies are matched to the embedding tables by size, each table has one extra row for unknown values
+    vocabularies = {len(vocab) + 1: vocab for vocab in read_vocabularies(model_path)}
+    user_embeddings, movie_embeddings = embeddings
+    arrays = {
+        "user_vocab": vocabularies[user_embeddings.shape[0]],
+        "user_embeddings": user_embeddings,
+        "movie_vocab": vocabularies[movie_embeddings.shape[0]],
+        "movie_embeddings": movie_embeddings
+    }
+    for i, (kernel, bias) in enumerate(zip(kernels, biases)):
+        arrays[f"dense_{i}_kernel"] = kernel
+        arrays[f"dense_{i}_bias"] = bias
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), array, allow_pickle=False)
+    manifest = {
+        "version": version,
+        "source": model_path,
+        "dense_layers": len(kernels),
+        "tolerance": NUMPY_TOLERANCE
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Random pairs, including values outside the vocabularies, are scored by both models
+    rng = np.random.default_rng(seed)
+    users = np.append(arrays["user_vocab"], "unknown user").astype(object)
+    titles = np.append(arrays["movie_vocab"], "Unknown Movie (1900)").astype(object)
+    sample = {
+        "user_id": users[rng.integers(len(users), size=sample_rows)],
+        "movie_title": titles[rng.integers(len(titles), size=sample_rows)]
+    }
+    expected = model(sample).numpy()
+    actual = NumpyRankingModel(out_dir)(sample).numpy()
+    max_diff = float(np.max(np.abs(expected - actual)))
+    if max_diff > NUMPY_TOLERANCE:
+        raise ValueError(f"NumPy scores differ from TensorFlow by {max_diff}, more than {NUMPY_TOLERANCE}")
+
+    manifest["max_abs_diff"] = max_diff
+    manifest["checked_rows"] = sample_rows
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
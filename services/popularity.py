@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+import numpy as np
+
+# The most popular movies from the ratings table, used to answer /ranking when the model cannot.
+# Each movie keeps a rating count and sum. They are read with one grouped query and then kept up to
+# date by the rating routes, so a new rating is a dict update rather than a new query.
+# Movies are ordered by a Bayesian average so a movie with one 5 star rating does not beat one with
+# hundreds of 4.5s, then by count. Movies without ratings score the overall average.
+#   score = (prior_weight * overall_average + sum of ratings) / (prior_weight + number of ratings)
+# The totals are read again every reload_seconds so ratings made through other workers are picked up.
+class PopularityRanking:
+    def __init__(self, prior_weight=5, reload_seconds=600):
+        self.prior_weight = prior_weight
+        self.reload_seconds = reload_seconds
+        self._totals = None
+        self._loaded_at = 0
+        self._order = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.prior_weight = app.config.get('POPULARITY_PRIOR_WEIGHT', self.prior_weight)
+        self.reload_seconds = app.config.get('POPULARITY_RELOAD_SECONDS', self.reload_seconds)
+        with self._lock:
+            self._totals = None
+            self._order = None
+
+    # These are called by the rating routes once the change is committed
+    def rating_added(self, movie_id, rating):
+        self._update(movie_id, rating, 1)
+
+    def rating_changed(self, movie_id, old_rating, new_rating):
+        self._update(movie_id, new_rating - old_rating, 0)
+
+    def rating_removed(self, movie_id, rating):
+        self._update(movie_id, -rating, -1)
+
+    # This returns the top k movies of the catalog snapshot with their popularity score
+    def top(self, snapshot, k):
+        totals = self._get_totals()
+        with self._lock:
+            if self._order is None or self._order[0] != snapshot.version:
+                self._order = (snapshot.version,) + self._rank(snapshot, totals)
+            _, order, scores = self._order
+        return [dict(snapshot.movie(index), rating=float(scores[index])) for index in order[:k]]
+
+    def _rank(self, snapshot, totals):
+        sums = np.zeros(len(snapshot))
+        counts = np.zeros(len(snapshot))
+        for index, movie_id in enumerate(snapshot.ids):
+            entry = totals.get(movie_id)
+            if entry is not None:
+                sums[index], counts[index] = entry
+        overall = sums.sum() / counts.sum() if counts.sum() else 0.0
+        scores = (self.prior_weight * overall + sums) / (self.prior_weight + counts)
+        return np.lexsort((-counts, -scores)), scores
+
+    def _update(self, movie_id, rating, count):
+        with self._lock:
+            # Before the first load there is nothing to update, the load reads the committed rating
+            if self._totals is None:
+                return
+            entry = self._totals.setdefault(movie_id, [0.0, 0])
+            entry[0] += rating
+            entry[1] += count
+            self._order = None
+
+    def _get_totals(self):
+        totals = self._totals
+        if totals is not None and time.monotonic() - self._loaded_at < self.reload_seconds:
+            return totals
+        # Imported here as the models import extensions, where this is created
+        from extensions import db
+        from models.rating import Rating
+
+        rows = db.session.query(Rating.movie_id, db.func.sum(Rating.rating), db.func.count(Rating.id)).group_by(Rating.movie_id)
+        totals = {movie_id: [float(total), count] for movie_id, total, count in rows}
+        with self._lock:
+            self._totals = totals
+            self._loaded_at = time.monotonic()
+            self._order = None
+        logging.debug(f"Loaded popularity totals for {len(totals)} movies")
+        return totals
@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+
+# Bounded LRU cache for the top ranked movies of each user.
+# Entries are keyed by (user_id, model_version, catalog_version) so a new model or
+# a changed catalog never serves an old result, and rating writes drop the users entries.
+# ratings_version is the shared ratings version the entries were last checked against, writes made
+# through other workers are found from it, see sync_ranking_cache in routes/ranking_routes.py.
+class RankingCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._catalog_version = None
+        self.ratings_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Reads the cache size from the app config and starts with an empty cache
+    def init_app(self, app):
+        self.max_entries = app.config.get('RANKING_CACHE_SIZE', self.max_entries)
+        self.clear()
+
+    def get(self, user_id, model_version, catalog_version):
+        key = (str(user_id), model_version, catalog_version)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, user_id, model_version, catalog_version, value):
+        if self.max_entries <= 0:
+            return
+        key = (str(user_id), model_version, catalog_version)
+        with self._lock:
+            # Entries built from an older catalog can never be read again, so they are dropped straight away
+            if catalog_version != self._catalog_version:
+                self._clear_entries()
+                self._catalog_version = catalog_version
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._user_keys.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget_user_key(old_key)
+
+    # True if any result is cached for the user, only users with ratings are ranked by the model and
+    # cached, and rating writes drop the users entries. Call it after sync_ranking_cache
+    def has_user(self, user_id):
+        with self._lock:
+            return str(user_id) in self._user_keys
+
+    # This removes every cached result for a user, used when their ratings change
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in self._user_keys.pop(str(user_id), set()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._clear_entries()
+            self._catalog_version = None
+            self.ratings_version = None
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _clear_entries(self):
+        self._entries.clear()
+        self._user_keys.clear()
+
+    def _forget_user_key(self, key):
+        keys = self._user_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,243 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+# The model version comes from the SavedModel fingerprint so results change with the model
+def load_model_version(path):
+    try:
+        with open(os.path.join(path, "fingerprint.pb"), "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:12]
+    except OSError:
+        return "unknown"
+
+# This returns the indices of the k highest scores, best first
+# argpartition finds the top k in linear time so only those k are sorted
+def top_k_indices(scores, k):
+    scores = np.asarray(scores)
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    if k < scores.shape[-1]:
+        top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        top = np.broadcast_to(np.arange(k), scores.shape[:-1] + (k,))
+    order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1, kind='stable')
+    return np.take_along_axis(top, order, axis=-1)
+
+# Loads the ranking model on first use or on a background thread instead of at import time.
+# TensorFlow is only imported here, so creating the app, the tests and the seeders do not pay for it
+# unless a model is actually needed. A warm-up call is made before the model is marked ready so the
+# first real request does not pay for graph tracing.
+# The model and its version are held together and replaced in one assignment, so a reload never
+# mixes them up and requests that already have the old model finish with it.
+# With the remote backend the model lives in services/inference_server.py and this only holds a client for it.
+class ModelManager:
+    UNLOADED = 'unloaded'
+    LOADING = 'loading'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    def __init__(self, registry, version=None, backend='tf', numpy_dir=None, warmup_rows=2048, warmup_runs=2):
+        self.registry = registry
+        self.requested_version = version
+        self.backend = backend
+        self.numpy_dir = numpy_dir
+        self.warmup_rows = warmup_rows
+        self.warmup_runs = warmup_runs
+        self.state = self.UNLOADED
+        self.error = None
+        self.path = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.reload_state = None
+        self.reload_version = None
+        self.reload_error = None
+        self.client = None
+        self.remote_timeout = 30
+        self._active = (None, None)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    # The version of the model currently serving requests
+    @property
+    def version(self):
+        return self._active[0]
+
+    # Starts loading in the background when RANKING_MODEL_PRELOAD is on
+    def init_app(self, app):
+        self.warmup_rows = app.config.get('RANKING_WARMUP_ROWS', self.warmup_rows)
+        self.requested_version = app.config.get('RANKING_MODEL_VERSION', self.requested_version)
+        self.backend = app.config.get('RANKING_BACKEND', self.backend)
+        self.numpy_dir = app.config.get('RANKING_NUMPY_DIR', self.numpy_dir)
+        self.remote_timeout = app.config.get('RANKING_MODEL_WAIT_SECONDS', 30)
+        if self.backend == 'remote':
+            from services.inference_server import InferenceClient
+            authkey = app.config.get('INFERENCE_SERVER_AUTHKEY')
+            self.client = InferenceClient(
+                app.config.get('INFERENCE_SERVER_ADDRESS'),
+                authkey=authkey.encode() if authkey else None,
+                pool_size=app.config.get('INFERENCE_SERVER_CONNECTIONS', 4),
+                timeout=app.config.get('INFERENCE_SERVER_TIMEOUT', 5.0)
+            )
+        if app.config.get('RANKING_MODEL_PRELOAD', True):
+            self.start_background_load()
+
+    def start_background_load(self):
+        with self._lock:
+            if self.state != self.UNLOADED:
+                return
+            self.state = self.LOADING
+        threading.Thread(target=self._load, name='ranking-model-loader', daemon=True).start()
+
+    # This returns (version, model), loading the model now if nothing has started it yet
+    # If another thread is loading it waits up to timeout seconds and returns (None, None) if it is still not ready
+    def get_active(self, timeout=None):
+        if self.state == self.READY:
+            return self._active
+        start_here = False
+        with self._lock:
+            # The inference server may start after the web workers, so a failed connection is tried again
+            if self.state == self.UNLOADED or (self.state == self.FAILED and self.backend == 'remote'):
+                self.state = self.LOADING
+                start_here = True
+        if start_here:
+            self._load()
+        else:
+            self._done.wait(timeout)
+        return self._active if self.state == self.READY else (None, None)
+
+    # This returns just the loaded model
+    def get(self, timeout=None):
+        return self.get_active(timeout)[1]
+
+    def is_ready(self):
+        return self.state == self.READY
+
+    # Loads another version on a background thread and switches to it once its warm-up passes
+    # The current model keeps serving until then, and stays if the new version fails to load
+    def reload(self, version=None):
+        entry = self.registry.find(version)
+        with self._lock:
+            if self.reload_state == self.LOADING:
+                raise RuntimeError(f"Ranking model {self.reload_version} is already being loaded")
+            self.reload_state = self.LOADING
+            self.reload_version = entry['version']
+            self.reload_error = None
+        threading.Thread(target=self._reload, args=(entry['version'],), name='ranking-model-reloader', daemon=True).start()
+        return entry['version']
+
+    def status(self):
+        return {
+            'state': self.state,
+            'version': self.version,
+            'backend': self.backend,
+            'path': self.path,
+            'load_seconds': self.load_seconds,
+            'warmup_seconds': self.warmup_seconds,
+            'error': self.error,
+            'reload': {
+                'state': self.reload_state,
+                'version': self.reload_version,
+                'error': self.reload_error
+            }
+        }
+
+    def _load(self):
+        try:
+            self._activate(*self._load_version(self.requested_version))
+            logging.info(f"Ranking model {self.version} ready, load {self.load_seconds}s, warm-up {self.warmup_seconds}s")
+        except Exception as e:
+            self.error = str(e)
+            self.state = self.FAILED
+            logging.error(f"Error loading ranking model: {e}")
+        finally:
+            self._done.set()
+
+    # Loads a version and switches to it on this thread, it does nothing if the version is already serving
+    def load_now(self, version=None):
+        if self.backend != 'remote' and self.is_ready() and self.registry.find(version)['version'] == self.version:
+            return self.version
+        self._activate(*self._load_version(version))
+        self._done.set()
+        return self.version
+
+    def _reload(self, version):
+        try:
+            self.load_now(version)
+            self.reload_state = self.READY
+            logging.info(f"Switched ranking model to {version}, load {self.load_seconds}s, warm-up {self.warmup_seconds}s")
+        except Exception as e:
+            self.reload_error = str(e)
+            self.reload_state = self.FAILED
+            logging.error(f"Error reloading ranking model {version}, keeping {self.version}: {e}")
+        finally:
+            self._done.set()
+
+    # Loads and warms up a version without touching the model that is serving
+    def _load_version(self, version):
+        if self.backend == 'remote':
+            return self._load_remote(version)
+        version, path = self.registry.resolve(version)
+        started = time.perf_counter()
+        model = self._load_model(version, path)
+        load_seconds = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        self._warm_up(model)
+        warmup_seconds = round(time.perf_counter() - started, 3)
+        return version, path, model, load_seconds, warmup_seconds
+
+    # The inference server loads and warms up the version itself, a version of None keeps what it is serving
+    def _load_remote(self, version):
+        from services.inference_server import RemoteRankingModel
+        if self.client is None:
+            raise RuntimeError("The remote backend needs INFERENCE_SERVER_ADDRESS to be set")
+        started = time.perf_counter()
+        if version is None:
+            status, = self.client.request('status', timeout=self.remote_timeout)
+        else:
+            status, = self.client.request('reload', version, timeout=self.remote_timeout)
+        load_seconds = round(time.perf_counter() - started, 3)
+        model = RemoteRankingModel(self.client, status['version'], on_version_change=self._remote_version_changed)
+        return status['version'], self.client.address, model, load_seconds, status['warmup_seconds']
+
+    # The numpy backend reads the weights written by seeders/export_ranking_weights.py, so
+    # TensorFlow is never imported by a worker using it
+    def _load_model(self, version, path):
+        if self.backend == 'numpy':
+            from services.numpy_ranking import NumpyRankingModel, RANKING_NUMPY_DIR
+            export_dir = os.path.join(self.numpy_dir or RANKING_NUMPY_DIR, version)
+            if not os.path.isdir(export_dir):
+                raise FileNotFoundError(f"No NumPy export for ranking model {version}, run seeders/export_ranking_weights.py --version {version}")
+            return NumpyRankingModel(export_dir)
+        if self.backend != 'tf':
+            raise ValueError(f"Unknown ranking backend {self.backend}, use tf or numpy")
+        import tensorflow as tf
+        return tf.saved_model.load(path)
+
+    def _activate(self, version, path, model, load_seconds, warmup_seconds):
+        with self._lock:
+            self._active = (version, model)
+            self.path = path
+            self.load_seconds = load_seconds
+            self.warmup_seconds = warmup_seconds
+            self.error = None
+            self.state = self.READY
+
+    # The inference server was reloaded by someone else, so the version handed out with its model follows it
+    def _remote_version_changed(self, model, version):
+        with self._lock:
+            if self._active[1] is model:
+                self._active = (version, model)
+
+    # Runs the model on a request sized input so the call graph is built before real traffic
+    def _warm_up(self, model):
+        input_data = {
+            "user_id": np.full(self.warmup_rows, "1", dtype=object),
+            "movie_title": np.full(self.warmup_rows, "", dtype=object)
+        }
+        for _ in range(self.warmup_runs):
+            model(input_data)
@@ -0,0 +1,242 @@
+import json
+import logging
+import os
+import threading
+import numpy as np
+from services.ranking_model import load_model_version, top_k_indices
+
+# Location of the TensorFlow retrieval model and the embeddings exported from it
+RETRIEVAL_MODEL_PATH = "ml_models/retrieval_model"
+RETRIEVAL_NUMPY_DIR = "ml_models/retrieval_numpy"
+
+# The retrieval model is a ScaNN index that needs the ScaNN custom ops to load. Its embeddings are read
+# straight from the checkpoint instead, which works with plain TensorFlow:
+#   variables/0  the user embedding table, row 0 is for unknown users
+#   identifiers  the movie titles, one per indexed movie
+#   variables/2  the partition each movie was put in
+#   variables/5  the quantized codes of each movie, one byte per block of two dimensions
+#   variables/1  the codebooks the codes point into
+#   variables/9  the partitioner, which holds the partition centers
+# A movie embedding is its partition center plus the codebook entries of its codes.
+
+# Reads a protobuf message into a list of (field number, value) without needing its .proto file
+def _proto_fields(data):
+    fields = []
+    i = 0
+    while i < len(data):
+        key, i = _varint(data, i)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, i = _varint(data, i)
+        elif wire_type == 1:
+            value, i = data[i:i + 8], i + 8
+        elif wire_type == 2:
+            length, i = _varint(data, i)
+            value, i = data[i:i + length], i + length
+        elif wire_type == 5:
+            value, i = data[i:i + 4], i + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        fields.append((number, value))
+    return fields
+
+def _varint(data, i):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return result, i
+
+# Each codebook is a block of centers in field 1, each center holds its two float32 values in field 4
+def _decode_codebooks(data):
+    return [
+        np.stack([np.frombuffer(dict(_proto_fields(center))[4], dtype='<f4') for _, center in _proto_fields(block)])
+        for number, block in _proto_fields(data) if number == 1
+    ]
+
+# The partition centers are nested three messages down in field 1, each holds its float64 values in field 1
+def _decode_partition_centers(data):
+    message = _proto_fields(data)[1][1]
+    for _ in range(2):
+        message = _proto_fields(message)[0][1]
+    return np.stack([
+        np.frombuffer(dict(_proto_fields(center))[1], dtype='<f8')
+        for number, center in _proto_fields(message) if number == 1
+    ]).astype(np.float32)
+
+# This reads the user and movie embeddings out of the retrieval checkpoint and saves them as .npy files
+def export_retrieval_embeddings(model_path, out_dir):
+    import tensorflow as tf
+    from services.numpy_ranking import read_vocabularies
+
+    reader = tf.train.load_checkpoint(os.path.join(model_path, "variables", "variables"))
+    tensor = lambda name: reader.get_tensor(f"{name}/.ATTRIBUTES/VARIABLE_VALUE")
+
+    codebooks = _decode_codebooks(tensor("variables/1")[0])
+    codes = tensor("variables/5")
+    centers = _decode_partition_centers(tensor("variables/9")[0])
+    assignments = tensor("variables/2").astype(np.int32)
+    residuals = np.concatenate([codebook[codes[:, block]] for block, codebook in enumerate(codebooks)], axis=1)
+
+    user_embeddings = tensor("variables/0")
+    user_vocab = next(vocab for vocab in read_vocabularies(model_path) if len(vocab) + 1 == user_embeddings.shape[0])
+    arrays = {
+        "user_vocab": user_vocab,
+        "user_embeddings": user_embeddings,
+        "movie_titles": np.array([title.decode("utf-8") for title in tensor("identifiers")]),
+        "movie_embeddings": (centers[assignments] + residuals).astype(np.float32),
+        "partition_centers": centers,
+        "partition_assignments": assignments
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), array, allow_pickle=False)
+    manifest = {
+        "version": load_model_version(model_path),
+        "source": model_path,
+        "users": len(user_vocab),
+        "movies": len(arrays["movie_titles"]),
+        "partitions": len(centers),
+        "dimensions": int(user_embeddings.shape[1])
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+# This loads the exported embeddings, extracting them from the checkpoint first if there is no export yet
+def load_retrieval_embeddings(model_path=RETRIEVAL_MODEL_PATH, export_dir=RETRIEVAL_NUMPY_DIR):
+    if not os.path.isfile(os.path.join(export_dir, "manifest.json")):
+        logging.info(f"No retrieval export in {export_dir}, extracting embeddings from {model_path}")
+        export_retrieval_embeddings(model_path, export_dir)
+    with open(os.path.join(export_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    arrays = {
+        name: np.load(os.path.join(export_dir, f"{name}.npy"))
+        for name in ("user_vocab", "user_embeddings", "movie_titles", "movie_embeddings",
+                     "partition_centers", "partition_assignments")
+    }
+    return manifest, arrays
+
+# In-memory index over the movies of one catalog snapshot that the retrieval model has embeddings for.
+# Row i of the index is row movie_rows[i] of the snapshot, so results map straight back to database ids.
+# exact scores every movie with one matrix-vector product. ivf only scores the movies in the
+# nprobe partitions whose centers are closest to the user, using the partitions the model was built with.
+class RetrievalIndex:
+    def __init__(self, embeddings, snapshot):
+        self.version = embeddings["version"]
+        self.catalog_version = snapshot.version
+        self.snapshot = snapshot
+        self.user_lookup = {user: row for row, user in enumerate(embeddings["user_vocab"].tolist(), start=1)}
+        self.user_embeddings = embeddings["user_embeddings"]
+
+        rows_by_title = {title: row for row, title in enumerate(embeddings["movie_titles"].tolist())}
+        matches = [(i, rows_by_title[title]) for i, title in enumerate(snapshot.titles) if title in rows_by_title]
+        self.movie_rows = np.array([i for i, _ in matches], dtype=np.intp)
+        embedding_rows = np.array([row for _, row in matches], dtype=np.intp)
+        self.movie_embeddings = np.ascontiguousarray(embeddings["movie_embeddings"][embedding_rows])
+        self.row_by_id = {snapshot.ids[i]: row for row, i in enumerate(self.movie_rows)}
+
+        # The members of each partition, as rows of this index
+        self.partition_centers = embeddings["partition_centers"]
+        assignments = embeddings["partition_assignments"][embedding_rows]
+        self.partitions = [np.flatnonzero(assignments == p) for p in range(len(self.partition_centers))]
+
+    def __len__(self):
+        return len(self.movie_rows)
+
+    # This returns the mask of movies in any of the genres, or None if no genre is given
+    # It is a bitwise AND over the genre masks of the catalog snapshot
+    def genre_mask(self, genres):
+        if not genres:
+            return None
+        return self.snapshot.genre_filter(genres)[self.movie_rows]
+
+    # This removes movies from a mask by id, each id is one dict lookup so the cost follows
+    # the number of excluded movies rather than the size of the catalog
+    def exclude(self, mask, movie_ids):
+        rows = [self.row_by_id[movie_id] for movie_id in movie_ids if movie_id in self.row_by_id]
+        if not rows:
+            return mask
+        mask = np.ones(len(self), dtype=bool) if mask is None else mask.copy()
+        mask[rows] = False
+        return mask
+
+    def user_vector(self, user_id):
+        return self.user_embeddings[self.user_lookup.get(str(user_id), 0)]
+
+    # This returns (index rows, scores) of the best n movies for the user, best first
+    def search(self, user_id, n, mask=None, mode="exact", nprobe=10):
+        query = self.user_vector(user_id)
+        if mode == "ivf":
+            probe = top_k_indices(self.partition_centers @ query, nprobe)
+            candidates = np.concatenate([self.partitions[p] for p in probe])
+        elif mode == "exact":
+            candidates = None
+        else:
+            raise ValueError("mode must be exact or ivf")
+
+        if mask is not None:
+            candidates = np.flatnonzero(mask) if candidates is None else candidates[mask[candidates]]
+        if candidates is None:
+            scores = self.movie_embeddings @ query
+            top = top_k_indices(scores, n)
+            return top, scores[top]
+        scores = self.movie_embeddings[candidates] @ query
+        top = top_k_indices(scores, n)
+        return candidates[top], scores[top]
+
+    # The response fields for a row of the index
+    def movie(self, row):
+        return self.snapshot.movie(self.movie_rows[row])
+
+# Loads the embeddings once and rebuilds the index when the movie catalog changes
+class RetrievalService:
+    def __init__(self, model_path=RETRIEVAL_MODEL_PATH, export_dir=RETRIEVAL_NUMPY_DIR):
+        self.model_path = model_path
+        self.export_dir = export_dir
+        self.error = None
+        self._embeddings = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.model_path = app.config.get('RETRIEVAL_MODEL_PATH', self.model_path)
+        self.export_dir = app.config.get('RETRIEVAL_NUMPY_DIR', self.export_dir)
+        self._index = None # Catalog versions are per database, so an index built for another app is dropped
+        if app.config.get('RETRIEVAL_PRELOAD', True):
+            self._load_embeddings()
+
+    def _load_embeddings(self):
+        with self._lock:
+            if self._embeddings is None:
+                try:
+                    manifest, arrays = load_retrieval_embeddings(self.model_path, self.export_dir)
+                    self._embeddings = dict(arrays, version=manifest["version"])
+                    self.error = None
+                except Exception as e:
+                    self.error = str(e)
+                    logging.error(f"Error loading retrieval embeddings: {e}")
+        return self._embeddings
+
+    # This returns the index for the current catalog, or None if the embeddings or movies are not available
+    def get_index(self):
+        # Imported here as the catalog imports the models, which import extensions where this service is created
+        from services.catalog import get_catalog_snapshot
+
+        embeddings = self._embeddings or self._load_embeddings()
+        snapshot = get_catalog_snapshot()
+        if embeddings is None or snapshot is None:
+            return None
+        index = self._index
+        if index is not None and index.catalog_version == snapshot.version:
+            return index
+        with self._lock:
+            if self._index is None or self._index.catalog_version != snapshot.version:
+                self._index = RetrievalIndex(embeddings, snapshot)
+                logging.debug(f"Built retrieval index with {len(self._index)} movies for catalog {snapshot.version}")
+            return self._index
@@ -0,0 +1,127 @@
+import re
+from sqlalchemy import bindparam, event, text
+from extensions import db
+
+# Full text search over the movie titles and descriptions and the review content, using SQLite FTS5.
+# movie_fts keeps its own copy of the title and description with the movie id, as the movie table has
+# a text primary key and its hidden rowid can change on VACUUM. review_fts is an external content
+# index over the reviews table, whose integer id is a stable rowid. Triggers keep both in step with
+# every insert, update and delete, including bulk ones that skip the ORM.
+# The porter tokenizer matches word stems, so "fighting" finds "fight" and "fights".
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS movie_fts USING fts5(
+        movie_id UNINDEXED, movie_title, description, tokenize = 'porter unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS movie_fts_insert AFTER INSERT ON movie BEGIN
+        INSERT INTO movie_fts (movie_id, movie_title, description) VALUES (new.id, new.movie_title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movie_fts_delete AFTER DELETE ON movie BEGIN
+        DELETE FROM movie_fts WHERE movie_id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS movie_fts_update AFTER UPDATE OF id, movie_title, description ON movie BEGIN
+        DELETE FROM movie_fts WHERE movie_id = old.id;
+        INSERT INTO movie_fts (movie_id, movie_title, description) VALUES (new.id, new.movie_title, new.description);
+    END""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS review_fts USING fts5(
+        content, content = 'reviews', content_rowid = 'id', tokenize = 'porter unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS review_fts_insert AFTER INSERT ON reviews BEGIN
+        INSERT INTO review_fts (rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS review_fts_delete AFTER DELETE ON reviews BEGIN
+        INSERT INTO review_fts (review_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS review_fts_update AFTER UPDATE OF content ON reviews BEGIN
+        INSERT INTO review_fts (review_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO review_fts (rowid, content) VALUES (new.id, new.content);
+    END"""
+]
+
+# Fills both indexes again from their tables, for rows written before the triggers existed
+SEARCH_INDEX_REBUILD = [
+    "DELETE FROM movie_fts",
+    "INSERT INTO movie_fts (movie_id, movie_title, description) SELECT id, movie_title, description FROM movie",
+    "INSERT INTO review_fts (review_fts) VALUES ('rebuild')"
+]
+
+# How a title match counts against a description match, and a review match against a movie match
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+REVIEW_WEIGHT = 0.5
+
+# The matched words are wrapped in these in the snippets, with about SNIPPET_TOKENS words around them
+SNIPPET_START = '['
+SNIPPET_END = ']'
+SNIPPET_TOKENS = 12
+
+# At most this many words of a query are searched for
+MAX_QUERY_TERMS = 10
+
+# Each movie is given its best scoring hit, from its own text or from one of its reviews.
+# bm25() is lower for better matches, so the scores are sorted ascending. When a query has one MIN(),
+# SQLite takes the other bare columns of the group (the hit rowid and where it matched) from that row.
+SEARCH_SQL = text(f"""
+WITH hits AS (
+    SELECT movie_id, rowid AS hit_id, bm25(movie_fts, 0.0, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT}) AS score, 'movie' AS matched_in
+    FROM movie_fts WHERE movie_fts MATCH :query
+    UNION ALL
+    SELECT reviews.movie_id, review_fts.rowid, bm25(review_fts) * {REVIEW_WEIGHT}, 'review'
+    FROM review_fts JOIN reviews ON reviews.id = review_fts.rowid WHERE review_fts MATCH :query
+), best AS (
+    SELECT movie_id, MIN(score) AS score, hit_id, matched_in FROM hits GROUP BY movie_id
+)
+SELECT movie.id, movie.movie_title, movie.movie_genres, movie.image_url, best.score, best.hit_id, best.matched_in
+FROM best JOIN movie ON movie.id = best.movie_id
+ORDER BY best.score, movie.id
+LIMIT :limit OFFSET :offset
+""")
+
+# snippet() is slow next to bm25(), so it is only worked out for the hits on the page being returned
+SNIPPET_SQL = {
+    'movie': text("SELECT rowid, snippet(movie_fts, -1, :start, :end, '...', :tokens) FROM movie_fts "
+                  "WHERE movie_fts MATCH :query AND rowid IN :ids").bindparams(bindparam('ids', expanding=True)),
+    'review': text("SELECT rowid, snippet(review_fts, 0, :start, :end, '...', :tokens) FROM review_fts "
+                   "WHERE review_fts MATCH :query AND rowid IN :ids").bindparams(bindparam('ids', expanding=True))
+}
+
+# This turns what the user typed into an FTS5 query, each word is quoted so characters like " or *
+# cannot break the query syntax, and the last word is a prefix so results show up while typing
+# Returns None if there are no words to search for
+def match_query(value):
+    terms = re.findall(r'\w+', (value or '').lower())[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+# This runs a search and returns up to limit rows starting at offset, best match first
+# Each row is (row, snippet), the snippet being the part of the text that matched
+def search_movies(session, query, limit, offset=0):
+    rows = session.execute(SEARCH_SQL, {'query': query, 'limit': limit, 'offset': offset}).all()
+    snippets = {}
+    for matched_in, statement in SNIPPET_SQL.items():
+        hit_ids = [row.hit_id for row in rows if row.matched_in == matched_in]
+        if hit_ids:
+            for hit_id, snippet in session.execute(statement, {
+                'query': query, 'ids': hit_ids, 'start': SNIPPET_START, 'end': SNIPPET_END, 'tokens': SNIPPET_TOKENS
+            }):
+                snippets[matched_in, hit_id] = snippet
+    return [(row, snippets.get((row.matched_in, row.hit_id))) for row in rows]
+
+def rebuild_search_index(connection):
+    for statement in SEARCH_INDEX_REBUILD:
+        connection.exec_driver_sql(statement)
+
+# db.create_all() makes the indexes and triggers after the tables, the migration does the same for
+# existing databases. They are dropped before the tables by db.drop_all()
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in SEARCH_INDEX_DDL:
+        connection.exec_driver_sql(statement)
+    rebuild_search_index(connection)
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_search_index(target, connection, **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.exec_driver_sql("DROP TABLE IF EXISTS movie_fts")
+    connection.exec_driver_sql("DROP TABLE IF EXISTS review_fts")
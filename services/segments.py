@@ -0,0 +1,187 @@
+import fcntl
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+# Age buckets used by MovieLens, each is (lowest age, label)
+AGE_BUCKETS = [(0, 'under18'), (18, '18-24'), (25, '25-34'), (35, '35-44'), (45, '45-49'), (50, '50-55'), (56, '56plus')]
+
+def age_bucket(age):
+    label = AGE_BUCKETS[0][1]
+    for lowest, name in AGE_BUCKETS:
+        if age is not None and age >= lowest:
+            label = name
+    return label
+
+# The segment keys of a user, from the most specific to the least. A user is served from the first
+# one that has a list, so a small segment falls back to gender and age, then age, then everyone.
+# A user that is not in the database only gets the list for everyone.
+def segment_keys(gender, age, occupation):
+    if gender is None:
+        return ["all"]
+    bucket = age_bucket(age)
+    return [f"g{gender}|a{bucket}|o{occupation}", f"g{gender}|a{bucket}", f"a{bucket}", "all"]
+
+# This works out the top movies of every segment from the ratings table.
+# Ratings are summed per segment and movie in one grouped query, and each movie is scored with a
+# Bayesian average so a movie with one 5 star rating does not beat one with hundreds of 4.5s.
+#   score = (prior_weight * overall_average + sum of ratings) / (prior_weight + number of ratings)
+# The models are imported inside the functions here as they import extensions, where SegmentRankings is created
+def compute_segment_rankings(top_k=100, prior_weight=5):
+    from extensions import db
+    from models.rating import Rating
+    from models.user import User
+
+    rows = db.session.query(
+        User.user_gender, User.raw_user_age, User.user_occupation_label, Rating.movie_id,
+        db.func.sum(Rating.rating), db.func.count(Rating.id)
+    ).join(User, User.id == Rating.user_id).group_by(
+        User.user_gender, User.raw_user_age, User.user_occupation_label, Rating.movie_id
+    ).all()
+
+    totals = defaultdict(lambda: defaultdict(lambda: [0.0, 0]))
+    rating_sum = 0.0
+    rating_count = 0
+    for gender, age, occupation, movie_id, total, count in rows:
+        rating_sum += total
+        rating_count += count
+        for key in segment_keys(gender, age, occupation):
+            entry = totals[key][movie_id]
+            entry[0] += total
+            entry[1] += count
+    if not rating_count:
+        return {}
+
+    overall = rating_sum / rating_count
+    rankings = {}
+    for key, movies in totals.items():
+        scored = [
+            (movie_id, (prior_weight * overall + total) / (prior_weight + count), count)
+            for movie_id, (total, count) in movies.items()
+        ]
+        scored.sort(key=lambda item: (-item[1], -item[2], item[0]))
+        rankings[key] = scored[:top_k]
+    return rankings
+
+# Holds the segment top lists in memory so a cold start user is one dict lookup.
+# The lists are read from the segment_recommendations table and read again after SEGMENT_CACHE_SECONDS,
+# so every worker picks up a refresh made by another one. With SEGMENT_REFRESH_SECONDS above 0 every
+# worker starts a background thread, but only the one holding an exclusive lock on the lock file
+# recomputes the table, once per interval and never at start up. If that worker exits the OS drops its
+# lock and another worker takes over on its next tick.
+class SegmentRankings:
+    def __init__(self, top_k=100, prior_weight=5, cache_seconds=300):
+        self.top_k = top_k
+        self.prior_weight = prior_weight
+        self.cache_seconds = cache_seconds
+        self.refreshed_at = None
+        self._lists = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.top_k = app.config.get('SEGMENT_TOP_K', self.top_k)
+        self.prior_weight = app.config.get('SEGMENT_PRIOR_WEIGHT', self.prior_weight)
+        self.cache_seconds = app.config.get('SEGMENT_CACHE_SECONDS', self.cache_seconds)
+        self._lists = None
+        interval = app.config.get('SEGMENT_REFRESH_SECONDS', 0)
+        if interval:
+            lock_path = app.config.get('SEGMENT_REFRESH_LOCK') or os.path.join(app.instance_path, 'segment-refresh.lock')
+            threading.Thread(target=self._refresh_loop, args=(app, interval, lock_path), name='segment-refresh', daemon=True).start()
+
+    # This returns (segment key, top k movies) for a user, or (None, None) if there are no lists yet
+    def lookup(self, user, k):
+        lists = self._get_lists()
+        if user is None:
+            keys = segment_keys(None, None, None)
+        else:
+            keys = segment_keys(user.user_gender, user.raw_user_age, user.user_occupation_label)
+        for key in keys:
+            movies = lists.get(key)
+            if movies:
+                return key, movies[:k]
+        return None, None
+
+    # Recomputes the lists and replaces the table in one transaction
+    def refresh(self):
+        from sqlalchemy import insert
+        from extensions import db
+        from models.segment_recommendation import SegmentRecommendation
+
+        started = time.perf_counter()
+        rankings = compute_segment_rankings(self.top_k, self.prior_weight)
+        rows = [
+            {"segment": key, "rank": rank + 1, "movie_id": movie_id, "score": score, "rating_count": count}
+            for key, movies in rankings.items()
+            for rank, (movie_id, score, count) in enumerate(movies)
+        ]
+        try:
+            SegmentRecommendation.query.delete()
+            if rows:
+                db.session.execute(insert(SegmentRecommendation), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self._lists = None
+        self.refreshed_at = time.time()
+        logging.info(f"Refreshed {len(rankings)} segment rankings with {len(rows)} rows in {time.perf_counter() - started:.2f}s")
+        return len(rankings)
+
+    def _refresh_loop(self, app, interval, lock_path):
+        lock_file = None
+        while True:
+            time.sleep(interval)
+            if lock_file is None:
+                lock_file = self._try_lock(lock_path)
+                if lock_file is None:
+                    continue
+            with app.app_context():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logging.error(f"Error refreshing segment rankings: {e}")
+
+    # The lock file stays open and locked for the life of the process, None if another process holds it
+    def _try_lock(self, lock_path):
+        try:
+            os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+            lock_file = open(lock_path, 'a')
+        except OSError as e:
+            logging.error(f"Cannot open the segment refresh lock {lock_path}: {e}")
+            return None
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        logging.info(f"This process refreshes the segment rankings, holding {lock_path}")
+        return lock_file
+
+    def _get_lists(self):
+        lists = self._lists
+        if lists is not None and time.monotonic() - self._loaded_at < self.cache_seconds:
+            return lists
+        with self._lock:
+            if self._lists is None or time.monotonic() - self._loaded_at >= self.cache_seconds:
+                self._lists = self._load_lists()
+                self._loaded_at = time.monotonic()
+            return self._lists
+
+    def _load_lists(self):
+        from extensions import db
+        from models.movie import Movie
+        from models.segment_recommendation import SegmentRecommendation
+
+        lists = defaultdict(list)
+        rows = db.session.query(
+            SegmentRecommendation.segment, SegmentRecommendation.score,
+            Movie.id, Movie.movie_title, Movie.movie_genres
+        ).join(Movie, Movie.id == SegmentRecommendation.movie_id).order_by(
+            SegmentRecommendation.segment, SegmentRecommendation.rank
+        )
+        for segment, score, movie_id, title, genres in rows:
+            lists[segment].append({"id": movie_id, "title": title, "genres": genres, "rating": float(score)})
+        return dict(lists)
@@ -0,0 +1,64 @@
+import json
+from flask import Response, request, stream_with_context
+
+# Rows read from the database cursor at a time, and rows written to the response per chunk
+EXPORT_YIELD_PER = 1000
+EXPORT_CHUNK_ROWS = 500
+
+# Items are written without spaces after separators, the same as jsonify
+def encode(item):
+    return json.dumps(item, separators=(',', ':'))
+
+# This runs a query and yields its rows a batch at a time instead of loading them all.
+# yield_per turns on stream_results, which uses a server side cursor on backends that have one
+# (PostgreSQL, MySQL), SQLite already reads rows from its cursor as they are asked for.
+def iterate_rows(session, statement, yield_per=EXPORT_YIELD_PER):
+    result = session.execute(statement.execution_options(yield_per=yield_per))
+    try:
+        for partition in result.partitions():
+            yield from partition
+    finally:
+        result.close()
+
+# Writes the items as a JSON array, [ and ] around them and a comma between each one
+def json_array_chunks(items, chunk_rows=EXPORT_CHUNK_ROWS):
+    yield '['
+    first = True
+    chunk = []
+    for item in items:
+        chunk.append(encode(item) if first else ',' + encode(item))
+        first = False
+        if len(chunk) >= chunk_rows:
+            yield ''.join(chunk)
+            chunk = []
+    yield ''.join(chunk) + ']'
+
+# Writes the items as newline delimited JSON, one object per line
+def ndjson_chunks(items, chunk_rows=EXPORT_CHUNK_ROWS):
+    chunk = []
+    for item in items:
+        chunk.append(encode(item) + '\n')
+        if len(chunk) >= chunk_rows:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+# The export format asked for with ?format=ndjson or an Accept: application/x-ndjson header, JSON by default
+def export_format():
+    value = request.args.get('format')
+    if value is None:
+        return 'ndjson' if request.accept_mimetypes.best == 'application/x-ndjson' else 'json'
+    if value not in ('json', 'ndjson'):
+        raise ValueError('format must be json or ndjson')
+    return value
+
+# A streamed response for the items, each chunk is sent as soon as it is written so memory
+# stays at about one chunk of rows however big the table is
+def streaming_response(items, output_format='json', filename=None):
+    if output_format == 'ndjson':
+        body, mimetype = ndjson_chunks(items), 'application/x-ndjson'
+    else:
+        body, mimetype = json_array_chunks(items), 'application/json'
+    headers = {'Content-Disposition': f'attachment; filename="{filename}.{output_format}"'} if filename else {}
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
@@ -0,0 +1,80 @@
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request, current_app
+from services.metrics import metrics
+
+# Buckets for the per stage histograms, in milliseconds
+SPAN_MS_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000]
+
+# Times a stage of the current request. The spans are sent back in the Server-Timing header
+# and added to the timing.<endpoint>.<span>_ms histograms shown by /health/metrics
+@contextmanager
+def span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+def record_span(name, seconds):
+    g.setdefault('timing_spans', []).append((name, seconds))
+
+# This builds a Server-Timing header from (stage, seconds) pairs so the stage durations show in browser dev tools
+def server_timing(spans):
+    return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in spans)
+
+# Registers the hook that turns the spans of each request into the header and histograms
+def init_timing(app):
+    @app.after_request
+    def add_server_timing(response):
+        spans = g.pop('timing_spans', None)
+        if spans:
+            endpoint = request.endpoint or 'unknown'
+            for name, seconds in spans:
+                metrics.histogram(f'timing.{endpoint}.{name}_ms', SPAN_MS_BUCKETS).observe(seconds * 1000)
+            response.headers['Server-Timing'] = server_timing(spans)
+        trace = g.pop('profile_trace', None)
+        if trace:
+            response.headers['X-Profile-Trace'] = trace
+        return response
+
+_profile_lock = threading.Lock()
+_profile_count = itertools.count(1)
+
+# Captures a TensorFlow profiler trace for a sample of requests when RANKING_PROFILE_SAMPLE_RATE is above 0
+# The trace is written under RANKING_PROFILE_DIR and its folder is given in the X-Profile-Trace header
+# Only one trace runs at a time, other requests are not profiled while it does
+@contextmanager
+def profile_sample(backend):
+    rate = current_app.config.get('RANKING_PROFILE_SAMPLE_RATE', 0)
+    if backend != 'tf' or not rate or random.random() >= rate or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+
+    logdir = os.path.join(current_app.config.get('RANKING_PROFILE_DIR', 'profiles'),
+                          f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_profile_count)}")
+    try:
+        import tensorflow as tf
+        tf.profiler.experimental.start(logdir)
+    except Exception as e:
+        _profile_lock.release()
+        logging.error(f"Could not start the TensorFlow profiler: {e}")
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        try:
+            tf.profiler.experimental.stop()
+            g.profile_trace = logdir
+            logging.info(f"Wrote TensorFlow profiler trace to {logdir}")
+        except Exception as e:
+            logging.error(f"Could not stop the TensorFlow profiler: {e}")
+        finally:
+            _profile_lock.release()
@@ -11,6 +11,7 @@ from models.actor import Actor
 from models.rating import Rating
 from models.reviews import Review
 from models.watchlist import Watchlist
+from services.movie_stats import repair_movie_stats
 from flask_jwt_extended import create_access_token
 from unittest.mock import MagicMock
 from datetime import datetime
@@ -27,6 +28,8 @@ class TestConfig:
     JWT_TOKEN_LOCATION = ['headers']
     JWT_COOKIE_CSRF_PROTECT = False
     JWT_ACCESS_TOKEN_EXPIRES = 3600
+    RANKING_MODEL_PRELOAD = False
+    SEGMENT_REFRESH_SECONDS = 0
 
 @pytest.fixture
 def app():
@@ -121,6 +124,7 @@ def init_database(app):
         db.session.add(watchlist)
 
         db.session.commit()
+        repair_movie_stats(db.session) # The rows above skip the routes, so their movie_stats are built the way seed_all does
         yield db
 
 @pytest.fixture
@@ -97,4 +97,26 @@ def test_remove_actor_from_movie_success(client, admin_token):
 
     assert response.status_code == 200
     assert "message" in data
-    assert "Actor Test Actor removed from movie Test Movie" in data["message"]  
\ No newline at end of file
+    assert "Actor Test Actor removed from movie Test Movie" in data["message"]  
+
+@pytest.mark.usefixtures("init_database")
+def test_export_actors_streams_movie_counts(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.get("/actors/export", headers=headers)
+    assert response.status_code == 200
+    assert response.is_streamed
+
+    actors = json.loads(response.data)
+    assert [(actor["id"], actor["movie_count"]) for actor in actors] == [(1, 1), (2, 0)]
+
+@pytest.mark.usefixtures("init_database")
+def test_get_all_actors_etag_changes_with_catalog(client, user_token, admin_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    etag = client.get("/actors", headers=headers).headers["ETag"]
+    assert client.get("/actors", headers=dict(headers, **{"If-None-Match": etag})).status_code == 304
+
+    client.put("/actors/1", json={"name": "Renamed Actor", "nationality": "Ireland"}, headers={"Authorization": f"Bearer {admin_token}"})
+    response = client.get("/actors", headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 200
+    assert json.loads(response.data)[0]["name"] == "Renamed Actor"
+    assert client.get("/movies/tt0000001", headers=headers).headers["ETag"].endswith('-2"')
@@ -0,0 +1,33 @@
+import pytest
+import json
+from unittest.mock import patch
+from tests.config import app, client
+from extensions import ranking_models
+
+def test_health_live(client):
+    response = client.get("/health/live")
+
+    assert response.status_code == 200
+    assert json.loads(response.data)["status"] == "ok"
+
+def test_health_ready_while_model_loading(client):
+    with patch.object(ranking_models, "state", ranking_models.LOADING):
+        response = client.get("/health/ready")
+    data = json.loads(response.data)
+
+    assert response.status_code == 503
+    assert data["models"]["ranking"]["state"] == "loading"
+
+def test_health_ready_when_model_loaded(client):
+    with patch.object(ranking_models, "state", ranking_models.READY):
+        response = client.get("/health/ready")
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert data["status"] == "ready"
+
+def test_health_metrics(client):
+    response = client.get("/health/metrics")
+
+    assert response.status_code == 200
+    assert isinstance(json.loads(response.data), dict)
@@ -0,0 +1,109 @@
+import pytest
+import os
+import stat
+import threading
+import time
+from multiprocessing.connection import Client
+import numpy as np
+from unittest.mock import MagicMock
+from services.inference_batcher import InferenceBatcher
+from services.inference_server import InferenceServer, InferenceClient, InferenceBusy, InferenceUnavailable, RemoteRankingModel
+
+AUTHKEY = b"test-secret"
+
+def start_server(address, model, max_pending=4):
+    manager = MagicMock()
+    manager.get_active.return_value = ("v1", model)
+    manager.status.return_value = {"version": "v1", "warmup_seconds": 0.0}
+    server = InferenceServer(address, manager, InferenceBatcher(window_ms=1), authkey=AUTHKEY, max_pending=max_pending)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    for _ in range(100):
+        try:
+            InferenceClient(address, authkey=AUTHKEY).request("status")
+            return server
+        except InferenceUnavailable:
+            time.sleep(0.02)
+    raise RuntimeError("inference server did not start")
+
+def test_remote_model_scores_over_reused_connection(tmp_path):
+    address = str(tmp_path / "sock" / "rank.sock")
+    model = MagicMock(side_effect=lambda inputs: MagicMock(numpy=lambda: np.arange(len(inputs["user_id"]), dtype=float)))
+    start_server(address, model)
+    client = InferenceClient(address, pool_size=2, authkey=AUTHKEY)
+    remote = RemoteRankingModel(client, "v1")
+
+    first = remote({"user_id": np.array(["1", "1"], dtype=object)}).numpy()
+    second = remote({"user_id": np.array(["2"], dtype=object)}).numpy()
+
+    assert first.tolist() == [0.0, 1.0]
+    assert second.tolist() == [0.0]
+    assert client._idle.qsize() == 1
+
+def test_remote_model_follows_the_version_the_server_scored_with(tmp_path):
+    address = str(tmp_path / "sock" / "rank.sock")
+    model = MagicMock(side_effect=lambda inputs: MagicMock(numpy=lambda: np.zeros(1)))
+    server = start_server(address, model)
+    changed = MagicMock()
+    remote = RemoteRankingModel(InferenceClient(address, authkey=AUTHKEY), "v1", on_version_change=changed)
+
+    assert remote({"user_id": np.array(["1"], dtype=object)}).version == "v1"
+    changed.assert_not_called()
+    # The server is reloaded through another worker
+    server.manager.get_active.return_value = ("v2", model)
+    assert remote({"user_id": np.array(["1"], dtype=object)}).version == "v2"
+    assert remote.version == "v2"
+    changed.assert_called_once_with(remote, "v2")
+
+def test_inference_server_answers_busy_when_full(tmp_path):
+    address = str(tmp_path / "sock" / "rank.sock")
+    release = threading.Event()
+    model = MagicMock(side_effect=lambda inputs: release.wait(5) and MagicMock(numpy=lambda: np.zeros(1)))
+    start_server(address, model, max_pending=1)
+    slow = threading.Thread(target=lambda: InferenceClient(address, authkey=AUTHKEY).request("score", {"user_id": np.array(["1"])}))
+    slow.start()
+    time.sleep(0.2)
+
+    with pytest.raises(InferenceBusy):
+        InferenceClient(address, authkey=AUTHKEY).request("score", {"user_id": np.array(["2"])})
+    release.set()
+    slow.join()
+
+def test_inference_client_times_out(tmp_path):
+    address = str(tmp_path / "sock" / "rank.sock")
+    release = threading.Event()
+    model = MagicMock(side_effect=lambda inputs: release.wait(5) and MagicMock(numpy=lambda: np.zeros(1)))
+    start_server(address, model)
+    client = InferenceClient(address, timeout=0.2, authkey=AUTHKEY)
+
+    with pytest.raises(TimeoutError):
+        client.request("score", {"user_id": np.array(["1"])})
+    assert client._idle.qsize() == 0
+    release.set()
+
+def test_inference_client_server_down(tmp_path):
+    with pytest.raises(InferenceUnavailable):
+        InferenceClient(str(tmp_path / "missing.sock"), authkey=AUTHKEY).request("status")
+
+def test_inference_server_rejects_clients_without_the_authkey(tmp_path):
+    address = str(tmp_path / "sock" / "rank.sock")
+    server = start_server(address, MagicMock())
+    server.manager.status.reset_mock()
+    assert stat.S_IMODE(os.stat(address).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(tmp_path / "sock").st_mode) == 0o700
+
+    with pytest.raises(InferenceUnavailable):
+        InferenceClient(address, authkey=b"wrong-secret").request("status")
+    # A client that skips the handshake has its first message read as a wrong answer, never unpickled as a command
+    conn = Client(address, family="AF_UNIX")
+    assert conn.recv_bytes().startswith(b"#CHALLENGE#")
+    conn.send(("status",))
+    assert conn.recv_bytes() == b"#FAILURE#"
+    with pytest.raises((EOFError, OSError)):
+        conn.recv_bytes()
+    conn.close()
+    server.manager.status.assert_not_called()
+
+    with pytest.raises(ValueError):
+        InferenceClient(address)
+    with pytest.raises(ValueError):
+        InferenceServer(address, MagicMock(), InferenceBatcher(window_ms=1))
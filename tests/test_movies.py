@@ -1,7 +1,16 @@
 import pytest
 import json
 from unittest.mock import patch
+from sqlalchemy import event
 from tests.config import app, client, init_database, user_token, admin_token
+from extensions import db
+from models.movie import Movie
+from models.actor import Actor
+from models.rating import Rating
+from models.reviews import Review
+from models.movie_stats import MovieStats
+from services.catalog import get_catalog_snapshot
+from services.movie_stats import repair_movie_stats, update_movie_stats
 
 @pytest.mark.usefixtures("init_database")
 def test_get_movies_success(client, user_token):
@@ -125,4 +134,391 @@ def test_remove_actor_success(client, admin_token):
 
     assert response.status_code == 200
     assert "message" in data
-    assert "Actor Test Actor removed from movie Test Movie" in data["message"]  
\ No newline at end of file
+    assert "Actor Test Actor removed from movie Test Movie" in data["message"]  
+
+@pytest.mark.usefixtures("init_database")
+def test_get_movies_query_count_does_not_grow_with_catalog(app, client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if "catalog_state" not in statement: # The ETag version read is cached and is not part of the listing
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        client.get("/movies", headers=headers)
+        single_movie_count = len(statements)
+
+        with app.app_context():
+            for i in range(2, 12):
+                movie = Movie(id=f"tt00000{i:02d}", movie_title=f"Movie {i}", movie_genres="Drama",
+                              image_url="movies/bloodborne1.jpg")
+                movie.actors.append(db.session.get(Actor, 1 + i % 2))
+                db.session.add(movie)
+                db.session.add(Rating(user_id=1, movie_id=movie.id, rating=3.0))
+            db.session.commit()
+
+        statements.clear()
+        response = client.get("/movies", headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+    data = json.loads(response.data)
+    assert len(data) == 11
+    assert len(statements) == single_movie_count <= 2
+    assert {movie["id"]: movie["ratingsCount"] for movie in data}["tt0000001"] == 1
+    assert {movie["id"]: movie["reviewsCount"] for movie in data}["tt0000001"] == 1
+    assert all(len(movie["actors"]) == 1 for movie in data)
+
+@pytest.mark.usefixtures("init_database")
+def test_get_movies_keyset_pages_with_sparse_fields(app, client, user_token):
+    with app.app_context():
+        for i in range(2, 8):
+            db.session.add(Movie(id=f"tt00000{i:02d}", movie_title=f"The Movie {i}", movie_genres="Drama|Comedy" if i % 2 else "Drama",
+                                 image_url="movies/bloodborne1.jpg"))
+        db.session.commit()
+    headers = {"Authorization": f"Bearer {user_token}"}
+
+    seen = []
+    url = "/movies?limit=3&fields=id,movie_title"
+    while url:
+        response = client.get(url, headers=headers)
+        page = json.loads(response.data)
+        assert response.status_code == 200
+        assert len(page) <= 3
+        assert all(set(movie) == {"id", "movie_title"} for movie in page)
+        seen += [movie["id"] for movie in page]
+        cursor = response.headers.get("X-Next-Cursor")
+        url = f"/movies?limit=3&fields=id,movie_title&cursor={cursor}" if cursor else None
+
+    assert sorted(seen) == sorted(set(seen))
+    assert len(seen) == 7
+
+@pytest.mark.usefixtures("init_database")
+def test_get_movies_filters_by_genre_and_title_prefix(app, client, user_token):
+    with app.app_context():
+        db.session.add(Movie(id="tt0000002", movie_title="The Comedy", movie_genres="Comedy", image_url="movies/bloodborne1.jpg"))
+        db.session.add(Movie(id="tt0000003", movie_title="Another Comedy", movie_genres="Comedy", image_url="movies/bloodborne1.jpg"))
+        db.session.commit()
+    headers = {"Authorization": f"Bearer {user_token}"}
+
+    response = client.get("/movies?genre=comedy&title_prefix=The&fields=id", headers=headers)
+    assert json.loads(response.data) == [{"id": "tt0000002"}]
+
+    response = client.get("/movies?fields=id,budget", headers=headers)
+    assert response.status_code == 400
+
+@pytest.mark.usefixtures("init_database")
+def test_export_movies_streams_json_and_ndjson(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.get("/movies/export", headers=headers)
+    assert response.status_code == 200
+    assert response.is_streamed
+    movies = json.loads(response.data)
+    assert movies[0]["id"] == "tt0000001"
+    assert movies[0]["actors"] == [{"id": 1, "name": "Test Actor"}]
+
+    response = client.get("/movies/export?format=ndjson", headers=headers)
+    lines = response.data.decode().splitlines()
+    assert response.mimetype == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in lines] == ["tt0000001"]
+
+@pytest.mark.usefixtures("init_database")
+def test_get_movies_etag_answers_304_without_queries(app, client, user_token, admin_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.get("/movies?limit=10", headers=headers)
+    etag = response.headers["ETag"]
+
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        cached = client.get("/movies?limit=10", headers=dict(headers, **{"If-None-Match": etag}))
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cached.data == b""
+    assert statements == []
+    assert client.get("/movies?limit=5", headers=headers).headers["ETag"] != etag
+
+    with patch("os.path.isfile", return_value=True):
+        client.put("/movies/update/tt0000001", json={"movie_title": "Updated Movie", "movie_genres": "Drama", "image": "bloodborne1.jpg"},
+                   headers={"Authorization": f"Bearer {admin_token}"})
+    response = client.get("/movies?limit=10", headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+@pytest.mark.usefixtures("init_database")
+def test_single_movie_etag_follows_row_version(client, user_token, admin_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    etag = client.get("/movies/tt0000001", headers=headers).headers["ETag"]
+    assert client.get("/movies/tt0000001", headers=dict(headers, **{"If-None-Match": etag})).status_code == 304
+
+    # Adding an actor changes the movie response without changing its columns
+    client.post("/movies/tt0000001/actors", json={"actor_id": 2}, headers=admin_headers)
+    response = client.get("/movies/tt0000001", headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 200
+    assert response.headers["ETag"].endswith('-2"')
+    assert len(json.loads(response.data)["actors"]) == 2
+
+@pytest.mark.usefixtures("init_database")
+def test_single_movie_etag_differs_for_a_recreated_movie(client, user_token, admin_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    etag = client.get("/movies/tt0000001", headers=headers).headers["ETag"]
+
+    client.delete("/movies/delete/tt0000001", headers=admin_headers)
+    with patch("os.path.isfile", return_value=True):
+        client.post("/movies/create", json={"id": "tt0000001", "movie_title": "Another Movie", "movie_genres": "Drama",
+                                            "actor_id": 2, "image": "bloodborne1.jpg"}, headers=admin_headers)
+    response = client.get("/movies/tt0000001", headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 200
+    assert json.loads(response.data)["movie_title"] == "Another Movie"
+
+@pytest.mark.usefixtures("init_database")
+def test_search_movies_ranks_titles_descriptions_and_reviews(app, client, user_token):
+    with app.app_context():
+        db.session.add(Movie(id="tt0000002", movie_title="The Dark Knight", movie_genres="Action",
+                             description="Batman fights the Joker", image_url="movies/bloodborne1.jpg"))
+        db.session.add(Movie(id="tt0000003", movie_title="Heat", movie_genres="Crime",
+                             description="A detective hunts a crew through a dark city", image_url="movies/bloodborne1.jpg"))
+        db.session.add(Review(user_id=1, movie_id="tt0000003", content="Dark and gripping, the fighting is great"))
+        db.session.commit()
+    headers = {"Authorization": f"Bearer {user_token}"}
+
+    data = json.loads(client.get("/movies/search?q=dark", headers=headers).data)
+    assert [movie["id"] for movie in data] == ["tt0000002", "tt0000003"]
+    assert data[0]["snippet"] == "The [Dark] Knight"
+    assert data[0]["matched_in"] == "movie"
+
+    # Words are stemmed, reviews are searched and the last word matches as a prefix
+    data = json.loads(client.get("/movies/search?q=grip", headers=headers).data)
+    assert [(movie["id"], movie["matched_in"]) for movie in data] == [("tt0000003", "review")]
+    data = json.loads(client.get("/movies/search?q=fight", headers=headers).data)
+    assert [(movie["id"], movie["snippet"]) for movie in data][0] == ("tt0000002", "Batman [fights] the Joker")
+    assert {movie["id"] for movie in data} == {"tt0000002", "tt0000003"}
+
+    response = client.get("/movies/search?q=dark&limit=1", headers=headers)
+    assert response.headers["X-Next-Offset"] == "1"
+    response = client.get("/movies/search?q=dark&limit=1&offset=1", headers=headers)
+    assert [movie["id"] for movie in json.loads(response.data)] == ["tt0000003"]
+    assert "X-Next-Offset" not in response.headers
+
+    assert client.get('/movies/search?q="*', headers=headers).status_code == 400
+
+@pytest.mark.usefixtures("init_database")
+def test_search_index_follows_movie_changes(app, client, user_token, admin_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    with patch("os.path.isfile", return_value=True):
+        client.put("/movies/update/tt0000001", json={"movie_title": "Arrival", "movie_genres": "Drama",
+                                                     "image": "bloodborne1.jpg"}, headers=admin_headers)
+
+    assert json.loads(client.get("/movies/search?q=arrival", headers=headers).data)[0]["id"] == "tt0000001"
+    # The old title is gone from the index, test now only matches the description
+    assert [movie["snippet"] for movie in json.loads(client.get("/movies/search?q=test", headers=headers).data)] == ["A [test] movie"]
+
+    client.delete("/movies/delete/tt0000001", headers=admin_headers)
+    assert json.loads(client.get("/movies/search?q=arrival", headers=headers).data) == []
+    assert json.loads(client.get("/movies/search?q=great", headers=headers).data) == []
+
+@pytest.mark.usefixtures("init_database")
+def test_search_etag_changes_when_a_review_is_edited(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.get("/movies/search?q=great", headers=headers)
+    etag = response.headers["ETag"]
+    assert client.get("/movies/search?q=great", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    client.put("/reviews/update/1", json={"content": "Dull"}, headers=headers)
+    response = client.get("/movies/search?q=great", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert json.loads(response.data) == []
+
+@pytest.mark.usefixtures("init_database")
+def test_get_movies_genre_filters_use_normalized_genres(app, client, user_token, admin_token):
+    with app.app_context():
+        db.session.add(Movie(id="tt0000002", movie_title="Rush Hour", movie_genres="Action, Comedy", image_url="movies/bloodborne1.jpg"))
+        db.session.add(Movie(id="tt0000003", movie_title="Airplane", movie_genres="Comedy", image_url="movies/bloodborne1.jpg"))
+        db.session.add(Movie(id="tt0000004", movie_title="Dramatic Action", movie_genres="Drama", image_url="movies/bloodborne1.jpg"))
+        db.session.commit()
+        assert [genre.name for genre in db.session.get(Movie, "tt0000002").genres] == ["Action", "Comedy"]
+        assert db.session.get(Movie, "tt0000002").genre_mask == 0b11
+    headers = {"Authorization": f"Bearer {user_token}"}
+
+    ids = lambda url: sorted(movie["id"] for movie in json.loads(client.get(url, headers=headers).data))
+    assert ids("/movies?genre=action&fields=id") == ["tt0000001", "tt0000002"]
+    assert ids("/movies?genre=Action,Comedy&fields=id") == ["tt0000001", "tt0000002", "tt0000003"]
+    assert ids("/movies?genre=Action,Comedy&genre_match=all&fields=id") == ["tt0000002"]
+    assert ids("/movies?genre=Action,Western&genre_match=all&fields=id") == []
+    assert client.get("/movies?genre=Action&genre_match=some", headers=headers).status_code == 400
+
+    # Changing the genre string moves the movie between genres, adding new genres as needed
+    with patch("os.path.isfile", return_value=True):
+        client.put("/movies/update/tt0000002", json={"movie_title": "Rush Hour", "movie_genres": "Comedy, Buddy Cop",
+                                                     "image": "bloodborne1.jpg"}, headers={"Authorization": f"Bearer {admin_token}"})
+    assert ids("/movies?genre=Action&fields=id") == ["tt0000001"]
+    assert ids("/movies?genre=buddy cop,comedy&genre_match=all&fields=id") == ["tt0000002"]
+    with app.app_context():
+        snapshot = get_catalog_snapshot()
+        in_genre = snapshot.genre_filter(["Comedy"])
+        assert sorted(snapshot.ids[in_genre]) == ["tt0000002", "tt0000003"]
+
+@pytest.mark.usefixtures("init_database")
+def test_movie_stats_follow_write_routes(app, client, user_token, admin_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    admin_headers = {"Authorization": f"Bearer {admin_token}"}
+    stats = lambda: json.loads(client.get("/movies/tt0000001/stats").data)
+    assert stats() == {"ratings_count": 1, "reviews_count": 1, "actors_count": 1, "average_rating": 4.5,
+                       "ratings_histogram": {"1": 0, "2": 0, "3": 0, "4": 0, "5": 1}}
+
+    client.post("/ratings", json={"movie_id": "tt0000001", "rating": 2.0}, headers=admin_headers)
+    client.post("/ratings", json={"movie_id": "tt0000001", "rating": 3.5}, headers=headers)
+    client.post("/reviews/create", json={"movie_id": "tt0000001", "content": "Fine"}, headers=admin_headers)
+    client.post("/movies/tt0000001/actors", json={"actor_id": 2}, headers=admin_headers)
+    assert stats() == {"ratings_count": 2, "reviews_count": 2, "actors_count": 2, "average_rating": 2.75,
+                       "ratings_histogram": {"1": 0, "2": 1, "3": 0, "4": 1, "5": 0}}
+    data = json.loads(client.get("/movies?fields=id,ratingsCount,reviewsCount,averageRating", headers=headers).data)
+    assert data == [{"id": "tt0000001", "ratingsCount": 2, "reviewsCount": 2, "averageRating": 2.75}]
+
+    client.delete("/ratings/1", headers=headers)
+    client.delete("/reviews/delete/1", headers=headers)
+    client.delete("/actors/2", headers=admin_headers)
+    assert stats()["ratings_count"] == 1 and stats()["reviews_count"] == 1 and stats()["actors_count"] == 1
+
+    # The repair job finds totals changed without the routes and puts them right
+    with app.app_context():
+        db.session.add(Rating(user_id=1, movie_id="tt0000001", rating=1.0))
+        db.session.commit()
+        drift = repair_movie_stats(db.session)
+        assert {(item["field"], item["stored"], item["actual"]) for item in drift} == {
+            ("ratings_count", 1, 2), ("ratings_sum", 2.0, 3.0), ("rating_1", 0, 1)
+        }
+        assert repair_movie_stats(db.session) == []
+    assert stats()["average_rating"] == 1.5
+
+@pytest.mark.usefixtures("init_database")
+def test_movie_stats_without_on_conflict(app, client, admin_token):
+    stats = lambda: json.loads(client.get("/movies/tt0000001/stats").data)
+    # Without a dialect insert the totals are kept with an UPDATE, and an INSERT when the movie has no row
+    with patch.dict("services.movie_stats.UPSERT_INSERTS", clear=True):
+        client.post("/ratings", json={"movie_id": "tt0000001", "rating": 2.0}, headers={"Authorization": f"Bearer {admin_token}"})
+        assert stats()["ratings_count"] == 2
+
+        with app.app_context():
+            MovieStats.query.filter_by(movie_id="tt0000001").delete()
+            update_movie_stats("tt0000001", reviews_count=1)
+            db.session.commit()
+            assert MovieStats.query.get("tt0000001").reviews_count == 1
+            assert {item["field"] for item in repair_movie_stats(db.session)} >= {"ratings_count", "actors_count"}
+            assert repair_movie_stats(db.session) == []
+    assert stats()["ratings_count"] == 2 and stats()["actors_count"] == 1
+
+@pytest.mark.usefixtures("init_database")
+def test_bulk_create_movies_reports_each_row(app, client, admin_token, user_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    movies = [
+        {"id": "tt0000002", "movie_title": "Heat", "movie_genres": "Action, Crime", "actor_ids": [1, 2], "image": "bloodborne1.jpg"},
+        {"id": "tt0000003", "movie_title": "Missing Actor", "movie_genres": "Drama", "actor_ids": [99], "image": "bloodborne1.jpg"},
+        {"id": "tt0000001", "movie_title": "Already There", "movie_genres": "Drama", "actor_ids": [1], "image": "bloodborne1.jpg"},
+        {"id": "tt0000004", "movie_title": "Bad Image", "movie_genres": "Drama", "actor_id": 1, "image": "other.jpg"},
+        {"id": "tt0000005", "movie_genres": "Drama", "actor_ids": [1], "image": "bloodborne1.jpg"},
+        {"id": "tt0000002", "movie_title": "Heat Again", "movie_genres": "Crime", "actor_ids": [1], "image": "bloodborne1.jpg"},
+        {"id": "tt0000006", "movie_title": "Western One", "movie_genres": "Western", "actor_id": 2, "image": "bloodborne1.jpg"}
+    ]
+    app.config["MOVIES_BULK_BATCH_SIZE"] = 1
+    with patch("os.path.isfile", return_value=True) as isfile:
+        response = client.post("/movies/bulk", json=movies, headers=headers)
+    data = json.loads(response.data)
+
+    assert response.status_code == 201
+    assert isfile.call_count == 1
+    assert (data["created"], data["failed"]) == (2, 5)
+    assert [result["status"] for result in data["results"]] == ["created", "error", "error", "error", "error", "error", "created"]
+    assert [result["index"] for result in data["results"]] == list(range(7))
+    assert "Actor with ID 99" in data["results"][1]["error"]
+    assert "already exists" in data["results"][2]["error"]
+    assert "Image must be one of" in data["results"][3]["error"]
+    assert "Missing movie_title" in data["results"][4]["error"]
+    assert "repeated" in data["results"][5]["error"]
+
+    # The rows written without the ORM have their actors, genres and stats like a movie from /create
+    with app.app_context():
+        movie = db.session.get(Movie, "tt0000002")
+        assert sorted(actor.id for actor in movie.actors) == [1, 2]
+        assert [genre.name for genre in movie.genres] == ["Action", "Crime"]
+        assert movie.image_url == "movies/bloodborne1.jpg"
+        assert repair_movie_stats(db.session, dry_run=True) == []
+    assert json.loads(client.get("/movies/tt0000002/stats").data)["actors_count"] == 2
+    user_headers = {"Authorization": f"Bearer {user_token}"}
+    ids = json.loads(client.get("/movies?genre=western&fields=id", headers=user_headers).data)
+    assert ids == [{"id": "tt0000006"}]
+    assert json.loads(client.get("/movies/search?q=heat", headers=user_headers).data)[0]["id"] == "tt0000002"
+
+    # NDJSON is read one movie per line, a line that is not JSON only fails that row
+    body = '{"id": "tt0000007", "movie_title": "Line One", "movie_genres": "Drama", "actor_ids": [1], "image": "bloodborne1.jpg"}\n{not json\n'
+    with patch("os.path.isfile", return_value=True):
+        response = client.post("/movies/bulk", data=body, content_type="application/x-ndjson", headers=headers)
+    data = json.loads(response.data)
+    assert (data["created"], data["failed"]) == (1, 1)
+    assert data["results"][1]["error"] == "line is not valid JSON"
+
+    response = client.post("/movies/bulk", json=movies, headers=user_headers)
+    assert response.status_code == 403
+    assert client.post("/movies/bulk", json={"id": "tt0000008"}, headers=headers).status_code == 400
+
+@pytest.mark.usefixtures("init_database")
+def test_batch_movies_keeps_request_order_in_two_queries(app, client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with app.app_context():
+        for i in range(2, 6):
+            movie = Movie(id=f"tt000000{i}", movie_title=f"Movie {i}", movie_genres="Drama", image_url="movies/bloodborne1.jpg")
+            movie.actors.append(db.session.get(Actor, 1 + i % 2))
+            db.session.add(movie)
+        db.session.commit()
+        repair_movie_stats(db.session)
+
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if "catalog_state" not in statement:
+            statements.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        response = client.get("/movies/batch?ids=tt0000004,tt9999999,tt0000001,tt0000004,tt0000002", headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+    data = json.loads(response.data)
+    assert response.status_code == 200
+    assert len(statements) == 2
+    assert [movie["id"] for movie in data["movies"]] == ["tt0000004", "tt0000001", "tt0000002"]
+    assert data["missing"] == ["tt9999999"]
+    first = data["movies"][1]
+    assert first["movie_title"] == "Test Movie"
+    assert first["actors"] == [{"id": 1, "name": "Test Actor"}]
+    assert first["stats"] == json.loads(client.get("/movies/tt0000001/stats").data)
+    assert data["movies"][0]["stats"]["ratings_count"] == 0
+
+    etag = response.headers["ETag"]
+    cached = client.get("/movies/batch?ids=tt0000004,tt9999999,tt0000001,tt0000004,tt0000002",
+                        headers={**headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+
+    # The POST form takes the ids in the body, for lists too long for a URL
+    response = client.post("/movies/batch", json={"ids": ["tt0000005", "tt0000003"]}, headers=headers)
+    assert [movie["id"] for movie in json.loads(response.data)["movies"]] == ["tt0000005", "tt0000003"]
+    assert client.post("/movies/batch", json={"ids": "tt0000005"}, headers=headers).status_code == 400
+    assert client.get("/movies/batch", headers=headers).status_code == 400
+    app.config["MOVIES_BATCH_MAX_IDS"] = 2
+    assert client.get("/movies/batch?ids=tt0000001,tt0000002,tt0000003", headers=headers).status_code == 400
+    assert client.get("/movies/batch?ids=tt0000001").status_code == 401
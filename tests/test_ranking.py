@@ -1,8 +1,28 @@
 import pytest
 import json
+import os
+import tarfile
+import threading
+import time
 import numpy as np
 from unittest.mock import patch, MagicMock
-from tests.config import app, client, init_database, user_token, mock_ranking_model
+from sqlalchemy import event
+from tests.config import app, client, init_database, user_token, admin_token, mock_ranking_model
+from extensions import db, ranking_cache, ranking_models, segment_rankings, ranking_breaker
+from services.model_registry import ModelRegistry
+from services.ranking_model import ModelManager, load_model_version
+from services.numpy_ranking import NumpyRankingModel
+from services.inference_batcher import InferenceBatcher
+from services.inference_server import RemoteRankingModel
+from services.metrics import metrics
+from services.segments import SegmentRankings, compute_segment_rankings, segment_keys
+from services.circuit_breaker import CircuitBreaker
+from services.popularity import PopularityRanking
+from services.catalog import bump_catalog_version, bump_user_ratings_version, get_catalog_snapshot
+from models.movie import Movie
+from models.rating import Rating
+from routes.ranking_routes import sync_ranking_cache
+from models.user_recommendation import UserRecommendation
 
 @pytest.mark.usefixtures("init_database")
 def test_get_top_ranked_movies_success(mock_ranking_model, client, user_token):
@@ -24,4 +44,460 @@ def test_get_top_ranked_movies_missing_user_id(client, user_token):
     data = json.loads(response.data)
 
     assert response.status_code == 400
-    assert "error" in data
\ No newline at end of file
+    assert "error" in data
+
+@pytest.mark.usefixtures("init_database")
+def test_get_top_ranked_movies_served_from_cache(mock_ranking_model, client, user_token):
+    mock_ranking_model.return_value = MagicMock(numpy=lambda: np.array([0.9]))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("test", mock_ranking_model)):
+        first = client.get("/ranking?user_id=1", headers=headers)
+        second = client.get("/ranking?user_id=1", headers=headers)
+
+    assert first.status_code == 200
+    assert json.loads(first.data) == json.loads(second.data)
+    assert mock_ranking_model.call_count == 1
+
+@pytest.mark.usefixtures("init_database")
+def test_cached_ranking_skips_the_cold_start_ratings_query(app, mock_ranking_model, client, user_token):
+    mock_ranking_model.return_value = MagicMock(numpy=lambda: np.array([0.9]))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    with app.app_context():
+        engine = db.engine
+    with patch.object(ranking_models, "get_active", return_value=("test", mock_ranking_model)):
+        client.get("/ranking?user_id=1", headers=headers)
+        event.listen(engine, "before_cursor_execute", count_statement)
+        try:
+            response = client.get("/ranking?user_id=1", headers=headers)
+        finally:
+            event.remove(engine, "before_cursor_execute", count_statement)
+
+    assert response.status_code == 200
+    assert json.loads(response.data)["served_by"] == "model"
+    assert not [statement for statement in statements if "ratings" in statement]
+
+@pytest.mark.usefixtures("init_database")
+def test_ranking_from_a_reloaded_inference_server_is_not_cached_under_the_old_version(client, user_token):
+    inference_client = MagicMock()
+    inference_client.request.return_value = ("v2", np.array([0.9]))
+    remote = RemoteRankingModel(inference_client, "v1")
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("v1", remote)):
+        response = client.get("/ranking?user_id=1", headers=headers)
+        assert json.loads(response.data)["model_version"] == "v2"
+        client.get("/ranking?user_id=1", headers=headers)
+    assert inference_client.request.call_count == 2
+
+@pytest.mark.usefixtures("init_database")
+def test_rating_change_invalidates_cached_ranking(mock_ranking_model, client, user_token):
+    mock_ranking_model.return_value = MagicMock(numpy=lambda: np.array([0.9]))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("test", mock_ranking_model)):
+        client.get("/ranking?user_id=1", headers=headers)
+        client.post("/ratings", json={"movie_id": "tt0000001", "rating": 2.0}, headers=headers)
+        response = client.get("/ranking?user_id=1", headers=headers)
+
+    assert response.status_code == 200
+    assert mock_ranking_model.call_count == 2
+
+@pytest.mark.usefixtures("init_database")
+def test_rating_change_in_another_worker_invalidates_cached_ranking(app, mock_ranking_model, client, user_token):
+    mock_ranking_model.return_value = MagicMock(numpy=lambda: np.array([0.9]))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("test", mock_ranking_model)):
+        client.get("/ranking?user_id=1", headers=headers)
+        client.get("/ranking?user_id=1", headers=headers)
+        assert mock_ranking_model.call_count == 1
+
+        # Another worker deletes the users ratings, this worker only sees the shared versions move on
+        with app.app_context():
+            Rating.query.filter_by(user_id=1).delete()
+            bump_user_ratings_version(1)
+            db.session.commit()
+        with app.app_context():
+            sync_ranking_cache()
+            assert not ranking_cache.has_user("1")
+
+        db.session.add(Rating(user_id=1, movie_id="tt0000001", rating=3.0))
+        db.session.commit()
+        client.get("/ranking?user_id=1", headers=headers)
+    assert mock_ranking_model.call_count == 2
+
+@pytest.mark.usefixtures("init_database")
+def test_batch_ranking_scores_users_in_one_call(client, admin_token):
+    mock_model = MagicMock(side_effect=lambda inputs: MagicMock(
+        numpy=lambda: np.linspace(1.0, 0.0, inputs["user_id"].shape[0])))
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("test", mock_model)):
+        response = client.post("/ranking/batch", json={"user_ids": [1, 2, 1], "k": 3}, headers=headers)
+    response_data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert mock_model.call_count == 1
+    assert [r["user_id"] for r in response_data["results"]] == ["1", "2"]
+    assert response_data["results"][1]["top_ranked_movies"][0]["id"] == "tt0000001"
+
+@pytest.mark.usefixtures("init_database")
+def test_batch_ranking_requires_user_ids(client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = client.post("/ranking/batch", json={"k": 3}, headers=headers)
+
+    assert response.status_code == 400
+
+@pytest.mark.usefixtures("init_database")
+def test_batch_ranking_is_admin_only_and_uses_the_breaker(app, client, user_token, admin_token):
+    assert client.post("/ranking/batch", json={"user_ids": [1]}).status_code == 401
+    assert client.post("/ranking/batch", json={"user_ids": [1]},
+                       headers={"Authorization": f"Bearer {user_token}"}).status_code == 403
+
+    app.config["RANKING_BREAKER_FAILURES"] = 1
+    ranking_breaker.init_app(app)
+    failing_model = MagicMock(side_effect=RuntimeError("model failed"))
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("test", failing_model)):
+        assert client.post("/ranking/batch", json={"user_ids": [1]}, headers=headers).status_code == 500
+        response = client.post("/ranking/batch", json={"user_ids": [2]}, headers=headers)
+    assert response.status_code == 503
+    assert failing_model.call_count == 1
+    ranking_breaker.init_app(app)
+
+@pytest.mark.usefixtures("init_database")
+def test_get_top_ranked_movies_precomputed_mode(app, client, user_token):
+    db.session.add(UserRecommendation(user_id=1, rank=1, movie_id="tt0000001", score=4.2, model_version="test"))
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=(None, None)):
+        response = client.get("/ranking?user_id=1&mode=precomputed", headers=headers)
+    response_data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert response_data["model_version"] == "test"
+    assert response_data["top_ranked_movies"][0]["id"] == "tt0000001"
+    assert response_data["top_ranked_movies"][0]["rating"] == 4.2
+
+@pytest.mark.usefixtures("init_database")
+def test_precomputed_mode_only_serves_rows_of_the_serving_model(app, client, user_token):
+    db.session.add(UserRecommendation(user_id=1, rank=1, movie_id="tt0000001", score=4.2, model_version="v1"))
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "state", ModelManager.READY), patch.object(ranking_models, "_active", ("v2", MagicMock())):
+        response = client.get("/ranking?user_id=1&mode=precomputed", headers=headers)
+    assert response.status_code == 404
+    assert "model v2" in json.loads(response.data)["error"]
+
+    with patch.object(ranking_models, "state", ModelManager.READY), patch.object(ranking_models, "_active", ("v1", MagicMock())):
+        response = client.get("/ranking?user_id=1&mode=precomputed", headers=headers)
+    assert response.status_code == 200
+    assert json.loads(response.data)["model_version"] == "v1"
+
+@pytest.mark.usefixtures("init_database")
+def test_get_top_ranked_movies_aligns_scores_with_ids(client, user_token):
+    db.session.add(Movie(id="tt0000002", movie_title="Second Movie", movie_genres="Drama"))
+    db.session.commit()
+    scores = {"Test Movie": 0.1, "Second Movie": 0.9}
+    mock_model = MagicMock(side_effect=lambda inputs: MagicMock(
+        numpy=lambda: np.array([scores[t] for t in inputs["movie_title"]])))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("test", mock_model)):
+        response = client.get("/ranking?user_id=1&k=1", headers=headers)
+    response_data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert response_data["top_ranked_movies"] == [
+        {"id": "tt0000002", "title": "Second Movie", "genres": "Drama", "rating": pytest.approx(0.9)}
+    ]
+
+@pytest.mark.usefixtures("init_database")
+def test_get_top_ranked_movies_invalid_k(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.get("/ranking?user_id=1&k=0", headers=headers)
+
+    assert response.status_code == 400
+
+def make_saved_model(path, fingerprint):
+    os.makedirs(path)
+    for name, data in (("saved_model.pb", b""), ("fingerprint.pb", fingerprint)):
+        with open(os.path.join(path, name), "wb") as f:
+            f.write(data)
+
+def test_model_registry_finds_versions_and_unpacks_archives_once(tmp_path):
+    make_saved_model(tmp_path / "ranking_model" / "1", b"one")
+    make_saved_model(tmp_path / "ranking_model" / "2", b"two")
+    make_saved_model(tmp_path / "build" / "ranking_model", b"three")
+    with tarfile.open(tmp_path / "ranking_model-3.tar.gz", "w:gz") as tar:
+        tar.add(tmp_path / "build" / "ranking_model", arcname="ranking_model")
+    registry = ModelRegistry(str(tmp_path), "ranking_model")
+
+    assert [v["version"] for v in registry.versions()] == ["2", "1", "3"]
+    version, path = registry.resolve("3")
+    assert version == "3"
+    assert os.path.isfile(os.path.join(path, "saved_model.pb"))
+    assert path.startswith(str(tmp_path / ".cache"))
+    assert registry.resolve("3")[1] == path
+    assert len(os.listdir(tmp_path / ".cache")) == 1
+    with pytest.raises(KeyError):
+        registry.resolve("4")
+
+def test_model_registry_prefers_directory_over_same_archive(tmp_path):
+    make_saved_model(tmp_path / "ranking_model", b"base")
+    make_saved_model(tmp_path / "build" / "ranking_model", b"base")
+    make_saved_model(tmp_path / "build" / "other", b"other")
+    with tarfile.open(tmp_path / "ranking_model.tar.gz", "w:gz") as tar:
+        tar.add(tmp_path / "build" / "ranking_model", arcname="ranking_model")
+    with tarfile.open(tmp_path / "ranking_model-2.tar.gz", "w:gz") as tar:
+        tar.add(tmp_path / "build" / "other", arcname="ranking_model")
+    registry = ModelRegistry(str(tmp_path), "ranking_model")
+
+    versions = registry.versions()
+    assert [(v["version"], v["source"]) for v in versions] == [(load_model_version(str(tmp_path / "ranking_model")), "directory"),
+                                                               ("2", "archive")]
+    assert registry.resolve()[1] == str(tmp_path / "ranking_model")
+    assert not os.path.exists(tmp_path / ".cache")
+
+def test_model_manager_reload_swaps_after_warm_up(tmp_path):
+    make_saved_model(tmp_path / "ranking_model" / "1", b"one")
+    make_saved_model(tmp_path / "ranking_model" / "2", b"two")
+    manager = ModelManager(ModelRegistry(str(tmp_path), "ranking_model"), version="1", warmup_rows=4)
+    models = {}
+    with patch.object(manager, "_load_model", side_effect=lambda version, path: models.setdefault(path, MagicMock())):
+        old_version, old_model = manager.get_active()
+        manager.reload("2")
+        for _ in range(100):
+            if manager.reload_state != manager.LOADING:
+                break
+            time.sleep(0.05)
+
+    assert old_version == "1"
+    assert manager.get_active() == ("2", models[str(tmp_path / "ranking_model" / "2")])
+    assert manager.status()["reload"]["state"] == "ready"
+    assert old_model.call_count == 2
+
+@pytest.mark.usefixtures("init_database")
+def test_get_top_ranked_movies_reports_model_version(mock_ranking_model, client, user_token):
+    mock_ranking_model.return_value = MagicMock(numpy=lambda: np.array([0.9]))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("v2", mock_ranking_model)):
+        response = client.get("/ranking?user_id=1", headers=headers)
+
+    assert response.status_code == 200
+    assert json.loads(response.data)["model_version"] == "v2"
+
+@pytest.mark.usefixtures("init_database")
+def test_reload_ranking_model_requires_admin(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.post("/ranking/models/reload", json={"version": "1"}, headers=headers)
+
+    assert response.status_code == 403
+
+@pytest.mark.usefixtures("init_database")
+def test_reload_ranking_model_unknown_version(client, admin_token):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = client.post("/ranking/models/reload", json={"version": "does-not-exist"}, headers=headers)
+
+    assert response.status_code == 404
+
+def test_numpy_ranking_model_matches_reference(tmp_path):
+    rng = np.random.default_rng(0)
+    arrays = {
+        "user_vocab": np.array(["1", "2"]),
+        "user_embeddings": rng.normal(size=(3, 4)).astype(np.float32),
+        "movie_vocab": np.array(["Test Movie", "Second Movie"]),
+        "movie_embeddings": rng.normal(size=(3, 4)).astype(np.float32),
+        "dense_0_kernel": rng.normal(size=(8, 6)).astype(np.float32),
+        "dense_0_bias": rng.normal(size=6).astype(np.float32),
+        "dense_1_kernel": rng.normal(size=(6, 1)).astype(np.float32),
+        "dense_1_bias": rng.normal(size=1).astype(np.float32)
+    }
+    for name, array in arrays.items():
+        np.save(tmp_path / f"{name}.npy", array)
+    with open(tmp_path / "manifest.json", "w") as f:
+        json.dump({"version": "test", "dense_layers": 2}, f)
+
+    users = np.array(["1", "2", "unknown", "2"], dtype=object)
+    titles = np.array(["Second Movie", "Test Movie", "Test Movie", b"Nope"], dtype=object)
+    scores = NumpyRankingModel(str(tmp_path))({"user_id": users, "movie_title": titles}).numpy()
+
+    joined = np.concatenate([arrays["user_embeddings"][[1, 2, 0, 2]], arrays["movie_embeddings"][[2, 1, 1, 0]]], axis=1)
+    hidden = np.maximum(joined @ arrays["dense_0_kernel"] + arrays["dense_0_bias"], 0)
+    expected = hidden @ arrays["dense_1_kernel"] + arrays["dense_1_bias"]
+    assert scores.shape == (4, 1)
+    np.testing.assert_allclose(scores, expected, atol=1e-5)
+
+def test_inference_batcher_joins_concurrent_calls():
+    batcher = InferenceBatcher(window_ms=200, max_requests=3)
+    model = MagicMock(side_effect=lambda inputs: MagicMock(numpy=lambda: inputs["user_id"].astype(float)[:, None]))
+    futures = [batcher.submit(model, {"user_id": np.array([user_id] * 2)}) for user_id in (1, 2, 3)]
+    results = [future.result(5) for future in futures]
+
+    assert model.call_count == 1
+    assert [result.flatten().tolist() for result in results] == [[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]]
+    assert metrics.histogram("ranking_batcher_batch_size", []).max >= 3
+    assert metrics.gauge("ranking_batcher_queue_depth").value == 0
+
+def test_inference_batcher_returns_model_errors():
+    batcher = InferenceBatcher(window_ms=1)
+    model = MagicMock(side_effect=RuntimeError("model failed"))
+
+    with pytest.raises(RuntimeError):
+        batcher.score(model, {"user_id": np.array([1])}, timeout=5)
+
+@pytest.mark.usefixtures("init_database")
+def test_get_top_ranked_movies_server_timing(mock_ranking_model, client, user_token):
+    mock_ranking_model.return_value = MagicMock(numpy=lambda: np.array([0.9]))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("test", mock_ranking_model)):
+        response = client.get("/ranking?user_id=1", headers=headers)
+
+    stages = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+    assert stages == ["cold_start", "catalog", "model_wait", "cache", "inputs", "inference", "top_k", "json"]
+    assert metrics.histogram("timing.ranking_bp.get_top_ranked_movies.inference_ms", []).count >= 1
+
+@pytest.mark.usefixtures("init_database")
+def test_get_top_ranked_movies_cold_start_user_served_by_segment(mock_ranking_model, app, client, admin_token):
+    with app.app_context():
+        segment_rankings.refresh()
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = client.get("/ranking?user_id=2", headers=headers)
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert data["served_by"] == "segment"
+    assert data["segment"] == "all"
+    assert data["top_ranked_movies"][0]["id"] == "tt0000001"
+    mock_ranking_model.assert_not_called()
+
+@pytest.mark.usefixtures("init_database")
+def test_get_top_ranked_movies_user_with_ratings_served_by_model(mock_ranking_model, app, client, user_token):
+    mock_ranking_model.return_value = MagicMock(numpy=lambda: np.array([0.9]))
+    with app.app_context():
+        segment_rankings.refresh()
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("test", mock_ranking_model)):
+        response = client.get("/ranking?user_id=1", headers=headers)
+
+    assert response.status_code == 200
+    assert json.loads(response.data)["served_by"] == "model"
+
+@pytest.mark.usefixtures("init_database")
+def test_segment_rankings_fall_back_to_wider_segments(app):
+    with app.app_context():
+        rankings = compute_segment_rankings(top_k=10, prior_weight=5)
+
+    assert segment_keys(1, 30, 1) == ["g1|a25-34|o1", "g1|a25-34", "a25-34", "all"]
+    assert set(rankings) == set(segment_keys(1, 30, 1))
+    movie_id, score, count = rankings["g1|a25-34|o1"][0]
+    assert (movie_id, count) == ("tt0000001", 1)
+    assert score == pytest.approx(4.5)
+
+def test_segment_refresh_runs_in_one_process_and_not_at_start_up(app, tmp_path):
+    lock_path = str(tmp_path / "segment-refresh.lock")
+    app.config["SEGMENT_REFRESH_SECONDS"] = 3600
+    app.config["SEGMENT_REFRESH_LOCK"] = lock_path
+    first = SegmentRankings()
+    first.refresh = MagicMock()
+    first.init_app(app)
+    time.sleep(0.05)
+    first.refresh.assert_not_called()
+
+    # Only one holder of the lock at a time, another worker takes over once the holder is gone
+    holder = first._try_lock(lock_path)
+    assert holder is not None
+    assert SegmentRankings()._try_lock(lock_path) is None
+    holder.close()
+    assert SegmentRankings()._try_lock(lock_path) is not None
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker("test_breaker", failure_threshold=2, slow_call_seconds=0.5, reset_seconds=0.05)
+    breaker.record_failure("error")
+    breaker.record_success(0.6)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert metrics.gauge("test_breaker_state").value == 2
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success(0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+@pytest.mark.usefixtures("init_database")
+def test_get_top_ranked_movies_falls_back_to_popularity(app, client, user_token):
+    app.config["RANKING_BREAKER_FAILURES"] = 2
+    ranking_breaker.init_app(app)
+    failing_model = MagicMock(side_effect=RuntimeError("model failed"))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("test", failing_model)):
+        responses = [json.loads(client.get("/ranking?user_id=1", headers=headers).data) for _ in range(3)]
+
+    assert [data["served_by"] for data in responses] == ["popularity"] * 3
+    assert [data["fallback_reason"] for data in responses] == ["model_error", "model_error", "circuit_open"]
+    assert responses[0]["top_ranked_movies"][0]["id"] == "tt0000001"
+    assert failing_model.call_count == 2
+    assert metrics.gauge("ranking_breaker_state").value == 2
+    assert metrics.ratio("ranking_fallback_rate").value > 0
+
+@pytest.mark.usefixtures("init_database")
+def test_get_top_ranked_movies_inference_timeout(app, client, user_token):
+    app.config["RANKING_INFERENCE_TIMEOUT"] = 0.05
+    release = threading.Event()
+    stalled_model = MagicMock(side_effect=lambda inputs: release.wait(5) and MagicMock(numpy=lambda: np.zeros((1, 1))))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    try:
+        with patch.object(ranking_models, "get_active", return_value=("test", stalled_model)):
+            started = time.perf_counter()
+            response = client.get("/ranking?user_id=1", headers=headers)
+            elapsed = time.perf_counter() - started
+    finally:
+        release.set()
+
+    assert response.status_code == 200
+    assert json.loads(response.data)["fallback_reason"] == "timeout"
+    assert elapsed < 1
+
+@pytest.mark.usefixtures("init_database")
+def test_popularity_ranking_follows_rating_changes(app):
+    with app.app_context():
+        db.session.add(Movie(id="tt0000002", movie_title="Second Movie", movie_genres="Drama",
+                             description="Another movie", image_url="movies/bloodborne1.jpg"))
+        bump_catalog_version()
+        db.session.commit()
+        snapshot = get_catalog_snapshot()
+        popularity = PopularityRanking(prior_weight=1)
+
+        assert [movie["id"] for movie in popularity.top(snapshot, 2)] == ["tt0000001", "tt0000002"]
+        for _ in range(3):
+            popularity.rating_added("tt0000002", 5.0)
+        popularity.rating_changed("tt0000001", 4.5, 1.0)
+        assert [movie["id"] for movie in popularity.top(snapshot, 2)] == ["tt0000002", "tt0000001"]
+
+@pytest.mark.usefixtures("init_database")
+def test_rank_subset_orders_requested_movies(app, client, user_token):
+    with app.app_context():
+        db.session.add(Movie(id="tt0000002", movie_title="Second Movie", movie_genres="Drama",
+                             description="Another movie", image_url="movies/bloodborne1.jpg"))
+        db.session.commit()
+    mock_model = MagicMock(side_effect=lambda inputs: MagicMock(
+        numpy=lambda: np.array([[0.2 if title == "Test Movie" else 0.8] for title in inputs["movie_title"]])
+    ))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    data = {"user_id": 1, "movie_ids": ["tt0000001", "tt0000002", "tt9999999", "tt0000001"]}
+    with patch.object(ranking_models, "get_active", return_value=("test", mock_model)):
+        response = client.post("/ranking/subset", json=data, headers=headers)
+    response_data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert [movie["id"] for movie in response_data["ranked_movies"]] == ["tt0000002", "tt0000001"]
+    assert response_data["missing"] == ["tt9999999"]
+    assert len(mock_model.call_args[0][0]["movie_title"]) == 2
+
+@pytest.mark.usefixtures("init_database")
+def test_rank_subset_requires_movie_ids(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.post("/ranking/subset", json={"user_id": 1, "movie_ids": []}, headers=headers)
+
+    assert response.status_code == 400
@@ -1,6 +1,6 @@
 import pytest
 import json
-from tests.config import app, client, init_database, user_token
+from tests.config import app, client, init_database, user_token, admin_token
 
 @pytest.mark.usefixtures("init_database")
 def test_add_rating_success(client, user_token):
@@ -49,4 +49,14 @@ def test_delete_rating_success(client, user_token):
     response_data = json.loads(response.data)
 
     assert response.status_code == 200
-    assert "message" in response_data
\ No newline at end of file
+    assert "message" in response_data
+
+@pytest.mark.usefixtures("init_database")
+def test_export_ratings_requires_admin(client, user_token, admin_token):
+    response = client.get("/ratings/export", headers={"Authorization": f"Bearer {user_token}"})
+    assert response.status_code == 403
+
+    response = client.get("/ratings/export?format=ndjson", headers={"Authorization": f"Bearer {admin_token}"})
+    ratings = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert response.status_code == 200
+    assert ratings == [{"id": 1, "user_id": 1, "movie_id": "tt0000001", "rating": 4.5, "created_at": ratings[0]["created_at"]}]
@@ -0,0 +1,78 @@
+import pytest
+import json
+import numpy as np
+from unittest.mock import patch, MagicMock
+from tests.config import app, client, init_database, user_token
+from extensions import db, ranking_models
+from models.movie import Movie
+from models.rating import Rating
+from models.watchlist import Watchlist
+
+@pytest.fixture
+def retrieval_movies(init_database):
+    db.session.add_all([
+        Movie(id="1", movie_title="Toy Story (1995)", movie_genres="Animation, Children, Comedy"),
+        Movie(id="2", movie_title="GoldenEye (1995)", movie_genres="Action, Adventure, Thriller"),
+        Movie(id="3", movie_title="Four Rooms (1995)", movie_genres="Thriller")
+    ])
+    db.session.commit()
+
+@pytest.mark.usefixtures("retrieval_movies")
+def test_get_recommendations_success(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.get("/recommendations?user_id=1&n=2", headers=headers)
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert len(data["recommendations"]) == 2
+    assert {movie["id"] for movie in data["recommendations"]} <= {"1", "2", "3"}
+    assert data["recommendations"][0]["score"] >= data["recommendations"][1]["score"]
+
+@pytest.mark.usefixtures("retrieval_movies")
+def test_get_recommendations_genre_filter(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.get("/recommendations?user_id=1&genre=Thriller", headers=headers)
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert sorted(movie["id"] for movie in data["recommendations"]) == ["2", "3"]
+
+@pytest.mark.usefixtures("retrieval_movies")
+def test_get_recommendations_ivf_matches_exact_when_probing_everything(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    exact = json.loads(client.get("/recommendations?user_id=5&n=3", headers=headers).data)
+    ivf = json.loads(client.get("/recommendations?user_id=5&n=3&mode=ivf&nprobe=100", headers=headers).data)
+
+    assert [movie["id"] for movie in ivf["recommendations"]] == [movie["id"] for movie in exact["recommendations"]]
+    assert [movie["score"] for movie in ivf["recommendations"]] == pytest.approx([movie["score"] for movie in exact["recommendations"]], abs=1e-5)
+
+@pytest.mark.usefixtures("retrieval_movies")
+def test_get_recommendations_unknown_genre(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    response = client.get("/recommendations?user_id=1&genre=Western", headers=headers)
+
+    assert response.status_code == 404
+
+def test_get_recommendations_missing_user_id(client):
+    response = client.get("/recommendations")
+
+    assert response.status_code == 400
+
+@pytest.mark.usefixtures("retrieval_movies")
+def test_pipeline_ranks_unseen_candidates(client, user_token):
+    db.session.add(Rating(user_id=1, movie_id="1", rating=5.0))
+    db.session.add(Watchlist(user_id=1, title="Later", movie_ids=["3"]))
+    db.session.commit()
+    mock_model = MagicMock(side_effect=lambda inputs: MagicMock(
+        numpy=lambda: np.arange(len(inputs["movie_title"]), dtype=float)))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=("test", mock_model)):
+        response = client.get("/recommendations/pipeline?user_id=1&k=5", headers=headers)
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert [movie["id"] for movie in data["recommendations"]] == ["2"]
+    assert list(mock_model.call_args[0][0]["movie_title"]) == ["GoldenEye (1995)"]
+    assert data["model_version"]["ranking"] == "test"
+    assert "retrieve;dur=" in response.headers["Server-Timing"]
+    assert "rank;dur=" in response.headers["Server-Timing"]
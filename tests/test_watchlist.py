@@ -1,6 +1,13 @@
 import pytest
 import json
-from tests.config import app, client, init_database, user_token
+import time
+import numpy as np
+from unittest.mock import patch, MagicMock
+from tests.config import app, client, init_database, user_token, admin_token
+from extensions import db, ranking_models, ranking_breaker
+from services.ranking_model import ModelManager
+from models.movie import Movie
+from models.watchlist_movie import WatchlistMovie
 
 @pytest.mark.usefixtures("init_database")
 def test_create_watchlist_success(client, user_token):
@@ -70,4 +77,78 @@ def test_get_public_watchlist_success(client):
 
     assert response.status_code == 200
     assert data["title"] == "Test Watchlist"
-    assert data["movies"][0]["id"] == "tt0000001"
\ No newline at end of file
+    assert data["movies"][0]["id"] == "tt0000001"
+
+@pytest.mark.usefixtures("init_database")
+def test_get_watchlist_item_personalized_order(client, user_token):
+    mock_model = MagicMock(side_effect=lambda inputs: MagicMock(numpy=lambda: np.array([[4.2]])))
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "is_ready", return_value=True), \
+         patch.object(ranking_models, "get_active", return_value=("test", mock_model)):
+        response = client.get("/watchlists/1?order=personalized", headers=headers)
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert data["order"] == "personalized"
+    assert data["movie_ids"] == ["tt0000001"]
+    assert data["movies"][0]["rating"] == pytest.approx(4.2)
+
+@pytest.mark.usefixtures("init_database")
+def test_get_watchlist_item_keeps_saved_order_without_model(client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    with patch.object(ranking_models, "get_active", return_value=(None, None)):
+        response = client.get("/watchlists/1?order=personalized", headers=headers)
+    data = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert data["order"] == "saved"
+    assert data["movie_ids"] == ["tt0000001"]
+
+@pytest.mark.usefixtures("init_database")
+def test_personalized_order_does_not_wait_for_a_loading_or_failing_model(app, client, user_token):
+    headers = {"Authorization": f"Bearer {user_token}"}
+    # A model that is still loading is not waited for
+    with patch.object(ranking_models, "state", ModelManager.LOADING), patch.object(ranking_models, "get_active") as get_active:
+        started = time.perf_counter()
+        data = json.loads(client.get("/watchlists/1?order=personalized", headers=headers).data)
+    assert data["order"] == "saved"
+    assert time.perf_counter() - started < 1
+    get_active.assert_not_called()
+
+    # Once the breaker opens the model is not called at all
+    app.config["RANKING_BREAKER_FAILURES"] = 1
+    ranking_breaker.init_app(app)
+    failing_model = MagicMock(side_effect=RuntimeError("model failed"))
+    with patch.object(ranking_models, "is_ready", return_value=True), \
+         patch.object(ranking_models, "get_active", return_value=("test", failing_model)):
+        assert json.loads(client.get("/watchlists/1?order=personalized", headers=headers).data)["order"] == "saved"
+        assert json.loads(client.get("/watchlists/1?order=personalized", headers=headers).data)["order"] == "saved"
+    assert failing_model.call_count == 1
+    ranking_breaker.init_app(app)
+
+@pytest.mark.usefixtures("init_database")
+def test_watchlist_movies_are_rows_kept_in_order(app, client, user_token, admin_token):
+    with app.app_context():
+        for i in (2, 3):
+            db.session.add(Movie(id=f"tt000000{i}", movie_title=f"Movie {i}", movie_genres="Drama", image_url="movies/bloodborne1.jpg"))
+        db.session.commit()
+    headers = {"Authorization": f"Bearer {user_token}"}
+
+    client.put("/watchlists/update/1", json={"movie_ids": ["tt0000003", "tt0000002"]}, headers=headers)
+    client.post("/watchlists/create", json={"title": "Second", "movie_id": "tt0000002"}, headers=headers)
+    assert json.loads(client.get("/watchlists/1", headers=headers).data)["movie_ids"] == ["tt0000001", "tt0000003", "tt0000002"]
+    assert json.loads(client.get("/watchlists/movie/tt0000002", headers=headers).data) == [
+        {"id": 1, "title": "Test Watchlist", "position": 2},
+        {"id": 2, "title": "Second", "position": 0}
+    ]
+
+    client.put("/watchlists/update/1", json={"remove_movie_id": "tt0000001"}, headers=headers)
+    assert json.loads(client.get("/watchlists/1", headers=headers).data)["movie_ids"] == ["tt0000003", "tt0000002"]
+
+    # Deleting a movie removes only its own rows, deleting a watchlist removes all of its rows
+    client.delete("/movies/delete/tt0000002", headers={"Authorization": f"Bearer {admin_token}"})
+    assert json.loads(client.get("/watchlists/1", headers=headers).data)["movie_ids"] == ["tt0000003"]
+    assert json.loads(client.get("/watchlists/2", headers=headers).data)["movie_ids"] == []
+    client.delete("/watchlists/delete/1", headers=headers)
+    with app.app_context():
+        assert WatchlistMovie.query.count() == 0